@@ -24,6 +24,8 @@ import plasma
 import plasma.lib.utils
 import plasma.lib.colors
 from plasma.lib.database import Database
+from plasma.lib.deccache import DecompileCache
+from plasma.lib.search import SearchEngine
 from plasma.lib.disassembler import Disassembler, NB_LINES_TO_DISASM
 from plasma.lib.utils import die, error, debug__
 from plasma.lib.generate_ast import generate_ast
@@ -71,12 +73,20 @@ class GlobalContext():
         self.show_mangling = True
         self.autoanalyzer = True
         self.debugsp = False
+        self.jobs = 1 # number of processes used by the analyzer
+        self.predecode = False # see lib.predecode
+        self.signatures = None # filename, see lib.signatures
+        self.batch_analyze = False
+        self.decompile_all = False
+        self.outdir = None # directory used by --decompile-all
 
         # Built objects
         self.dis = None # Disassembler
         self.libarch = None # module lib.arch.<BIN_ARCH>
         self.db = None # Database
         self.api = None # Api
+        self.dec_cache = None # DecompileCache
+        self.search = None # SearchEngine
 
 
     def parse_args(self):
@@ -119,6 +129,18 @@ class GlobalContext():
                 help='Disable analysis on the entry point / symbols and don\'t scan memmory. You can force it with the command push_analyze_symbols.')
         parser.add_argument('--debugsp', action='store_true',
                 help="Print the stack offset on each instructions. Warning: these values will not be saved in the database.")
+        parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                help='default 1, number of processes used by the analyzer. The result is the same as with one process.')
+        parser.add_argument('--predecode', action='store_true',
+                help='Disassemble all executable sections at startup (x86 only), it speeds up the search of functions in the memory scan of the analyzer.')
+        parser.add_argument('--signatures', metavar='FILENAME',
+                help='Load a file of function signatures (hex bytes, ?? for any byte), they are searched when the memory is scanned.')
+        parser.add_argument('--batch-analyze', action='store_true',
+                help='Run the full analysis without the interactive mode, save the database and print the time of each phase on stderr (json).')
+        parser.add_argument('--decompile-all', action='store_true',
+                help='Decompile all functions (in parallel with -j). A report with the time of each function is printed on stderr (json).')
+        parser.add_argument('--outdir', metavar='DIR',
+                help='With --decompile-all, write each function in DIR/ADDR_NAME.rev instead of stdout.')
 
         args = parser.parse_args()
 
@@ -140,6 +162,12 @@ class GlobalContext():
         self.list_sections   = args.sections
         self.autoanalyzer    = not args.noautoanalyzer
         self.debugsp         = args.debugsp
+        self.jobs            = max(args.jobs, 1)
+        self.predecode       = args.predecode
+        self.signatures      = args.signatures
+        self.batch_analyze   = args.batch_analyze
+        self.decompile_all   = args.decompile_all
+        self.outdir          = args.outdir
 
         if args.nbytes == 0:
             self.nbytes = 4
@@ -215,6 +243,11 @@ class GlobalContext():
 
         self.dis = dis
         self.libarch = dis.load_arch_module()
+        self.dec_cache = DecompileCache()
+        self.search = SearchEngine(self)
+
+        if self.predecode:
+            dis.predecode()
 
         return True
 
@@ -251,6 +284,9 @@ class AddrContext():
         self.is_dump = False
         self.gph = None
         self.ast = None
+        # If it's a file, the output is written while it's generated
+        # (see OutputAbs).
+        self.sink = None
 
 
     def init_address(self, entry, quiet=False):
@@ -302,9 +338,9 @@ class AddrContext():
         if self.entry is None:
             if not quiet:
                 error("symbol %s not found" % entry)
-            if self.gctx.interactive_mode:
+            if self.gctx.interactive_mode or quiet:
                 return False
-                die()
+            die()
 
         return True
 
@@ -316,31 +352,48 @@ class AddrContext():
         if self.gph is None:
             error("capstone can't disassemble here")
             return None
-        self.gph.simplify()
 
         if self.gctx.db.loaded and pe_nb_new_syms:
             self.gctx.db.modified = True
-        
-        try:
-            self.gph.loop_detection(self.entry)
-            ast, correctly_ended = generate_ast(self)
-            if not correctly_ended:
-                debug__("Second try...")
-                self.gph.loop_detection(self.entry, bypass_false_search=True)
-                ast, _ = generate_ast(self)
-                ast.nodes.insert(0, Ast_Comment(""))
-                ast.nodes.insert(0, Ast_Comment(""))
-                ast.nodes.insert(0,
-                    Ast_Comment("WARNING: maybe there is a bug, a second pass was necessary"))
-                ast.nodes.insert(0, Ast_Comment(""))
-                ast.nodes.insert(0, Ast_Comment(""))
-
-            self.ast = ast
-        except ExcIfelse as e:
-            error("can't have a ifelse here     %x" % e.addr)
-            if self.gctx.interactive_mode:
-                return None
-            die()
+
+        cache = self.gctx.dec_cache
+        key = cache.key(self.gctx, self.entry, self.gph)
+        state = cache.get(self.entry, key)
+
+        if state is not None:
+            self.gph, self.ast, fused, colors, self.color_counter = state
+            self.all_fused_inst = set(fused)
+            self.addr_color = dict(colors)
+            ast = self.ast
+
+        else:
+            addresses = set(self.gph.nodes)
+            self.gph.simplify()
+
+            try:
+                self.gph.loop_detection(self.entry)
+                ast, correctly_ended = generate_ast(self)
+                if not correctly_ended:
+                    debug__("Second try...")
+                    self.gph.loop_detection(self.entry, bypass_false_search=True)
+                    ast, _ = generate_ast(self)
+                    ast.nodes.insert(0, Ast_Comment(""))
+                    ast.nodes.insert(0, Ast_Comment(""))
+                    ast.nodes.insert(0,
+                        Ast_Comment("WARNING: maybe there is a bug, a second pass was necessary"))
+                    ast.nodes.insert(0, Ast_Comment(""))
+                    ast.nodes.insert(0, Ast_Comment(""))
+
+                self.ast = ast
+            except ExcIfelse as e:
+                error("can't have a ifelse here     %x" % e.addr)
+                if self.gctx.interactive_mode:
+                    return None
+                die()
+
+            cache.add(self.entry, key, addresses,
+                      (self.gph, ast, set(self.all_fused_inst),
+                       dict(self.addr_color), self.color_counter))
 
         o = self.gctx.libarch.output.Output(self)
         o._ast(self.entry, ast)
@@ -19,9 +19,13 @@
 
 import threading
 from queue import Queue
+from bisect import bisect_left
 
-from plasma.lib.utils import unsigned
+from plasma.lib.utils import unsigned, warning
 from plasma.lib.fileformat.binary import T_BIN_PE, T_BIN_ELF
+from plasma.lib.parallel import ParallelAnalysis
+from plasma.lib.predecode import INST_NULL
+from plasma.lib.signatures import FunctionMatcher, load_signatures
 from plasma.lib.consts import *
 
 ALL_SP = {}
@@ -36,6 +40,7 @@ class Analyzer(threading.Thread):
         self.running_second_pass = False
         self.where = 0 # cursor when parsing memory
         self.second_pass_done = False
+        self.parallel = None # see lib.parallel
 
 
     def set(self, gctx, arch_analyzer):
@@ -54,6 +59,9 @@ class Analyzer(threading.Thread):
         self.jmptables = self.db.jmptables
         self.functions = self.db.functions
         self.prologs = self.ARCH_UTILS.PROLOGS
+        # Prologs of MIPS and ARM are big endian words
+        self.reverse_prologs = not self.dis.is_x86 and \
+                               not self.dis.is_big_endian
         self.arch_analyzer = arch_analyzer
         self.arch_analyzer.set_wordsize(self.dis.wordsize)
 
@@ -64,6 +72,16 @@ class Analyzer(threading.Thread):
         elif self.dis.wordsize == 8:
             self.OFFSET_TYPE = MEM_QOFFSET
 
+        signatures = []
+        if gctx.signatures is not None:
+            try:
+                signatures = load_signatures(gctx.signatures)
+            except OSError as e:
+                warning("can't load signatures: %s" % e)
+
+        self.func_matcher = FunctionMatcher(self.prologs, signatures,
+                                            self.reverse_prologs)
+
 
     def __add_prefetch(self, regsctx, inst, func_obj, addr_set):
         if self.dis.is_mips:
@@ -90,6 +108,14 @@ class Analyzer(threading.Thread):
                     if queue_response is not None:
                         queue_response.put(1)
 
+                    self.db.autosave()
+
+            elif isinstance(item, list):
+                # List of tuples (ad, entry_is_func, force, add_if_code)
+                if self.dis is not None:
+                    self.analyze_batch(item)
+                    self.db.autosave()
+
             elif isinstance(item, str):
                 if item == "exit":
                     break
@@ -99,8 +125,9 @@ class Analyzer(threading.Thread):
                         self.second_pass_done = True
                         self.running_second_pass = True
                         self.pass_detect_unk_data()
-                        self.pass_detect_functions()
+                        self.scan_functions()
                         self.running_second_pass = False
+                        self.db.autosave()
                     else:
                         self.msg.put(item)
 
@@ -190,6 +217,12 @@ class Analyzer(threading.Thread):
             ad = s.start
             end = ad + s.real_size
 
+            # Addresses where something can be detected
+            pointers = b.find_pointers(s, self.dis.wordsize)
+            strings = b.find_strings(s)
+            i_ptr = 0
+            i_str = 0
+
             while ad < end:
                 self.where = ad
 
@@ -197,13 +230,15 @@ class Analyzer(threading.Thread):
                     ad += mem.get_size(ad)
                     continue
 
-                val = s.read_int(ad, self.dis.wordsize)
+                while i_ptr < len(pointers) and pointers[i_ptr] < ad:
+                    i_ptr += 1
 
                 # Detect if it's an address
-                if val is not None:
+                if i_ptr < len(pointers) and pointers[i_ptr] == ad:
+                    val = s.read_int(ad, self.dis.wordsize)
                     s2 = b.get_section(val)
                     if s2 is not None and s2.is_exec:
-                        self.api.add_xref(ad, val)
+                        self.api.add_xref(ad, val, XREF_OFFSET)
                         self.db.mem.add(ad, self.dis.wordsize, self.OFFSET_TYPE)
                         ad += self.dis.wordsize
 
@@ -222,8 +257,17 @@ class Analyzer(threading.Thread):
 
                         continue
 
-                # Detect if it's a string
-                n = b.is_string(ad, s=s)
+                # Detect if it's a string, see Binary.find_strings
+                while i_str < len(strings) and \
+                        ad >= strings[i_str][0] + strings[i_str][1]:
+                    i_str += 1
+
+                n = 0
+                if i_str < len(strings) and ad >= strings[i_str][0]:
+                    n = strings[i_str][0] + strings[i_str][1] - ad
+                    if n < STRING_MIN_BYTES:
+                        n = 0
+
                 if n != 0:
                     # is_overlapping is sufficient but exists is faster
                     # and should be check first.
@@ -234,19 +278,105 @@ class Analyzer(threading.Thread):
                     ad += n
                     continue
 
+                # Nothing found, go to the next pointer, string or item.
                 ad += 1
+                nxt = end
+
+                if i_ptr < len(pointers):
+                    nxt = min(nxt, pointers[i_ptr])
+
+                if i_str < len(strings):
+                    str_ad, str_n = strings[i_str]
+                    if ad >= str_ad:
+                        if str_ad + str_n - ad >= STRING_MIN_BYTES:
+                            nxt = ad
+                        elif i_str + 1 < len(strings):
+                            nxt = min(nxt, strings[i_str + 1][0])
+                    else:
+                        nxt = min(nxt, str_ad)
 
+                i = mem.index.ceil(ad)
+                if i != -1:
+                    nxt = min(nxt, i)
 
-    def pass_detect_functions(self):
-        b = self.dis.binary
+                ad = max(ad, nxt)
+
+
+    # Returns two lists of entries (ad, entry_is_func, force, add_if_code).
+    # The first one (imports and entry point) must be analyzed before
+    # rename_entry_point, the second one contains the static functions.
+    def symbol_entries(self):
+        entries = []
+
+        # Analyze all imports (it checks if functions return or not)
+        for ad in self.db.imports:
+            if ad in self.db.functions and self.db.functions[ad] is None:
+                entries.append((ad, True, True, False))
+
+        # Analyze entry point
+        ep = self.dis.binary.get_entry_point()
+        if ep is not None:
+            entries.append((ep, True, True, False))
+
+        static = []
+        for ad in self.db.reverse_symbols:
+            if ad not in self.db.imports and \
+                    ad in self.db.functions and self.db.functions[ad] is None:
+                static.append((ad, True, False, False))
+
+        return entries, static
+
+
+    # Second part of the memory scan (after pass_detect_unk_data)
+    def scan_functions(self):
+        if self.gctx.jobs > 1:
+            p = ParallelAnalysis(self, self.gctx.jobs)
+            p.run(p.split_ranges(self.exec_ranges()),
+                  self.pass_detect_functions)
+        else:
+            self.pass_detect_functions()
+
+
+    def exec_ranges(self):
+        return [(s.start, s.start + s.real_size)
+                for s in self.dis.binary.iter_sections()
+                if s.is_exec and not s.is_bss]
+
+
+    def analyze_batch(self, entries):
+        if self.gctx.jobs <= 1:
+            for e in entries:
+                self.analyze_flow(*e)
+            return
+
+        def serial_pass():
+            for e in entries:
+                self.analyze_entry(*e)
+
+        p = ParallelAnalysis(self, self.gctx.jobs)
+        p.run(p.split_entries(entries), serial_pass)
+
+
+    # Same as analyze_flow but the result may come from the parallel
+    # analysis.
+    def analyze_entry(self, entry, entry_is_func, force, add_if_code):
+        if self.parallel is None:
+            self.analyze_flow(entry, entry_is_func, force, add_if_code)
+        else:
+            self.parallel.analyze(entry, entry_is_func, force, add_if_code)
+
+
+    # ranges: list of [start, end[, by default all executable sections
+    def pass_detect_functions(self, ranges=None):
         mem = self.db.mem
 
-        for s in b.iter_sections():
-            if not s.is_exec or s.is_bss:
-                continue
+        if ranges is None:
+            ranges = self.exec_ranges()
 
-            ad = s.start
-            end = ad + s.real_size
+        for ad, end in ranges:
+            s = self.dis.binary.get_section(ad)
+            candidates, hits = self.func_matcher.find(s)
+            i = bisect_left(candidates, ad)
 
             while ad < end:
                 self.where = ad
@@ -255,18 +385,30 @@ class Analyzer(threading.Thread):
                     ad += mem.get_size(ad)
                     continue
 
-                # Do an analysis on this value.
-                # Don't run first_inst_are_code, it's too slow on big sections.
-                if self.has_prolog(ad):
-                    # Don't push, run directly the analyzer. Otherwise
-                    # we will re-analyze next instructions.
-                    self.analyze_flow(
-                            ad,
-                            entry_is_func=True,
-                            force=False,
-                            add_if_code=True)
-
+                while i < len(candidates) and candidates[i] < ad:
+                    i += 1
+
+                if i < len(candidates) and candidates[i] == ad:
+                    # Do an analysis on this value.
+                    # Don't run first_inst_are_code, it's too slow on big sections.
+                    if ad in hits or self.has_prolog(ad):
+                        # Don't push, run directly the analyzer. Otherwise
+                        # we will re-analyze next instructions.
+                        self.analyze_entry(
+                                ad,
+                                entry_is_func=True,
+                                force=False,
+                                add_if_code=True)
+
+                # Go to the next candidate or item
                 ad += 1
+                nxt = end
+                if i < len(candidates):
+                    nxt = min(nxt, candidates[i])
+                head = mem.index.ceil(ad)
+                if head != -1:
+                    nxt = min(nxt, head)
+                ad = max(ad, nxt)
 
 
     def add_stack_variable(self, func_obj, inst, offset, op_size):
@@ -296,7 +438,16 @@ class Analyzer(threading.Thread):
         if s is None or s.start == 0:
             return False
 
-        self.api.add_xref(i.address, imm)
+        if from_save_imm or op.type != self.ARCH_UTILS.OP_MEM:
+            kind = XREF_OFFSET
+        elif self.ARCH_UTILS.is_mem_write(i, op):
+            kind = XREF_WRITE
+        elif is_deref_pointer:
+            kind = XREF_READ
+        else:
+            kind = XREF_OFFSET # lea
+
+        self.api.add_xref(i.address, imm, kind)
         ad = imm
 
         # is_overlapping is sufficient but exists is faster
@@ -347,6 +498,13 @@ class Analyzer(threading.Thread):
     # Each instruction must be different of null bytes.
     def first_inst_are_code(self, ad):
         for i in range(5):
+            info = self.dis.get_inst_info(ad)
+            if info is not None:
+                if info[1] & INST_NULL:
+                    return False
+                ad += info[0]
+                continue
+
             inst = self.disasm(ad)
             if inst is None:
                 return False
@@ -364,7 +522,7 @@ class Analyzer(threading.Thread):
         if buf is None:
             return False
 
-        if not self.dis.is_big_endian:
+        if self.reverse_prologs:
             buf = bytes(reversed(buf))
 
         for lst in self.prologs:
@@ -376,19 +534,24 @@ class Analyzer(threading.Thread):
         if not match:
             return False
 
-        inst = self.disasm(ad)
-        if inst is None:
-            return False
+        info = self.dis.get_inst_info(ad)
+        if info is not None:
+            size = info[0]
+        else:
+            inst = self.disasm(ad)
+            if inst is None:
+                return False
+            size = inst.size
 
         # Don't disassemble the second instruction, just get a copy of bytes.
-        buf = self.dis.binary.read(ad + inst.size, 4)
+        buf = self.dis.binary.read(ad + size, 4)
 
-        if not self.dis.is_big_endian:
+        if self.reverse_prologs:
             buf = bytes(reversed(buf))
 
         for lst in self.prologs:
             for p in lst:
-                if buf.startswith(p[inst.size:]):
+                if buf.startswith(p[size:]):
                     return True
 
         return False
@@ -405,6 +568,7 @@ class Analyzer(threading.Thread):
 
             if e in self.db.end_functions:
                 self.db.end_functions[e].append(entry)
+                self.db.end_functions.touch(e)
             else:
                 self.db.end_functions[e] = [entry]
         else:
@@ -438,29 +602,34 @@ class Analyzer(threading.Thread):
             return False
 
         s_orig = self.dis.binary.get_section(table_ad)
+        if s_orig is None:
+            return False
+
+        ws = self.dis.wordsize
+        is_address = self.dis.binary.is_address
+        xrefs = self.db.xrefs
         nb_entries = 0
         ad = table_ad
 
-        while 1:
-            val = s_orig.read_int(ad, self.dis.wordsize)
-            if val is None:
-                return False
+        # Read all words until the end of the section at once, the table
+        # stops at the first word which is not an address.
+        values = s_orig.read_array(table_ad,
+                (s_orig.real_end + 1 - table_ad) // ws, ws)
 
-            if not self.dis.binary.is_address(val):
+        for val in values:
+            if not is_address(val):
                 break
 
             nb_entries += 1
-            ad += self.dis.wordsize
+            ad += ws
 
             # TODO : here the program is not completely analyzed, so new xrefs
             # can appears later.
-            if ad in self.db.xrefs:
-                break
-
-            s = self.dis.binary.get_section(ad)
-
-            if s is None or s.start != s_orig.start:
+            if ad in xrefs or ad > s_orig.end:
                 break
+        else:
+            # The end of the section is reached
+            return False
 
         if nb_entries:
             return self.api.create_jmptable(
@@ -524,8 +693,10 @@ class Analyzer(threading.Thread):
             # set to None initially.
             if is_def and self.functions[entry] is not None:
                 func_obj = self.functions[entry]
+                self.functions.touch(entry)
                 last_end = func_obj[FUNC_END]
                 self.db.end_functions[last_end].remove(entry)
+                self.db.end_functions.touch(last_end)
                 if not self.db.end_functions[last_end]:
                     del self.db.end_functions[last_end]
                 func_obj[FUNC_VARS].clear()
@@ -676,7 +847,7 @@ class Analyzer(threading.Thread):
                             ret_found = True
                         continue
 
-                self.api.add_xref(ad, jmp_ad)
+                self.api.add_xref(ad, jmp_ad, XREF_JUMP)
                 if self.db.mem.is_func(jmp_ad):
                     ret_found |= not self.is_func_noreturn(jmp_ad, entry)
                     fo = self.functions[jmp_ad]
@@ -700,7 +871,7 @@ class Analyzer(threading.Thread):
                         direct_nxt = prefetch.address + prefetch.size
 
                     nxt_jmp = unsigned(unsigned(op.value.imm))
-                    self.api.add_xref(ad, nxt_jmp)
+                    self.api.add_xref(ad, nxt_jmp, XREF_JUMP)
 
                     if self.db.mem.is_func(direct_nxt):
                         ret_found |= not self.is_func_noreturn(direct_nxt, entry)
@@ -747,7 +918,7 @@ class Analyzer(threading.Thread):
                         continue
 
                 if call_ad is not None:
-                    self.api.add_xref(ad, call_ad)
+                    self.api.add_xref(ad, call_ad, XREF_CALL)
 
                     if add_if_code:
                         added_xrefs.append((ad, call_ad))
@@ -21,6 +21,7 @@ from queue import Queue
 
 from plasma.lib.fileformat.binary import SectionAbs
 from plasma.lib.consts import *
+from plasma.lib.labels import LabelsTable
 
 
 class Jmptable():
@@ -42,6 +43,7 @@ class Api():
         self.__queue_wait = Queue()
         self.arch = gctx.dis.binary.arch
         self.is_big_endian = gctx.dis.binary.is_big_endian()
+        self.labels = LabelsTable(gctx)
 
 
     def entry_point(self):
@@ -95,6 +97,7 @@ class Api():
         ad = self.mem.get_head_addr(ad)
 
         self.__undefine(ad, force=True)
+        self.__gctx.dec_cache.invalidate(ad)
         entry = ad
 
         # Clear all instructions
@@ -133,6 +136,7 @@ class Api():
         """
         if self.mem.is_overlapping(ad):
             return False
+        self.__gctx.dec_cache.invalidate(ad)
         self.__analyzer.msg.put((ad, False, False, False, self.__queue_wait))
         self.__queue_wait.get()
         return True
@@ -147,6 +151,7 @@ class Api():
         if self.mem.is_func(ad) or self.mem.get_func_id(ad) != -1 or \
                 self.mem.is_overlapping(ad):
             return False
+        self.__gctx.dec_cache.invalidate(ad)
         self.__analyzer.msg.put((ad, True, True, False, self.__queue_wait))
         self.__queue_wait.get()
         return True
@@ -255,7 +260,7 @@ class Api():
         if not self.mem.exists(head):
             self.mem.add(off, 1, MEM_UNK)
 
-        self.add_xref(ad, off)
+        self.add_xref(ad, off, XREF_OFFSET)
 
         if not self.__undefine(ad):
             return False
@@ -327,6 +332,16 @@ class Api():
         return True
 
 
+    def find_strings(self, section, min_bytes=2):
+        """
+        Returns all ascii strings of the section in a list of tuples
+        (address, size). The size includes the null byte. The section
+        is scanned only once, it's faster than calling is_string on
+        each address.
+        """
+        return self.__binary.find_strings(section, min_bytes)
+
+
     def get_string(self, ad, section=None):
         """
         Returns the string at ad (str type). If the buffer is not
@@ -435,36 +450,56 @@ class Api():
         if section is None:
             section = self.__binary.get_section(ad)
 
-        array = []
-        l = 0
-
-        while l < nb_entries:
-            val = section.read_int(ad, size_word)
-            if val is None:
-                return array
-            array.append(val)
-            ad += size_word
-            l += 1
-        return array
+        return section.read_array(ad, nb_entries, size_word).tolist()
 
 
     def xrefsto(self, ad):
         """
-        Returns a list of all xrefs to ad.
+        Returns a set of all addresses with an xref to ad. If ad is an
+        array or a string, it contains also xrefs inside the data and
+        each address is replaced by the start of its item.
         """
-        lst = []
         if ad in self.__db.data_sub_xrefs:
-            for x in self.__db.data_sub_xrefs[ad]:
-                lst += self.__db.xrefs[x]
-            for i, x in enumerate(lst):
-                ad = self.__db.mem.get_head_addr(x)
-                if ad != x:
-                    lst[i] = ad
-            return set(lst)
+            return {self.mem.get_head_addr(x)
+                    for x, to_ad, kind in self.__db.xref_store.sources(ad)}
 
         if ad in self.__db.xrefs:
-            lst = set(self.__db.xrefs[ad])
-        return lst
+            return set(self.__db.xrefs[ad])
+        return set()
+
+
+    def xrefsto_kind(self, ad):
+        """
+        Returns a list of tuples (from, to, kind) of all xrefs to ad (and
+        inside the data if ad is an array or a string). kind is one of
+        XREF_* (XREF_NAMES[kind] is a readable name).
+        """
+        return self.__db.xref_store.sources(ad)
+
+
+    def xrefsfrom(self, ad):
+        """
+        Returns a list of tuples (to, kind) of all xrefs from ad.
+        """
+        return self.__db.xref_store.targets(ad)
+
+
+    def xrefs_from_range(self, start, end):
+        """
+        Returns a list of tuples (from, to, kind) of all xrefs from an
+        address in [start, end[, sorted by from. For example all xrefs
+        of a function : xrefs_from_range(func_ad, get_func_end(func_ad) + 1).
+        """
+        return self.__db.xref_store.range_from(start, end)
+
+
+    def xrefs_to_range(self, start, end):
+        """
+        Returns a list of tuples (from, to, kind) of all xrefs to an
+        address in [start, end[, sorted by to. For example all xrefs
+        into a section : xrefs_to_range(s.start, s.end + 1).
+        """
+        return self.__db.xref_store.range_to(start, end)
 
 
     def add_symbol(self, ad, name, force=False):
@@ -512,6 +547,9 @@ class Api():
         if name in self.__db.symbols:
             del self.__db.symbols[name]
 
+        # Labels of loops and breaks are created by the decompilation
+        self.__gctx.dec_cache.invalidate(ad)
+
 
     def create_jmptable(self, inst_addr, table_addr, nb_entries, entry_size, dont_analyze=False):
         """
@@ -541,6 +579,7 @@ class Api():
         name = "jmptable_%x" % table_addr
         self.add_symbol(table_addr, name, force=True)
         self.__db.jmptables[inst_addr] = Jmptable(inst_addr, table_addr, table, name)
+        self.__gctx.dec_cache.invalidate(inst_addr)
         self.__db.internal_inline_comments[inst_addr] = \
             "switch statement %s[%d]" % (name, nb_entries)
 
@@ -576,49 +615,27 @@ class Api():
         return True
 
 
-    def add_xref(self, from_ad, to_ad):
-        if to_ad in self.__db.xrefs:
-            if from_ad not in self.__db.xrefs[to_ad]:
-                self.__db.xrefs[to_ad].append(from_ad)
-        else:
-            self.__db.xrefs[to_ad] = [from_ad]
-
-        head = self.mem.get_head_addr(to_ad)
-        if head in self.__db.data_sub_xrefs:
-            self.__db.data_sub_xrefs[head][to_ad] = True
-            if head != to_ad:
-                end = head + self.mem.get_size(head)
-                self.mem.mm[to_ad] = [end - to_ad, MEM_HEAD, head]
+    def add_xref(self, from_ad, to_ad, kind=XREF_UNK):
+        self.__db.xref_store.add(from_ad, to_ad, kind)
 
 
     def add_xrefs_table(self, from_ad, to_ad_list):
         for x in to_ad_list:
-            self.add_xref(from_ad, x)
+            self.__db.xref_store.add(from_ad, x, XREF_JMPTABLE)
 
 
     def rm_xref(self, from_ad, to_ad):
-        if to_ad in self.__db.xrefs:
-            if from_ad in self.__db.xrefs[to_ad]:
-                self.__db.xrefs[to_ad].remove(from_ad)
-            if not self.__db.xrefs[to_ad]:
-                del self.__db.xrefs[to_ad]
-
-        head = self.mem.get_head_addr(to_ad)
-        if head in self.__db.data_sub_xrefs:
-            del self.__db.data_sub_xrefs[head][to_ad]
+        self.__db.xref_store.remove(from_ad, to_ad)
 
 
     def rm_xrefs_table(self, from_ad, to_ad_list):
         for x in to_ad_list:
-            self.rm_xref(from_ad, x)
+            self.__db.xref_store.remove(from_ad, x)
 
 
+    # Remove all xrefs to [start, start + size[
     def rm_xrefs_range(self, start, size):
-        end = start + size
-        while start < end:
-            if start in self.xrefs:
-                del self.xrefs[start]
-            start += 1
+        self.__db.xref_store.remove_range_to(start, start + size)
 
 
     def is_reserved_prefix(self, name):
@@ -646,40 +663,7 @@ class Api():
         defined as UNK, FUNC, CODE, *WORD, ... and if it's not a defined
         symbol. If the mangling is activated it returns the demangled string.
         """
-        if ad in self.__db.reverse_symbols:
-            if self.__gctx.show_mangling:
-                s = self.__db.reverse_demangled.get(ad, None)
-                if s is not None:
-                    return s
-            return self.__db.reverse_symbols[ad]
-
-        ty = self.mem.get_type(ad)
-
-        if ty == MEM_ARRAY:
-            ty = self.mem.mm[ad][2]
-
-        if ty == MEM_FUNC:
-            return "sub_%x" % ad
-        if ty == MEM_CODE:
-            if ad in self.__db.xrefs:
-                return "loc_%x" % ad
-            return None
-        if ty == MEM_DWORD:
-            return "dword_%x" % ad
-        if ty == MEM_BYTE:
-            return "byte_%x" % ad
-        if ty == MEM_QWORD:
-            return "qword_%x" % ad
-        if ty == MEM_UNK:
-            return "unk_%x" % ad
-        if ty == MEM_WORD:
-            return "word_%x" % ad
-        if ty == MEM_ASCII:
-            return "asc_%x" % ad
-        if MEM_WOFFSET <= ty <= MEM_QOFFSET:
-            return "off_%x" % ad
-
-        return None
+        return self.labels.symbol(ad)
 
 
     def disasm(self, ad):
@@ -726,6 +710,8 @@ class Api():
         if frame_size < 0 or func_ad not in self.__db.functions:
             return False
         self.__db.functions[func_ad][FUNC_FRAME_SIZE] = frame_size
+        self.__db.functions.touch(func_ad)
+        self.__gctx.dec_cache.invalidate(func_ad)
         self.__analyzer.msg.put((func_ad, True, True, False, self.__queue_wait))
         self.__queue_wait.get()
         return True
@@ -742,6 +728,8 @@ class Api():
             self.__db.functions[func_ad][FUNC_FLAGS] |= FUNC_FLAG_NORETURN
         else:
             self.__db.functions[func_ad][FUNC_FLAGS] &= ~FUNC_FLAG_NORETURN
+        self.__db.functions.touch(func_ad)
+        self.__gctx.dec_cache.invalidate(func_ad)
 
 
     def var_rename(self, func_ad, off, name):
@@ -773,6 +761,7 @@ class Api():
                 break
 
         func_obj[FUNC_VARS][off][VAR_NAME] = n
+        self.__db.functions.touch(func_ad)
 
 
     def iter_symbols(self):
@@ -788,4 +777,5 @@ class Api():
             del self.__db.inverted_cond[ad]
         else:
             self.__db.inverted_cond[ad] = 1
+        self.__gctx.dec_cache.invalidate(ad)
         return True
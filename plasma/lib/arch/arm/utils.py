@@ -74,6 +74,10 @@ def is_ret(i):
 def is_call(i):
     return i.group(CS_GRP_CALL) or i.id in JUMPS_LINK
 
+# op is a memory operand of i (str, strb, stm...)
+def is_mem_write(i, op):
+    return i.mnemonic.startswith("st")
+
 
 OPPOSITES = [
         [ARM_CC_EQ, ARM_CC_NE],
@@ -100,6 +100,11 @@ def is_call(i):
     return i.id in JUMPS_LINK
 
 
+# op is a memory operand of i (sb, sh, sw, sd, swc1...)
+def is_mem_write(i, op):
+    return i.mnemonic.startswith("s")
+
+
 OPPOSITES = [
     [MIPS_INS_BEQ, MIPS_INS_BNE],
     [MIPS_INS_BNEZ, MIPS_INS_BEQZ],
@@ -17,6 +17,7 @@
 # along with this program.    If not, see <http://www.gnu.org/licenses/>.
 #
 
+import capstone.x86
 from capstone import CS_GRP_CALL, CS_GRP_JUMP, CS_GRP_RET
 from capstone.x86 import (X86_INS_ADD, X86_INS_AND, X86_INS_CMP, X86_INS_DEC,
         X86_INS_IMUL, X86_INS_INC, X86_INS_JA, X86_INS_JAE, X86_INS_JE,
@@ -29,7 +30,7 @@ from capstone.x86 import (X86_INS_ADD, X86_INS_AND, X86_INS_CMP, X86_INS_DEC,
         X86_REG_RSP, X86_REG_ESP, X86_REG_SP, X86_INS_PUSH, X86_INS_LEAVE,
         X86_INS_POPAW, X86_INS_POPAL, X86_INS_POPF, X86_INS_POPFD, X86_INS_POPFQ,
         X86_INS_PUSHAW, X86_INS_PUSHAL, X86_INS_PUSHF, X86_INS_PUSHFD,
-        X86_INS_PUSHFQ, X86_INS_PUSH, X86_INS_POP)
+        X86_INS_PUSHFQ, X86_INS_PUSH, X86_INS_POP, X86_INS_TEST, X86_INS_CALL)
 
 
 OP_IMM = X86_OP_IMM
@@ -43,6 +44,25 @@ PROLOGS = [
     [b"\x55\x48\x89\xe5"], # push rbp; mov rbp, rsp
 ]
 
+# A memory operand is written if it's the destination, except for these
+# instructions which only read their first operand. Capstone 3 doesn't
+# give the access of operands (and in capstone 4.0.2 it's wrong for test
+# and fstp).
+MEM_READ_FIRST_OP = {getattr(capstone.x86, "X86_INS_" + name) for name in (
+    "CMP", "TEST", "BT", "BOUND",
+    "PUSH", "CALL", "JMP", "LCALL", "LJMP",
+    "MUL", "IMUL", "DIV", "IDIV",
+    "FLD", "FILD", "FBLD", "FLDCW", "FLDENV", "FRSTOR",
+    "FXRSTOR", "FXRSTOR64", "XRSTOR", "XRSTOR64",
+    "FCOM", "FCOMP", "FICOM", "FICOMP",
+    "FADD", "FIADD", "FSUB", "FISUB", "FSUBR", "FISUBR",
+    "FMUL", "FIMUL", "FDIV", "FIDIV", "FDIVR", "FIDIVR",
+    "LDMXCSR", "VLDMXCSR",
+    "PREFETCH", "PREFETCHW", "PREFETCHT0", "PREFETCHT1", "PREFETCHT2",
+    "PREFETCHNTA", "CLFLUSH", "NOP",
+    "LGDT", "LIDT", "LLDT", "LMSW", "LTR", "VERR", "VERW", "INVLPG",
+)}
+
 PUSHPOP = {
     X86_INS_POPAW, X86_INS_POPAL, X86_INS_POPF, X86_INS_POPFD, X86_INS_POPFQ,
     X86_INS_PUSHAW, X86_INS_PUSHAL, X86_INS_PUSHF, X86_INS_PUSHFD, X86_INS_PUSHFQ,
@@ -72,6 +92,10 @@ def is_call(i):
 def is_pushpop(i):
     return i.id in PUSHPOP
 
+# op is a memory operand of i. The destination is the first operand.
+def is_mem_write(i, op):
+    return op is i.operands[0] and i.id not in MEM_READ_FIRST_OP
+
 
 OPPOSITES = [
         [X86_INS_JE, X86_INS_JNE],
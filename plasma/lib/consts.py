@@ -35,12 +35,10 @@ MEM_ASCII = 11
 MEM_ARRAY = 12
 MEM_STRUCT = 13
 
-# For big strings or data we put a MEM_HEAD every BLOCK_SIZE bytes and at
-# the end of the data. It allows to scroll up correctly in the visual mode.
-# BLOCK_SIZE should not be too big otherwise performance will decrease.
+# Old databases contained a MEM_HEAD every 64 bytes inside big strings or
+# data. It's not used anymore, these entries are removed when the database
+# is loaded (see lib.memory).
 MEM_HEAD = 50
-BLOCK_SIZE = 64 # should be a power of 2
-BLOCK_SIZE_MASK = 64-1
 
 
 # Index of values for each Database.functions[i]
@@ -63,6 +61,18 @@ FUNC_FLAG_STDCALL = 0b10
 FUNC_FLAG_ERR_STACK_ANALYSIS = 0b100
 
 
+# Kind of an xref, see lib.xrefs
+XREF_UNK = 0
+XREF_CALL = 1
+XREF_JUMP = 2
+XREF_JMPTABLE = 3
+XREF_READ = 4
+XREF_WRITE = 5
+XREF_OFFSET = 6
+
+XREF_NAMES = ["", "call", "jump", "table", "read", "write", "offset"]
+
+
 # Known functions which never returns
 NORETURN_ELF = {
     "exit", "_exit", "__stack_chk_fail", "err", "verr", "errx", "verrx",
@@ -84,9 +94,25 @@ NORETURN_PE = {
 # on multi-lines is counted for 1.
 NB_LINES_TO_DISASM = 150
 
+# In the dump mode, the visual keeps only a window of lines around the
+# cursor, the other lines are dropped when it scrolls.
+NB_LINES_VISUAL = 2000
+
+# Minimum size of an ascii string with the null byte, see Binary.is_string
+STRING_MIN_BYTES = 3
+
 # Save disassembled instructions in a cache
 CAPSTONE_CACHE_SIZE = 60000
 
+# Number of decompiled functions kept in memory, see lib.deccache
+DECOMPILE_CACHE_SIZE = 64
+
+# Number of addresses kept by lib.labels
+LABELS_TABLE_SIZE = 100000
+
+# Maximum number of hits of a search in the visual, see lib.search
+SEARCH_MAX_HITS = 100000
+
 
 RESERVED_PREFIX = ["loc_", "sub_", "unk_", "byte_", "word_",
                    "dword_", "qword_", "asc_", "off_", "ret_", "loop_",
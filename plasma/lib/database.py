@@ -21,6 +21,11 @@ import os
 import gc
 import sys
 import zlib
+import mmap
+import time
+import struct
+from array import array
+from itertools import groupby
 
 try:
     import msgpack
@@ -32,11 +37,177 @@ except:
 from plasma.lib.api import Jmptable
 from plasma.lib.utils import info, warning, die
 from plasma.lib.memory import Memory
+from plasma.lib.xrefs import XrefStore
+from plasma.lib.journal import (Journal, TrackedDict, make_record,
+        is_empty_record, apply_record)
+from plasma.lib.consts import *
 
 
-VERSION = 2.9
+VERSION = 3.1
 LAST_COMPATIBLE = 2.7
 
+# Since the version 3.0 the database is not a zlib+msgpack blob anymore.
+# The file starts with DB_MAGIC, then each table is saved in its own
+# section and the file ends with a table of contents (msgpack) followed by
+# its offset (8 bytes, little endian). Big tables are saved as columns of
+# fixed-width integers (see DBWriter.columns), other values are msgpack
+# blobs.
+DB_MAGIC = b"PLASMADB"
+
+ADDR_MAX = 0xffffffffffffffff
+
+# The journal is compacted into the database when it's bigger than
+# this size or than the half of the database.
+JOURNAL_MAX_SIZE = 4 * 1024 * 1024
+
+# Minimum delay in seconds between two background writes of the journal
+JOURNAL_AUTOSAVE_DELAY = 5
+
+# Tables saved in the journal. The table mem is self.mem.mm.
+JOURNAL_TABLES = [
+    "symbols", "demangled", "user_inline_comments",
+    "internal_inline_comments", "user_previous_comments",
+    "internal_previous_comments", "jmptables", "functions", "func_id",
+    "xrefs", "xrefs_from", "data_sub_xrefs", "imports", "immediates",
+    "inverted_cond", "mem",
+]
+
+
+class DBWriter():
+    def __init__(self, fd):
+        self.fd = fd
+        self.toc = {}
+        fd.write(DB_MAGIC)
+
+
+    def __align(self):
+        pad = -self.fd.tell() % 8
+        if pad:
+            self.fd.write(b"\0" * pad)
+
+
+    # cols is a list of (typecode, iterable), see the module array.
+    def columns(self, name, cols):
+        desc = []
+        for ty, values in cols:
+            arr = array(ty, values)
+            self.__align()
+            desc.append((ty, self.fd.tell(), len(arr)))
+            arr.tofile(self.fd)
+        self.toc[name] = desc
+
+
+    def blob(self, name, obj):
+        buf = msgpack.packb(obj, use_bin_type=True)
+        self.__align()
+        self.toc[name] = (self.fd.tell(), len(buf))
+        self.fd.write(buf)
+
+
+    def close(self):
+        off = self.fd.tell()
+        self.fd.write(msgpack.packb({
+                "version": VERSION,
+                "byteorder": sys.byteorder,
+                "toc": self.toc,
+            }, use_bin_type=True))
+        self.fd.write(struct.pack("<Q", off))
+
+
+# Sections are not read in memory, the file is mapped and each column is
+# a memoryview on the mapping. Columns must not be used after close.
+class DBReader():
+    def __init__(self, fd):
+        self.mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.views = [memoryview(self.mm)]
+        off = struct.unpack_from("<Q", self.mm, len(self.mm) - 8)[0]
+        hdr = msgpack.unpackb(self.__slice(off, len(self.mm) - 8),
+                              encoding="utf-8")
+        self.version = hdr["version"]
+        self.swap = hdr["byteorder"] != sys.byteorder
+        self.toc = hdr["toc"]
+
+
+    def __slice(self, start, end):
+        v = self.views[0][start:end]
+        self.views.append(v)
+        return v
+
+
+    def columns(self, name):
+        if name not in self.toc:
+            return None
+        cols = []
+        for ty, off, n in self.toc[name]:
+            v = self.__slice(off, off + n * struct.calcsize(ty))
+            if self.swap:
+                arr = array(ty)
+                arr.frombytes(v)
+                arr.byteswap()
+                cols.append(arr)
+            else:
+                v = v.cast(ty)
+                self.views.append(v)
+                cols.append(v)
+        return cols
+
+
+    def blob(self, name, default=None):
+        if name not in self.toc:
+            return default
+        off, size = self.toc[name]
+        return msgpack.unpackb(self.__slice(off, off + size), encoding="utf-8")
+
+
+    def close(self):
+        for v in reversed(self.views):
+            v.release()
+        self.views.clear()
+        self.mm.close()
+
+
+# A table saved as columns, rows(), called at each iteration, returns an
+# iterator on the pairs (key, value) decoded from the mapping. Nothing is
+# decoded before the table is iterated. The changes replayed from the
+# journal are kept aside and merged during the iteration, so only the
+# methods used by apply_record are implemented.
+class SectionTable():
+    def __init__(self, rows):
+        self.rows = rows
+        self.changes = {}
+        self.deleted = set()
+        self.cleared = False
+
+
+    def items(self):
+        if self.cleared:
+            return iter(self.changes.items())
+        if not self.changes and not self.deleted:
+            return self.rows()
+        return self.__merged()
+
+
+    def __merged(self):
+        for k, v in self.rows():
+            if k not in self.changes and k not in self.deleted:
+                yield k, v
+        yield from self.changes.items()
+
+
+    def pop(self, k, default=None):
+        self.deleted.add(k)
+        return self.changes.pop(k, default)
+
+
+    def update(self, values):
+        self.changes.update(values)
+
+
+    def clear(self):
+        self.changes.clear()
+        self.deleted.clear()
+        self.cleared = True
+
 
 class Database():
     def __init__(self):
@@ -48,13 +219,13 @@ class Database():
 
     def __init_vars(self):
         self.history = []
-        self.symbols = {} # name -> addr
-        self.demangled = {} # name -> addr
-        self.user_inline_comments = {}
-        self.internal_inline_comments = {}
-        self.user_previous_comments = {}
-        self.internal_previous_comments = {}
-        self.jmptables = {}
+        self.symbols = TrackedDict() # name -> addr
+        self.demangled = TrackedDict() # name -> addr
+        self.user_inline_comments = TrackedDict()
+        self.internal_inline_comments = TrackedDict()
+        self.user_previous_comments = TrackedDict()
+        self.internal_previous_comments = TrackedDict()
+        self.jmptables = TrackedDict()
         self.mips_gp = 0
         self.modified = False
         self.loaded = False
@@ -68,14 +239,17 @@ class Database():
         #    frame_size,
         #    args_restore,
         #  ]
-        self.functions = {}
-        self.func_id = {} # id -> func address
-        self.xrefs = {} # addr -> list addr
+        self.functions = TrackedDict()
+        self.func_id = TrackedDict() # id -> func address
+        # See lib.xrefs
+        self.xrefs = TrackedDict() # addr -> list addr
+        self.xrefs_from = TrackedDict() # addr -> [addr, kind, addr, kind, ...]
+        self.xref_store = XrefStore(self)
         # For big data (arrays/strings) we save all addresses with an xrefs
-        self.data_sub_xrefs = {} # data_address -> {addresses_with_xrefs: True}
-        self.imports = {} # ad -> flags
-        self.immediates = {} # insn_ad -> immediate result
-        self.inverted_cond = {} # addr -> arbitrary_value
+        self.data_sub_xrefs = TrackedDict() # data_address -> {addresses_with_xrefs: True}
+        self.imports = TrackedDict() # ad -> flags
+        self.immediates = TrackedDict() # insn_ad -> immediate result
+        self.inverted_cond = TrackedDict() # addr -> arbitrary_value
 
         self.raw_base = 0
         self.raw_type = None
@@ -83,11 +257,17 @@ class Database():
 
         # Computed variables
         self.func_id_counter = 0
-        self.end_functions = {}
-        self.reverse_symbols = {} # addr -> name
-        self.reverse_demangled = {} # addr -> name
+        self.end_functions = TrackedDict()
+        self.reverse_symbols = TrackedDict() # addr -> name
+        self.reverse_demangled = TrackedDict() # addr -> name
         self.version = VERSION
 
+        # See lib.journal
+        self.journal = None
+        self.base_id = 0
+        self.journal_autosave = False # enabled by the console
+        self.last_autosave = 0
+
 
     def load(self, filename):
         gc.disable()
@@ -101,11 +281,18 @@ class Database():
 
             fd = open(self.path, "rb")
 
-            data = fd.read()
-            if data.startswith(b"ZLIB"):
-                data = zlib.decompress(data[4:])
-            data = msgpack.unpackb(data, encoding="utf-8")
-            fd.close()
+            if fd.read(len(DB_MAGIC)) == DB_MAGIC:
+                reader = DBReader(fd)
+                data = self.__read_sections(reader)
+                self.__replay_journal(data)
+            else:
+                # old format (< 3.0)
+                reader = None
+                fd.seek(0)
+                data = fd.read()
+                if data.startswith(b"ZLIB"):
+                    data = zlib.decompress(data[4:])
+                data = msgpack.unpackb(data, encoding="utf-8")
 
             self.__load_meta(data)
 
@@ -125,57 +312,352 @@ class Database():
             self.__load_immediates(data)
             self.__load_inverted_cond(data)
 
+            if reader is not None:
+                reader.close()
+            fd.close()
+
+            for t in self.__journal_tables().values():
+                t.reset_dirty()
+            self.end_functions.reset_dirty()
+            self.reverse_symbols.reset_dirty()
+            self.reverse_demangled.reset_dirty()
+
             self.loaded = True
 
         gc.enable()
 
 
+    def __journal_tables(self):
+        tables = {name: getattr(self, name) for name in JOURNAL_TABLES[:-1]}
+        tables["mem"] = self.mem.mm
+        return tables
+
+
+    def __journal_meta(self):
+        return {
+            "mips_gp": self.mips_gp,
+            "func_id_counter": self.func_id_counter,
+        }
+
+
+    def __replay_journal(self, data):
+        self.base_id = data.get("base_id", 0)
+        self.journal = Journal(self.path + ".journal", self.base_id)
+
+        records, nb_pending = self.journal.read()
+        if records is None:
+            warning("the journal doesn't match the database, it's removed")
+            self.journal.remove()
+            return
+        if not records:
+            return
+
+        jmptables = {j["inst_addr"]: j for j in data["jmptables"]}
+        tables = {name: data[name] for name in JOURNAL_TABLES}
+        tables["jmptables"] = jmptables
+
+        for rec in records:
+            apply_record(tables, rec)
+            data.update(rec["meta"])
+            if "history" in rec:
+                data["history"] = rec["history"]
+
+        data["jmptables"] = list(jmptables.values())
+
+        if nb_pending:
+            warning("%d changes recovered from an interrupted session, "
+                    "run save to keep them" % nb_pending)
+            self.modified = True
+
+
+    def __jmptable_to_dict(self, j):
+        return {
+            "inst_addr": j.inst_addr,
+            "table_addr": j.table_addr,
+            "table": j.table,
+            "name": j.name,
+        }
+
+
+    def __write_journal(self, history, commit):
+        rec = make_record(self.__journal_tables(),
+                          {"jmptables": self.__jmptable_to_dict},
+                          self.__journal_meta(), history, commit)
+        if commit or not is_empty_record(rec):
+            self.journal.write(rec)
+
+
+    # Called by the analyzer between two analysis. The changes are
+    # written in the journal as pending, they are kept only if the user
+    # runs the command save.
+    def autosave(self):
+        if not self.journal_autosave or self.journal is None:
+            return
+        now = time.time()
+        if now - self.last_autosave < JOURNAL_AUTOSAVE_DELAY:
+            return
+        self.last_autosave = now
+        self.__write_journal(None, False)
+
+
+    # Remove the changes written by autosave after the last save.
+    def discard_autosave(self):
+        if self.journal is not None:
+            self.journal.discard_pending()
+
+
+    # Only the changes are written in the journal. The whole database is
+    # rewritten if the journal is too big or if there is no database yet.
     def save(self, history):
-        data = {
-            "version": VERSION,
-            "symbols": self.symbols,
-            "demangled": self.demangled,
-            "history": history,
-            "user_inline_comments": self.user_inline_comments,
-            "internal_inline_comments": self.internal_inline_comments,
-            "user_previous_comments": self.user_previous_comments,
-            "internal_previous_comments": self.internal_previous_comments,
-            "jmptables": [],
+        if self.journal is not None and self.version == VERSION and \
+                os.path.exists(self.path):
+            limit = max(JOURNAL_MAX_SIZE, os.path.getsize(self.path) // 2)
+            if self.journal.size() < limit:
+                self.__write_journal(history, True)
+                return
+
+        self.__save_all(history)
+
+
+    def __save_all(self, history):
+        self.base_id = struct.unpack("<Q", os.urandom(8))[0]
+
+        meta = {
             "mips_gp": self.mips_gp,
-            "mem": self.mem.mm,
-            "functions": self.functions,
             "func_id_counter": self.func_id_counter,
-            "func_id": self.func_id,
-            "xrefs": self.xrefs,
-            "data_sub_xrefs": self.data_sub_xrefs,
             "raw_base": self.raw_base,
             "raw_type": self.raw_type,
             "raw_is_big_endian": self.raw_is_big_endian,
-            "imports": self.imports,
-            "immediates": self.immediates,
-            "inverted_cond": self.inverted_cond,
+            "base_id": self.base_id,
         }
 
-        for j in self.jmptables.values():
-            o = {
-                "inst_addr": j.inst_addr,
-                "table_addr": j.table_addr,
-                "table": j.table,
-                "name": j.name,
-            }
-            data["jmptables"].append(o)
-
-        fd = open(self.path, "wb+")
-        fd.write(b"ZLIB")
-        fd.write(zlib.compress(msgpack.packb(data, use_bin_type=True)))
+        # The dirty keys are forgotten before the tables are written, so
+        # a change done in the same time by another thread will be saved
+        # by the next save.
+        for t in self.__journal_tables().values():
+            t.reset_dirty()
+
+        jmptables = [self.__jmptable_to_dict(j) for j in self.jmptables.values()]
+
+        # Write in a temporary file, the database is not broken if
+        # something fails.
+        tmp = self.path + ".tmp"
+        fd = open(tmp, "wb")
+        w = DBWriter(fd)
+
+        w.blob("meta", meta)
+        w.blob("symbols", self.symbols)
+        w.blob("demangled", self.demangled)
+        w.blob("history", history)
+        w.blob("user_inline_comments", self.user_inline_comments)
+        w.blob("internal_inline_comments", self.internal_inline_comments)
+        w.blob("user_previous_comments", self.user_previous_comments)
+        w.blob("internal_previous_comments", self.internal_previous_comments)
+        w.blob("jmptables", jmptables)
+
+        mm = self.mem.mm
+        w.columns("mem", [
+            ("Q", mm.keys()),
+            ("Q", (o[0] for o in mm.values())),
+            ("B", (o[1] for o in mm.values())),
+            ("q", (o[2] if len(o) > 2 else 0 for o in mm.values())),
+            ("B", (len(o) for o in mm.values())),
+        ])
+
+        w.columns("xrefs", [
+            ("Q", (ad for ad, l in self.xrefs.items() for x in l)),
+            ("Q", (x for l in self.xrefs.values() for x in l)),
+        ])
+
+        w.columns("xrefs_from", [
+            ("Q", (ad for ad, l in self.xrefs_from.items()
+                   for i in range(0, len(l), 2))),
+            ("Q", (x for l in self.xrefs_from.values() for x in l[0::2])),
+            ("B", (k for l in self.xrefs_from.values() for k in l[1::2])),
+        ])
+
+        # Pairs (head, address), a head without xrefs inside the data has
+        # no pair, so all heads are saved in their own column.
+        w.columns("data_sub_xrefs", [
+            ("Q", (ad for ad, d in self.data_sub_xrefs.items() for x in d)),
+            ("Q", (x for d in self.data_sub_xrefs.values() for x in d)),
+        ])
+
+        w.columns("data_sub_xrefs_heads", [
+            ("Q", self.data_sub_xrefs.keys()),
+        ])
+
+        w.columns("imports", [
+            ("Q", self.imports.keys()),
+            ("Q", self.imports.values()),
+        ])
+
+        w.columns("immediates", [
+            ("Q", self.immediates.keys()),
+            ("Q", self.immediates.values()),
+        ])
+
+        w.columns("inverted_cond", [
+            ("Q", self.inverted_cond.keys()),
+        ])
+
+        w.columns("func_id", [
+            ("q", self.func_id.keys()),
+            ("Q", self.func_id.values()),
+        ])
+
+        functions = [(fad, f) for fad, f in self.functions.items()
+                     if f is not None]
+
+        w.columns("functions", [
+            ("Q", (fad for fad, f in functions)),
+            ("Q", (f[FUNC_END] & ADDR_MAX for fad, f in functions)),
+            ("Q", (f[FUNC_FLAGS] for fad, f in functions)),
+            ("q", (f[FUNC_ID] for fad, f in functions)),
+            ("q", (f[FUNC_FRAME_SIZE] for fad, f in functions)),
+            ("q", (f[FUNC_ARGS_RESTORE] for fad, f in functions)),
+        ])
+
+        w.columns("functions_none", [
+            ("Q", (fad for fad, f in self.functions.items() if f is None)),
+        ])
+
+        w.columns("functions_inst_vars", [
+            ("Q", (fad for fad, f in functions
+                   for x in f[FUNC_INST_VARS_OFF])),
+            ("Q", (ad for fad, f in functions
+                   for ad in f[FUNC_INST_VARS_OFF])),
+            ("q", (off for fad, f in functions
+                   for off in f[FUNC_INST_VARS_OFF].values())),
+        ])
+
+        w.blob("functions_vars", {fad: f[FUNC_VARS]
+                                  for fad, f in functions if f[FUNC_VARS]})
+
+        w.close()
         fd.close()
+        os.replace(tmp, self.path)
+
+        self.version = VERSION
+        if self.journal is not None:
+            self.journal.remove()
+        self.journal = Journal(self.path + ".journal", self.base_id)
+
+
+    # Return the same dict as the old format, so the __load_* functions
+    # don't care about the format. The tables saved as columns are
+    # SectionTable, their rows are decoded from the mapping only when the
+    # __load_* functions iterate them.
+    def __read_sections(self, reader):
+        data = reader.blob("meta")
+        data["version"] = reader.version
+
+        for name in ["symbols", "demangled", "history", "jmptables",
+                     "user_inline_comments", "internal_inline_comments",
+                     "user_previous_comments", "internal_previous_comments"]:
+            data[name] = reader.blob(name)
+
+        cols = reader.columns("mem")
+        data["mem"] = SectionTable(lambda: self.__mem_rows(cols))
+
+        xrefs = reader.columns("xrefs")
+        data["xrefs"] = SectionTable(lambda: (
+            (ad, [x for _, x in g])
+            for ad, g in groupby(zip(*xrefs), key=lambda r: r[0])))
+
+        # Empty before 3.1, see __load_xrefs
+        xrefs_from = reader.columns("xrefs_from")
+        if xrefs_from is None:
+            data["xrefs_from"] = {}
+        else:
+            data["xrefs_from"] = SectionTable(lambda: (
+                (ad, [v for _, x, kind in g for v in (x, kind)])
+                for ad, g in groupby(zip(*xrefs_from), key=lambda r: r[0])))
+
+        sub = reader.columns("data_sub_xrefs")
+        heads = reader.columns("data_sub_xrefs_heads")
+        if heads is not None:
+            data["data_sub_xrefs"] = SectionTable(
+                lambda: self.__sub_xrefs_rows(heads[0], sub))
+        else:
+            # The first versions of this format didn't save the heads
+            # without xrefs, each array or string has one (see
+            # Memory.add).
+            d = {}
+            for ad, obj in data["mem"].items():
+                if obj[0] > 1 and (obj[1] == MEM_ARRAY or obj[1] == MEM_ASCII):
+                    d[ad] = {}
+            for ad, x in zip(*sub):
+                if ad in d:
+                    d[ad][x] = True
+                else:
+                    d[ad] = {x: True}
+            data["data_sub_xrefs"] = d
+
+        imports = reader.columns("imports")
+        data["imports"] = SectionTable(lambda: zip(*imports))
+        immediates = reader.columns("immediates")
+        data["immediates"] = SectionTable(lambda: zip(*immediates))
+        inverted = reader.columns("inverted_cond")[0]
+        data["inverted_cond"] = SectionTable(lambda: ((ad, 1) for ad in inverted))
+        func_id = reader.columns("func_id")
+        data["func_id"] = SectionTable(lambda: zip(*func_id))
+
+        functions = reader.columns("functions")
+        functions_none = reader.columns("functions_none")[0]
+        inst_vars = reader.columns("functions_inst_vars")
+        functions_vars = reader.blob("functions_vars")
+        data["functions"] = SectionTable(lambda: self.__functions_rows(
+            functions, functions_none, inst_vars, functions_vars))
+
+        return data
+
+
+    def __mem_rows(self, cols):
+        for ad, size, ty, val, n in zip(*cols):
+            if n > 2:
+                yield ad, [size, ty, val]
+            else:
+                yield ad, [size, ty]
+
+
+    # The pairs (head, address) are saved in the same order as the heads
+    # and the pairs of a head are contiguous (see __save_all).
+    def __sub_xrefs_rows(self, heads, sub):
+        pairs = groupby(zip(*sub), key=lambda r: r[0])
+        nxt = next(pairs, None)
+        for ad in heads:
+            if nxt is not None and nxt[0] == ad:
+                yield ad, {x: True for _, x in nxt[1]}
+                nxt = next(pairs, None)
+            else:
+                yield ad, {}
+
+
+    # Same thing for the rows of functions_inst_vars.
+    def __functions_rows(self, cols, functions_none, inst_vars, functions_vars):
+        inst = groupby(zip(*inst_vars), key=lambda r: r[0])
+        nxt = next(inst, None)
+        for fad, end, flags, fid, frame_size, args_restore in zip(*cols):
+            if end == ADDR_MAX:
+                end = -1
+            if nxt is not None and nxt[0] == fad:
+                off = {ad: o for _, ad, o in nxt[1]}
+                nxt = next(inst, None)
+            else:
+                off = {}
+            yield fad, [end, flags, functions_vars.get(fad, {}), fid, off,
+                        frame_size, args_restore]
+
+        for fad in functions_none:
+            yield fad, None
 
 
     def __load_symbols(self, data):
-        self.symbols = data["symbols"]
+        self.symbols = TrackedDict(data["symbols"])
 
         if self.version >= 1.9:
-            self.demangled = data["demangled"]
+            self.demangled = TrackedDict(data["demangled"])
 
             for name, ad in self.demangled.items():
                 self.reverse_demangled[ad] = name
@@ -193,10 +675,10 @@ class Database():
 
 
     def __load_comments(self, data):
-        self.user_inline_comments = data["user_inline_comments"]
-        self.internal_inline_comments = data["internal_inline_comments"]
-        self.user_previous_comments = data["user_previous_comments"]
-        self.internal_previous_comments = data["internal_previous_comments"]
+        self.user_inline_comments = TrackedDict(data["user_inline_comments"])
+        self.internal_inline_comments = TrackedDict(data["internal_inline_comments"])
+        self.user_previous_comments = TrackedDict(data["user_previous_comments"])
+        self.internal_previous_comments = TrackedDict(data["internal_previous_comments"])
 
 
     def __load_jmptables(self, data):
@@ -208,11 +690,14 @@ class Database():
     def __load_meta(self, data):
         self.mips_gp = data["mips_gp"]
         self.version = data["version"]
+        self.raw_base = data.get("raw_base", 0)
+        self.raw_type = data.get("raw_type", None)
+        self.raw_is_big_endian = data.get("raw_is_big_endian", None)
 
 
     def __load_memory(self, data):
         self.mem = Memory()
-        self.mem.mm = data["mem"]
+        self.mem.load(data["mem"])
 
 
     def __load_history(self, data):
@@ -220,16 +705,30 @@ class Database():
 
 
     def __load_immediates(self, data):
-        self.immediates = data["immediates"]
+        self.immediates = TrackedDict(data["immediates"].items())
 
 
     def __load_xrefs(self, data):
-        self.xrefs = data["xrefs"]
-        self.data_sub_xrefs = data["data_sub_xrefs"]
+        self.xrefs = TrackedDict(data["xrefs"].items())
+        self.data_sub_xrefs = TrackedDict(data["data_sub_xrefs"].items())
+
+        if self.version >= 3.1:
+            self.xrefs_from = TrackedDict(data["xrefs_from"].items())
+        else:
+            # The kind of xrefs is unknown
+            self.xrefs_from = TrackedDict()
+            for ad, lst in self.xrefs.items():
+                for x in lst:
+                    if x in self.xrefs_from:
+                        self.xrefs_from[x] += [ad, XREF_UNK]
+                    else:
+                        self.xrefs_from[x] = [ad, XREF_UNK]
+
+        self.xref_store.rebuild()
 
 
     def __load_imports(self, data):
-        self.imports = data["imports"]
+        self.imports = TrackedDict(data["imports"].items())
         if self.version <= 2.7:
             for ad in self.imports:
                 # TODO ?? check separatly pe/elf
@@ -239,7 +738,7 @@ class Database():
 
 
     def __load_functions(self, data):
-        self.functions = data["functions"]
+        self.functions = TrackedDict(data["functions"].items())
 
         for fad, value in self.functions.items():
             # end of the function
@@ -250,7 +749,7 @@ class Database():
                 else:
                     self.end_functions[e] = [fad]
 
-        self.func_id = data["func_id"]
+        self.func_id = TrackedDict(data["func_id"].items())
 
         try:
             self.func_id_counter = data["func_id_counter"]
@@ -260,4 +759,4 @@ class Database():
 
     def __load_inverted_cond(self, data):
         if "inverted_cond" in data:
-            self.inverted_cond = data["inverted_cond"]
+            self.inverted_cond = TrackedDict(data["inverted_cond"].items())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+import hashlib
+from collections import OrderedDict
+
+from plasma.lib.consts import DECOMPILE_CACHE_SIZE
+
+
+#
+# Cache of AddrContext.decompile. For each function it keeps the
+# simplified graph with its loops and the ast after the processing
+# (fused instructions, colors). The output is always rendered again, so
+# a new symbol, comment or variable name doesn't invalidate an entry.
+#
+# The key is a hash of the graph returned by get_graph (instructions and
+# bytes, links, jumps) : this graph depends on the functions, the data,
+# the jump tables and the noreturn flags. It contains also the state read
+# by generate_ast : inverted conditions, xrefs of each instruction (in
+# the interactive mode labels are created only if there is an xref) and
+# the options color and print_andif.
+#
+# Api calls invalidate on each modification, generate_ast adds some
+# symbols in the database and it's not done for a cached entry.
+#
+# The ast contains capstone instructions, so entries are not saved in the
+# database.
+#
+
+class DecompileCache():
+    def __init__(self, capacity=DECOMPILE_CACHE_SIZE):
+        self.cache = OrderedDict() # entry -> (key, addresses, state)
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self.cache)
+
+
+    def key(self, gctx, entry, gph):
+        db = gctx.db
+        h = hashlib.sha1()
+        h.update(b"%x %d %d %d\n" % (entry, gctx.color, gctx.print_andif,
+                                     gctx.is_interactive))
+
+        for ad in sorted(gph.nodes):
+            for i in gph.nodes[ad]:
+                h.update(b"%x %d " % (i.address, i.size))
+                h.update(i.bytes)
+
+            h.update(b" %r %d %d %d %d %d\n" % (
+                gph.link_out.get(ad, None),
+                ad in gph.cond_jumps_set,
+                ad in gph.uncond_jumps_set,
+                ad in gph.exit_or_ret,
+                ad in db.inverted_cond,
+                gctx.is_interactive and ad in db.xrefs))
+
+        return h.digest()
+
+
+    # Returns None or the tuple (gph, ast, all_fused_inst, addr_color,
+    # color_counter) saved by AddrContext.decompile
+    def get(self, entry, key):
+        e = self.cache.get(entry, None)
+        if e is None or e[0] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.cache.move_to_end(entry)
+        return e[2]
+
+
+    def add(self, entry, key, addresses, state):
+        self.cache[entry] = (key, addresses, state)
+        self.cache.move_to_end(entry)
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+
+
+    # Remove all functions which contain the address ad
+    def invalidate(self, ad):
+        for entry, (_, addresses, _) in list(self.cache.items()):
+            if entry == ad or ad in addresses:
+                del self.cache[entry]
+
+
+    def clear(self):
+        self.cache.clear()
@@ -28,6 +28,9 @@ from plasma.lib.colors import (color_addr, color_symbol, color_comment,
                                color_section, color_string)
 from plasma.lib.exceptions import ExcArch, ExcFileFormat
 from plasma.lib.memory import Memory
+from plasma.lib.journal import TrackedDict
+from plasma.lib.instcache import InstCache
+from plasma.lib.predecode import InstTable
 from plasma.lib.consts import *
 
 
@@ -59,7 +62,8 @@ class Disassembler():
             "MIPS64": 8,
         }
 
-        self.capstone_inst = {} # capstone instruction cache
+        self.capstone_inst = InstCache() # capstone instruction cache
+        self.inst_table = None # see lib.predecode
         self.db = database
 
         if database.loaded:
@@ -97,9 +101,16 @@ class Disassembler():
         self.mem.data_sub_xrefs = database.data_sub_xrefs
 
         self.mips_gp = database.mips_gp
+        self.time_load_symbols = 0 # seconds, see --batch-analyze
 
         if not database.loaded:
             self.load_symbols()
+            # Saved tables must be TrackedDict, see lib.journal
+            self.binary.symbols = TrackedDict(self.binary.symbols)
+            self.binary.demangled = TrackedDict(self.binary.demangled)
+            self.binary.imports = TrackedDict(self.binary.imports)
+            self.binary.reverse_symbols = TrackedDict(self.binary.reverse_symbols)
+            self.binary.reverse_demangled = TrackedDict(self.binary.reverse_demangled)
             database.symbols = self.binary.symbols
             database.reverse_symbols = self.binary.reverse_symbols
             database.demangled = self.binary.demangled
@@ -124,6 +135,10 @@ class Disassembler():
         self.md = CAPSTONE.Cs(cs_arch, cs_mode)
         self.md.detail = True
 
+        # Used by the linear sweep, see predecode
+        self.md_lite = CAPSTONE.Cs(cs_arch, cs_mode)
+        self.md_lite.detail = False
+
         for s in self.binary.iter_sections():
             s.big_endian = cs_mode & CAPSTONE.CS_MODE_BIG_ENDIAN
 
@@ -175,9 +190,36 @@ class Disassembler():
 
         elapsed = time()
         elapsed = elapsed - start
+        self.time_load_symbols = elapsed
         debug__("Found %d symbols in %fs" % (len(self.binary.symbols), elapsed))
 
 
+    def predecode(self):
+        if not self.is_x86:
+            warning("predecode is only supported on x86")
+            return
+
+        start = time()
+        self.inst_table = InstTable(self)
+
+        for s in self.binary.iter_sections():
+            if s.is_exec and not s.is_bss:
+                self.inst_table.sweep(s)
+
+        elapsed = time()
+        elapsed = elapsed - start
+        debug__("Predecoded %d instructions in %fs" %
+                (len(self.inst_table), elapsed))
+
+
+    # Returns a tuple (size, flags, target) from the predecoded table, or
+    # None if the instruction must be disassembled with lazy_disasm.
+    def get_inst_info(self, ad):
+        if self.inst_table is None:
+            return None
+        return self.inst_table.get(ad)
+
+
     def get_magic(self, filename):
         f = open(filename, "rb")
         magic = f.read(8)
@@ -222,19 +264,17 @@ class Disassembler():
         o = ARCH_OUTPUT.Output(ctx)
         o._new_line()
         o.print_labels = False
-        xrefs = list(ctx.gctx.api.xrefsto(ad))
-        xrefs.sort()
-
-        seen = set()
 
-        for x in xrefs:
+        # head of the item -> kind of the xref
+        xrefs = {}
+        for x, to_ad, kind in ctx.gctx.api.xrefsto_kind(ad):
             x = self.mem.get_head_addr(x)
+            if xrefs.get(x, XREF_UNK) == XREF_UNK:
+                xrefs[x] = kind
 
-            if x in seen:
-                continue
-
-            seen.add(x)
+        for x in sorted(xrefs):
             s = self.binary.get_section(x)
+            o._comment("%-8s" % XREF_NAMES[xrefs[x]])
 
             ty = self.mem.get_type(x)
 
@@ -252,14 +292,14 @@ class Disassembler():
                     else:
                         o._add(" - %d " % (-diff))
 
-                o._pad_width(20)
+                o._pad_width(28)
 
                 i = self.lazy_disasm(x, s.start)
                 o._asm_inst(i)
 
             elif MEM_WOFFSET <= ty <= MEM_QOFFSET:
                 o.set_line(x)
-                o._pad_width(20)
+                o._pad_width(28)
                 o._address(x)
                 sz = self.mem.get_size(x)
                 off = s.read_int(x, sz)
@@ -272,13 +312,13 @@ class Disassembler():
 
             elif ty == MEM_ARRAY:
                 o.set_line(x)
-                o._pad_width(20)
+                o._pad_width(28)
                 o._address(x)
                 o._label(x, print_colon=True)
                 o._new_line()
 
             else:
-                o._pad_width(20)
+                o._pad_width(28)
                 o._address(x)
                 o.set_line(x)
                 sz = self.mem.get_size_from_type(ty)
@@ -474,7 +514,16 @@ class Disassembler():
                     o.set_line(ad)
                     o._data_prefix(entry_size)
 
+                    # Entries after the end of the section are None
+                    values = s.read_array(ad,
+                            (total_size + entry_size - 1) // entry_size,
+                            entry_size)
+                    if values is None:
+                        values = ()
+                    nb_values = len(values)
+
                     k = 0
+                    idx = 0
                     while k < total_size:
                         if o.curr_index > 70:
                             o._new_line()
@@ -483,7 +532,7 @@ class Disassembler():
                             o._data_prefix(entry_size)
                             l += 1
 
-                        val = s.read_int(ad, entry_size)
+                        val = values[idx] if idx < nb_values else None
                         if MEM_WOFFSET <= entry_type <= MEM_QOFFSET:
                             o._add(" ")
                             o._imm(val, entry_size, True,
@@ -493,6 +542,7 @@ class Disassembler():
 
                         ad += entry_size
                         k += entry_size
+                        idx += 1
 
                         if k < total_size:
                             o._add(",")
@@ -658,21 +708,21 @@ class Disassembler():
         print("Total:", total)
 
 
+    # s is optional, it's the section of ad.
     def lazy_disasm(self, ad, stay_in_section=-1, s=None):
-        s = self.binary.get_section(ad)
-        if s is None:
-            return None
+        # Instructions in the cache are always in a section
+        inst = self.capstone_inst.get(ad)
+        if inst is not None:
+            return inst
+
+        if s is None or not (s.start <= ad <= s.end):
+            s = self.binary.get_section(ad)
+            if s is None:
+                return None
 
         # if stay_in_section != -1 and s.start != stay_in_section:
             # return None, s
 
-        if ad in self.capstone_inst:
-            return self.capstone_inst[ad]
-
-        # TODO: remove when it's too big ?
-        if len(self.capstone_inst) > CAPSTONE_CACHE_SIZE:
-            self.capstone_inst.clear()
-
         # Disassemble by block of N bytes
         N = 128
         d = s.read(ad, N)
@@ -683,15 +733,25 @@ class Disassembler():
         except StopIteration:
             return None
 
-        self.capstone_inst[first.address] = first
+        self.capstone_inst.add(first.address, first)
         for i in gen:
             if i.address in self.capstone_inst:
                 break
-            self.capstone_inst[i.address] = i
+            self.capstone_inst.add(i.address, i)
 
         return first
 
 
+    # Keep in the instruction cache the region [start, end[ displayed
+    # by the visual.
+    def pin_region(self, start, end):
+        self.capstone_inst.unpin()
+        for s in self.binary.iter_sections():
+            if s.start < end and start <= s.end:
+                self.capstone_inst.pin(s.start, max(start, s.start),
+                                       min(end, s.end + 1))
+
+
     def __add_prefetch(self, addr_set, inst):
         if self.is_mips:
             prefetch = self.lazy_disasm(inst.address + inst.size)
@@ -17,21 +17,67 @@
 # along with this program.    If not, see <http://www.gnu.org/licenses/>.
 #
 
+import re
+import sys
+import mmap
+import struct
 import bisect
+from array import array
 from time import time
 import subprocess
 
 from plasma.lib.utils import debug__, print_no_end, get_char, BYTES_PRINTABLE_SET
 from plasma.lib.colors import color_section
+from plasma.lib.consts import STRING_MIN_BYTES
 
 T_BIN_ELF = 0
 T_BIN_PE  = 1
 T_BIN_RAW = 2
 T_BIN_UNK = 3
 
+# Readers of SectionAbs.read_int
+STRUCTS_LE = {1: struct.Struct("<B"), 2: struct.Struct("<H"),
+              4: struct.Struct("<I"), 8: struct.Struct("<Q")}
+STRUCTS_BE = {1: struct.Struct(">B"), 2: struct.Struct(">H"),
+              4: struct.Struct(">I"), 8: struct.Struct(">Q")}
+
+# Typecodes of SectionAbs.read_array, indexed by signed
+TYPECODES = [
+    {1: "B", 2: "H", 4: "I", 8: "Q"},
+    {1: "b", 2: "h", 4: "i", 8: "q"},
+]
+
+# Page table of Binary.get_section. Sections with more pages are not
+# in the table.
+PAGE_SHIFT = 12
+SECTION_PAGES_MAX = 1 << 18
+NO_REGION = (1, 0, None)
+
+# Runs of printable chars, see Binary.find_strings
+PRINTABLE_RUN = re.compile(
+        b"[" + re.escape(bytes(sorted(BYTES_PRINTABLE_SET))) + b"]+")
+
+
+# The whole file is mapped and the data of sections and segments are
+# memoryview slices on the mapping : the file is not copied and only the
+# pages really accessed are read. The mapping is never closed, it's used
+# while the binary is loaded.
+#
+# Bytes after real_size (bss, or virt_size > size in the file) are not
+# allocated, reads after real_end return None.
+def map_file(filename):
+    with open(filename, "rb") as fd:
+        try:
+            mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return memoryview(b"")
+    return memoryview(mm)
+
 
 class SectionAbs():
     # virt_size: size of the mapped section in memory
+    # data: bytes or memoryview (see map_file)
     def __init__(self, name, start, virt_size, real_size, is_exec, is_data, is_bss, data):
         self.name = name
         self.start = start
@@ -45,6 +91,17 @@ class SectionAbs():
         self.data = data
         self.big_endian = False # set in lib.disassembler
 
+    # The readers depend on the endianness
+    @property
+    def big_endian(self):
+        return self._big_endian
+
+    @big_endian.setter
+    def big_endian(self, value):
+        self._big_endian = value
+        structs = STRUCTS_BE if value else STRUCTS_LE
+        self._unpack = {size: st.unpack_from for size, st in structs.items()}
+
     def print_header(self):
         print_no_end(color_section(self.name.ljust(20)))
         print_no_end(" [ ")
@@ -58,59 +115,48 @@ class SectionAbs():
         if ad > self.real_end:
             return b""
         off = ad - self.start
-        return self.data[off:off + size]
+        return bytes(self.data[off:off + size])
 
+    # size must be 1, 2, 4 or 8, otherwise it returns None
     def read_int(self, ad, size):
-        if size == 1:
-            return self.read_byte(ad)
-        if size == 2:
-            return self.read_word(ad)
-        if size == 4:
-            return self.read_dword(ad)
-        if size == 8:
-            return self.read_qword(ad)
-        return None
-
-    def read_byte(self, ad):
         if ad > self.real_end:
             return None
-        off = ad - self.start
-        return self.data[off]
+        try:
+            return self._unpack[size](self.data, ad - self.start)[0]
+        except (KeyError, struct.error):
+            return None
+
+    def read_byte(self, ad):
+        return self.read_int(ad, 1)
 
     def read_word(self, ad):
-        if ad > self.real_end:
-            return None
-        off = ad - self.start
-        w = self.data[off:off+2]
-        if len(w) != 2:
-            return None
-        if self.big_endian:
-            return (w[0] << 8) + w[1]
-        return (w[1] << 8) + w[0]
+        return self.read_int(ad, 2)
 
     def read_dword(self, ad):
-        if ad > self.real_end:
-            return None
-        off = ad - self.start
-        w = self.data[off:off+4]
-        if len(w) != 4:
-            return None
-        if self.big_endian:
-            return (w[0] << 24) + (w[1] << 16) + (w[2] << 8) + w[3]
-        return (w[3] << 24) + (w[2] << 16) + (w[1] << 8) + w[0]
+        return self.read_int(ad, 4)
 
     def read_qword(self, ad):
-        if ad > self.real_end:
+        return self.read_int(ad, 8)
+
+    # Returns n words of size bytes at ad, or less at the end of the
+    # section. It's a memoryview on the data (no copy) if the endianness
+    # of the section is the same as the host, otherwise an array. Both
+    # can be indexed and converted with tolist. Returns None if size is
+    # not 1, 2, 4 or 8.
+    def read_array(self, ad, n, size, signed=False):
+        ty = TYPECODES[signed].get(size, None)
+        if ty is None:
             return None
         off = ad - self.start
-        w = self.data[off:off+8]
-        if len(w) != 8:
-            return None
-        if self.big_endian:
-            return (w[0] << 56) + (w[1] << 48) + (w[2] << 40) + (w[3] << 32) + \
-                   (w[4] << 24) + (w[5] << 16) + (w[6] << 8) + w[7]
-        return (w[7] << 56) + (w[6] << 48) + (w[5] << 40) + (w[4] << 32) + \
-               (w[3] << 24) + (w[2] << 16) + (w[1] << 8) + w[0]
+        avail = min(self.real_size, len(self.data)) - off
+        n = max(0, min(n, avail // size))
+        buf = memoryview(self.data[off:off + n * size])
+        if bool(self.big_endian) == (sys.byteorder == "big"):
+            return buf.cast(ty)
+        arr = array(ty)
+        arr.frombytes(buf)
+        arr.byteswap()
+        return arr
 
 
 class SegmentAbs(SectionAbs):
@@ -141,6 +187,7 @@ class Binary(object):
         self.imports = {} # ad -> True (the bool is just for msgpack to save the database)
         self._abs_sections = {} # start section -> SectionAbs
         self._sorted_sections = [] # bisect list, contains section start address
+        self._reset_pages()
 
         # for elf
         self._abs_segments = {}
@@ -157,14 +204,71 @@ class Binary(object):
         self.api = None
 
 
+    # Must be called when _sorted_sections is modified
+    def _reset_pages(self):
+        self._pages = None
+        self._regions = None
+        self._last_region = NO_REGION
+
+
+    # For each section, the region is the range [start, hi] where
+    # get_section returns this section : hi is the end of the section or
+    # the address before the next one if they overlap. A page contained
+    # in only one region is mapped to it in _pages, other pages (shared
+    # by several regions or in a huge section) are not in the dict or
+    # set to None, the lookup falls back to the bisect.
+    def __build_pages(self):
+        pages = {}
+        regions = []
+        sorted_sections = self._sorted_sections
+
+        for i, start in enumerate(sorted_sections):
+            s = self._abs_sections[start]
+            hi = s.end
+            if i + 1 < len(sorted_sections):
+                hi = min(hi, sorted_sections[i + 1] - 1)
+            r = (start, hi, s)
+            regions.append(r)
+
+            first = start >> PAGE_SHIFT
+            last = max(first, hi >> PAGE_SHIFT)
+
+            if last - first > SECTION_PAGES_MAX:
+                pages[first] = None
+                pages[last] = None
+                continue
+
+            for p in range(first, last + 1):
+                if p in pages:
+                    pages[p] = None
+                else:
+                    pages[p] = r
+
+        self._regions = regions
+        self._pages = pages
+        return pages
+
+
     def get_section(self, ad):
-        i = bisect.bisect_right(self._sorted_sections, ad)
-        if not i:
-            return None
-        start = self._sorted_sections[i - 1]
-        s = self._abs_sections[start]
-        if ad <= s.end:
-            return s
+        # Consecutive calls are often in the same section
+        r = self._last_region
+        if r[0] <= ad <= r[1]:
+            return r[2]
+
+        pages = self._pages
+        if pages is None:
+            pages = self.__build_pages()
+
+        r = pages.get(ad >> PAGE_SHIFT, None)
+        if r is None:
+            i = bisect.bisect_right(self._sorted_sections, ad)
+            if not i:
+                return None
+            r = self._regions[i - 1]
+
+        if r[0] <= ad <= r[1]:
+            self._last_region = r
+            return r[2]
         return None
 
 
@@ -181,6 +285,7 @@ class Binary(object):
                 is_data,
                 is_bss,
                 data)
+        self._reset_pages()
 
 
     # for elf
@@ -298,7 +403,7 @@ class Binary(object):
 
 
     # Returns the size of the string or 0 if it's not an ascii string
-    def is_string(self, addr, min_bytes=3, s=None):
+    def is_string(self, addr, min_bytes=STRING_MIN_BYTES, s=None):
         if s is None:
             s = self.get_section(addr)
             if s is None:
@@ -326,6 +431,70 @@ class Binary(object):
         return 0
 
 
+    # Returns the list of all ascii strings in the section : [(addr, size)],
+    # the size includes the null byte. It's the same as calling is_string
+    # on the first byte of each run of printable chars, but the data is
+    # scanned only once. is_string is also true for any address inside
+    # a string if the remaining size is >= min_bytes.
+    def find_strings(self, s, min_bytes=STRING_MIN_BYTES):
+        data = s.data
+        res = []
+        for m in PRINTABLE_RUN.finditer(data):
+            end = m.end()
+            if end < len(data) and data[end] == 0:
+                n = end - m.start() + 1
+                if n >= min_bytes:
+                    res.append((s.start + m.start(), n))
+        return res
+
+
+    # Returns the sorted list of addresses in the section which contain
+    # a word pointing to an executable section. Words are read at every
+    # alignment, the section is converted in arrays of words instead of
+    # calling read_int and get_section on each address.
+    def find_pointers(self, s, wordsize):
+        typecode = {2: "H", 4: "I", 8: "Q"}[wordsize]
+
+        # Merge the executable sections which overlap or are contiguous
+        starts = []
+        ends = []
+        for start, end in sorted((s2.start, s2.end)
+                                 for s2 in self.iter_sections() if s2.is_exec):
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        if not starts:
+            return []
+
+        bisect_right = bisect.bisect_right
+        lo = starts[0]
+        hi = ends[-1]
+        data = s.data
+        res = []
+
+        for align in range(wordsize):
+            n = (len(data) - align) // wordsize
+            if n <= 0:
+                continue
+            words = array(typecode)
+            words.frombytes(data[align:align + n * wordsize])
+            if bool(s.big_endian) != (sys.byteorder == "big"):
+                words.byteswap()
+
+            # Each word is read once, the alignments give different
+            # addresses : there is no duplicate.
+            base = s.start + align
+            res += [base + i * wordsize for i, val in enumerate(words)
+                    if lo <= val <= hi and
+                    val <= ends[bisect_right(starts, val) - 1]]
+
+        res.sort()
+        return res
+
+
     def load_section_names(self):
         # Used for the auto-completion
         for ad, sec in self._abs_sections.items():
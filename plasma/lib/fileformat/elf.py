@@ -38,7 +38,7 @@ from elftools.elf.constants import SH_FLAGS, P_FLAGS
 
 from plasma.lib.consts import *
 from plasma.lib.utils import warning, die
-from plasma.lib.fileformat.binary import SegmentAbs, Binary
+from plasma.lib.fileformat.binary import SegmentAbs, Binary, map_file
 from plasma.lib.exceptions import ExcElf
 from plasma.lib.fileformat.relocations import get_relocation
 from plasma.lib.fileformat.relocations.generic import MipsGlobalReloc, MipsLocalReloc
@@ -61,6 +61,9 @@ from plasma.lib.fileformat.relocations.generic import MipsGlobalReloc, MipsLocal
 
 DEBUG_PRINT_LOADED_SYMS = False
 
+# Type of a symbol in st_info & 0xf
+STT_FUNC = 2
+
 
 class ELF(Binary):
     def __init__(self, db, filename):
@@ -70,6 +73,10 @@ class ELF(Binary):
         self.elf = ELFFile(fd)
         self.db = db
 
+        # Sections and segments are slices of the mapped file, instead
+        # of s.data() which reads a copy.
+        self.raw = map_file(filename)
+
         self.__parsed_reloc_tables = set()
         self.dtags = {}
         self.jmprel = []
@@ -125,7 +132,8 @@ class ELF(Binary):
                 start = reloc
                 reloc += s.header.sh_size
 
-            data = s.data()
+            off = s.header.sh_offset
+            data = self.raw[off:off + s.header.sh_size]
 
             self.add_section(
                 start,
@@ -158,7 +166,8 @@ class ELF(Binary):
 
             is_data = self.__segment_is_data(seg)
             is_exec = self.__segment_is_exec(seg)
-            data = seg.data()
+            off = seg.header.p_offset
+            data = self.raw[off:off + seg.header.p_filesz]
 
             self._abs_segments[start] = SegmentAbs(
                     name,
@@ -175,6 +184,7 @@ class ELF(Binary):
         if len(self._abs_sections) == 0:
             self._abs_sections = self._abs_segments
             self._sorted_sections = self._sorted_segments
+            self._reset_pages()
 
 
     def read_addr_at(self, ad):
@@ -450,8 +460,48 @@ class ELF(Binary):
         return RelocClass(self, symbol, reloc_sec.entry.r_offset, addend)
 
 
+    # Returns a list of (name, st_value, st_info) of a symbol table. The
+    # table and the string table are read directly in the mapped file,
+    # names are bytes.
+    def __read_symtab(self, s):
+        if self.elf.elfclass == 32:
+            fmt = "IIIBBH"
+            i_value, i_info = 1, 3
+        else:
+            fmt = "IBBHQQ"
+            i_value, i_info = 4, 1
+
+        st = struct.Struct(("<" if self.elf.little_endian else ">") + fmt)
+        entsize = s.header.sh_entsize
+        if entsize == 0:
+            return []
+
+        off = s.header.sh_offset
+        n = min(s.header.sh_size, len(self.raw) - off) // entsize
+        data = self.raw[off:off + n * entsize]
+
+        if entsize == st.size:
+            entries = st.iter_unpack(data)
+        else:
+            entries = (st.unpack_from(data, i * entsize) for i in range(n))
+
+        strtab_hdr = self.elf.get_section(s.header.sh_link).header
+        off = strtab_hdr.sh_offset
+        strtab = bytes(self.raw[off:off + strtab_hdr.sh_size])
+        find = strtab.find
+
+        res = []
+        for e in entries:
+            i = e[0]
+            j = find(b"\0", i)
+            if j == -1:
+                j = len(strtab)
+            res.append((strtab[i:j], e[i_value], e[i_info]))
+        return res
+
+
     def load_static_sym(self):
-        dont_save = [b"$a", b"$t", b"$d"]
+        dont_save = {b"$a", b"$t", b"$d"}
         is_arm = self.arch == "ARM"
 
         for s in self.elf.iter_sections():
@@ -460,33 +510,32 @@ class ELF(Binary):
 
             # it seems it's better to start from the end, some symbols are added by
             # gcc at the beginning
-            for sy in reversed(list(s.iter_symbols())):
-                if is_arm and sy.name in dont_save:
+            for raw_name, ad, info in reversed(self.__read_symtab(s)):
+                if ad == 0 or not raw_name or ad in self.reverse_symbols:
                     continue
 
-                ad = sy.entry.st_value
-                if ad != 0 and sy.name != b"" and ad not in self.reverse_symbols:
-                    name = sy.name
-                    if isinstance(name, bytes):
-                        name = name.decode()
+                if is_arm and raw_name in dont_save:
+                    continue
+
+                if raw_name.startswith(b"completed."):
+                    continue
 
-                    if not name or name.startswith("completed."):
-                        continue
+                if self.is_address(ad):
+                    name = raw_name.decode(errors="replace")
 
-                    if self.is_address(ad):
-                        if name in self.symbols:
-                            if ad == self.symbols[name]:
-                                continue
-                            name = self.rename_sym(name)
+                    if name in self.symbols:
+                        if ad == self.symbols[name]:
+                            continue
+                        name = self.rename_sym(name)
 
-                        if DEBUG_PRINT_LOADED_SYMS:
-                            print("static", name, hex(ad))
+                    if DEBUG_PRINT_LOADED_SYMS:
+                        print("static", name, hex(ad))
 
-                        self.reverse_symbols[ad] = name
-                        self.symbols[name] = ad
+                    self.reverse_symbols[ad] = name
+                    self.symbols[name] = ad
 
-                        if self.is_function(sy):
-                            self.db.functions[ad] = None
+                    if info & 0xf == STT_FUNC:
+                        self.db.functions[ad] = None
 
 
     def __section_is_data(self, s):
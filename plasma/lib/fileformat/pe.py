@@ -22,14 +22,14 @@
 # http://unixwiz.net/techtips/win32-callconv.html
 
 import bisect
+import struct
 
 import pefile
 from capstone.x86 import (X86_OP_INVALID, X86_OP_MEM, X86_REG_RIP, X86_REG_EIP)
-from ctypes import sizeof
 
 from plasma.lib.consts import *
 from plasma.lib.exceptions import ExcPEFail
-from plasma.lib.fileformat.pefile2 import PE2, SymbolEntry, PE_DT_FCN, PE_DT_PTR
+from plasma.lib.fileformat.pefile2 import PE2, PE_DT_FCN, PE_DT_PTR
 from plasma.lib.fileformat.binary import Binary
 from plasma.lib.utils import warning
 
@@ -38,6 +38,10 @@ if not pefile.__version__.startswith("201"):
     warning("https://github.com/erocarrera/pefile")
 
 
+# Same fields as pefile2.SymbolEntry
+SYMBOL_ENTRY = struct.Struct("<8sIhHBB")
+
+
 class PE(Binary):
     def __init__(self, db, filename):
         Binary.__init__(self)
@@ -53,8 +57,16 @@ class PE(Binary):
 
         base = self.pe.OPTIONAL_HEADER.ImageBase
 
+        # pefile maps the file, don't copy sections (see lib.fileformat.binary)
+        raw = memoryview(self.pe.__data__)
+
         for s in self.pe.sections:
             name = s.Name.decode().rstrip(' \0')
+
+            # Same bytes as s.get_data()
+            off = s.get_PointerToRawData_adj()
+            end = min(off + s.SizeOfRawData, s.PointerToRawData + s.SizeOfRawData)
+
             self.add_section(
                 base + s.VirtualAddress,
                 name,
@@ -63,28 +75,41 @@ class PE(Binary):
                 self.__section_is_exec(s),
                 self.__section_is_data(s),
                 name == ".bss",
-                s.get_data())
+                raw[off:end])
 
 
     def load_static_sym(self):
         sym_table_off = self.pe.FILE_HEADER.PointerToSymbolTable
         n_sym = self.pe.FILE_HEADER.NumberOfSymbols
-        string_table_off = sym_table_off + sizeof(SymbolEntry) * n_sym
+        string_table_off = sym_table_off + SYMBOL_ENTRY.size * n_sym
         base = self.pe.OPTIONAL_HEADER.ImageBase + \
                self.pe.OPTIONAL_HEADER.SectionAlignment
 
-        off = sym_table_off
+        # Unpack the whole table at once (see SymbolEntry), long names are
+        # read in the string table.
+        data = self.pe.__data__
+        n_sym = min(n_sym, (len(data) - sym_table_off) // SYMBOL_ENTRY.size)
+        end = sym_table_off + SYMBOL_ENTRY.size * n_sym
+        entries = list(SYMBOL_ENTRY.iter_unpack(
+                memoryview(data)[sym_table_off:end]))
+
         i = 0
 
         while i < n_sym:
-            sym = self.pe.get_sym_at_offset(off)
+            short_name, value, scnum, ty, sclass, numaux = entries[i]
 
-            if sym.sclass == 2:  # static symbol
-                name = \
-                    sym.sym.name.decode() if sym.sym.addr.zeroes != 0 else \
-                    self.pe.get_string_at_offset(string_table_off + \
-                                                 sym.sym.addr.offset)
-                ad = sym.value + base
+            if sclass == 2:  # static symbol
+                if short_name[:4] != b"\0\0\0\0":
+                    name = short_name.split(b"\0", 1)[0].decode()
+                else:
+                    off = string_table_off + \
+                          int.from_bytes(short_name[4:], "little")
+                    j = data.find(b"\0", off)
+                    if j == -1:
+                        j = len(data)
+                    name = data[off:j].decode("latin-1")
+
+                ad = value + base
 
                 if self.is_address(ad):
                     if name in self.symbols:
@@ -93,15 +118,10 @@ class PE(Binary):
                     self.reverse_symbols[ad] = name
                     self.symbols[name] = ad
 
-                    if sym.type & PE_DT_FCN and not sym.type & PE_DT_PTR:
+                    if ty & PE_DT_FCN and not ty & PE_DT_PTR:
                         self.db.functions[ad] = None
 
-            if sym.numaux != 0:
-                off += sym.numaux * sizeof(SymbolEntry)
-                i += sym.numaux
-
-            off += sizeof(SymbolEntry)
-            i += 1
+            i += numaux + 1
 
 
     def load_dyn_sym(self):
@@ -178,7 +198,7 @@ class PE(Binary):
         self.reverse_symbols[first_inst.address] = name
         self.symbols[name] = first_inst.address
 
-        self.api.add_xref(first_inst.address, ptr)
+        self.api.add_xref(first_inst.address, ptr, XREF_READ)
 
         if ty != -1:
             self.db.mem.add(first_inst.address, 1, ty)
@@ -17,14 +17,14 @@
 # along with this program.    If not, see <http://www.gnu.org/licenses/>.
 #
 
-from plasma.lib.fileformat.binary import SectionAbs, Binary
+from plasma.lib.fileformat.binary import SectionAbs, Binary, map_file
 
 
 class Raw(Binary):
     def __init__(self, filename, raw_type, raw_base, raw_big_endian):
         Binary.__init__(self)
 
-        self.raw = open(filename, "rb").read()
+        self.raw = map_file(filename)
         self.raw_base = raw_base
         self.raw_big_endian = raw_big_endian
 
@@ -21,7 +21,8 @@ from time import time
 
 from plasma.lib.utils import BRANCH_NEXT, BRANCH_NEXT_JUMP, debug__, list_starts_with
 
-# For the loop's analysis
+# Maximum size of an irreducible function for the path search in
+# loop_detection, see Graph.__explore.
 MAX_NODES = 800
 
 
@@ -67,7 +68,7 @@ class Graph:
         self.deps = {}
         self.rev_deps = {}
 
-        self.cache_path_exists = {}
+        self.cache_path_exists = {} # (from, loop_start) -> reachable set
 
         # For each loop we search the last node that if we enter in it,
         # we are sure to return to the loop.
@@ -111,10 +112,14 @@ class Graph:
     # Concat instructions in single block
     # jumps are in separated blocks
     def simplify(self):
-        nodes = list(self.nodes.keys())
         start = time()
 
-        for ad in nodes:
+        # An instruction is fused with the previous one if it's the only
+        # predecessor and if it has only one successor. A block is a chain
+        # of fused instructions.
+        fused = set()
+
+        for ad in self.nodes:
             if ad in self.uncond_jumps_set or ad in self.cond_jumps_set:
                 continue
 
@@ -131,24 +136,39 @@ class Graph:
             if pred not in self.link_out or len(self.link_out[pred]) != 1:
                 continue
 
-            if ad in self.link_out:
-                self.link_out[pred] = self.link_out[ad]
-            else:
-                del self.link_out[pred]
+            fused.add(ad)
+
+        for ad in list(self.nodes):
+            if ad in fused:
+                continue
 
-            self.nodes[pred] += self.nodes[ad]
+            blk = self.nodes[ad]
+            last = ad
 
-            if ad in self.link_out:
+            while last in self.link_out:
+                nxt = self.link_out[last]
+                if len(nxt) != 1 or nxt[0] not in fused:
+                    break
+                last = nxt[0]
+                blk += self.nodes[last]
+
+            if last == ad:
+                continue
+
+            if last in self.link_out:
+                self.link_out[ad] = self.link_out[last]
+                # last is not a jump, there is only one successor
+                lst_i = self.link_in[self.link_out[last][0]]
+                lst_i[lst_i.index(last)] = ad
+            else:
                 del self.link_out[ad]
 
+        for ad in fused:
+            if ad in self.link_out:
+                del self.link_out[ad]
             del self.link_in[ad]
             del self.nodes[ad]
 
-            # replace all addr wich refers to ad
-            for k, lst_i in self.link_in.items():
-                if ad in lst_i:
-                    lst_i[lst_i.index(ad)] = pred
-
         elapsed = time()
         elapsed = elapsed - start
         debug__("Graph simplified in %fs (%d nodes)" % (elapsed, len(self.nodes)))
@@ -286,63 +306,67 @@ class Graph:
         return True
 
 
+    # The traversal doesn't continue after loop_start. For each
+    # (from_addr, loop_start) all the reachable addresses are computed
+    # once, so the next queries from the same address are a lookup.
     def path_exists(self, from_addr, to_addr, loop_start):
-        def __path_exists(curr, local_visited):
-            stack = []
-            for n in self.link_out[from_addr]:
-                stack.append(n)
-            while stack:
-                curr = stack.pop(-1)
-                if curr == to_addr:
-                    return True
-                if curr in local_visited:
-                    continue
-                local_visited.add(curr)
-                if curr not in self.link_out or curr == loop_start:
-                    continue
-                for n in self.link_out[curr]:
-                    stack.append(n)
-            return False
-
         if from_addr == to_addr:
             return True
 
         if from_addr not in self.link_out:
             return False
 
-        if (from_addr, to_addr) in self.cache_path_exists:
-            return self.cache_path_exists[(from_addr, to_addr)]
+        k = (from_addr, loop_start)
+        if k in self.cache_path_exists:
+            return to_addr in self.cache_path_exists[k]
+
+        reachable = set()
+        stack = list(self.link_out[from_addr])
+        while stack:
+            curr = stack.pop(-1)
+            if curr in reachable:
+                continue
+            reachable.add(curr)
+            if curr not in self.link_out or curr == loop_start:
+                continue
+            stack += self.link_out[curr]
 
-        local_visited = set()
-        res = __path_exists(from_addr, local_visited)
-        self.cache_path_exists[(from_addr, to_addr)] = res
-        return res
+        self.cache_path_exists[k] = reachable
+        return to_addr in reachable
 
 
     # Returns a set containing every addresses which are in paths from
     # 'from_addr' to 'to_addr'.
     def find_paths(self, from_addr, to_addr, global_visited):
-        def __rec_find_paths(curr, local_visited, path_set):
-            nonlocal isfirst
-            if curr == to_addr and not isfirst:
-                path_set.add(curr)
-                return
-            isfirst = False
-            if curr in local_visited:
-                return
-            local_visited.add(curr)
-            if curr in global_visited or curr not in self.link_out:
-                return
-            for n in self.link_out[curr]:
-                __rec_find_paths(n, local_visited, path_set)
+        path_set = set()
+        local_visited = {from_addr}
+        stack = []
+
+        # Depth-first, an address is in path_set if one of its successors
+        # was already in path_set when it was visited.
+        if from_addr not in global_visited and from_addr in self.link_out:
+            stack.append((from_addr, iter(self.link_out[from_addr])))
+
+        while stack:
+            curr, it = stack[-1]
+
+            for n in it:
+                if n == to_addr:
+                    path_set.add(n)
+                elif n not in local_visited:
+                    local_visited.add(n)
+                    if n not in global_visited and n in self.link_out:
+                        stack.append((n, iter(self.link_out[n])))
+                        break
 
                 if n in path_set:
                     path_set.add(curr)
 
-        isfirst = True
-        path_set = set()
-        local_visited = set()
-        __rec_find_paths(from_addr, local_visited, path_set)
+            else:
+                stack.pop(-1)
+                if stack and curr in path_set:
+                    path_set.add(stack[-1][0])
+
         return path_set
 
 
@@ -533,6 +557,135 @@ class Graph:
                     self.loops_all[(entry, ad)].update(self.loops_all[(prev, start)])
 
 
+    # Loop nesting forest : Havlak, "Nesting of reducible and irreducible
+    # loops" (1997), with the correction of Ramalingam for irreducible
+    # loops. It's a DFS and an union-find, so it's almost linear.
+    #
+    # A loop header is the target of a back edge (the first node of the
+    # loop seen by the DFS). The body of a loop contains its nodes and
+    # the headers of its sub-loops (a sub-loop is collapsed on its header
+    # with the union-find). Irreducible loops (several entries) are also
+    # found, the header is the entry which was seen first.
+    #
+    # Returns a tuple (dict header -> (parent header or -1, body set),
+    # is_irreducible). A sub-loop is always before its parent in the dict.
+    def __loop_nesting(self, entry):
+        order = [] # preorder number -> address
+        number = {} # address -> preorder number
+        last = [] # preorder number -> number of the last descendant
+
+        # Iterative DFS
+        number[entry] = 0
+        order.append(entry)
+        last.append(0)
+        stack = [(0, iter(self.link_out.get(entry, [])))]
+
+        while stack:
+            w, it = stack[-1]
+            for n in it:
+                if n not in number and n in self.nodes:
+                    i = len(order)
+                    number[n] = i
+                    order.append(n)
+                    last.append(i)
+                    stack.append((i, iter(self.link_out.get(n, []))))
+                    break
+            else:
+                stack.pop(-1)
+                last[w] = len(order) - 1
+
+        nb = len(order)
+        back_preds = [[] for i in range(nb)]
+        non_back_preds = [[] for i in range(nb)]
+
+        for w, ad in enumerate(order):
+            for p in self.link_in.get(ad, []):
+                v = number.get(p, -1)
+                if v == -1:
+                    continue
+                # w is an ancestor of v
+                if w <= v <= last[w]:
+                    back_preds[w].append(v)
+                else:
+                    non_back_preds[w].append(v)
+
+        uf = list(range(nb))
+
+        def find(x):
+            root = x
+            while uf[root] != root:
+                root = uf[root]
+            while uf[x] != root:
+                uf[x], x = root, uf[x]
+            return root
+
+        loops = {}
+        parent = [-1] * nb
+        irreducible = False
+
+        for w in range(nb - 1, -1, -1):
+            if not back_preds[w]:
+                continue
+
+            body = set()
+            for v in back_preds[w]:
+                if v != w:
+                    body.add(find(v))
+
+            work = list(body)
+            while work:
+                x = work.pop(-1)
+                for y in non_back_preds[x]:
+                    y = find(y)
+                    if not w <= y <= last[w]:
+                        # Irreducible loop : y enters in the loop of w
+                        # without passing by w.
+                        non_back_preds[w].append(y)
+                        irreducible = True
+                    elif y != w and y not in body:
+                        body.add(y)
+                        work.append(y)
+
+            for x in body:
+                parent[x] = w
+                uf[x] = w
+
+            loops[w] = body
+
+        res = {}
+        for w, body in loops.items():
+            res[order[w]] = (
+                    -1 if parent[w] == -1 else order[parent[w]],
+                    {order[x] for x in body})
+        return res, irreducible
+
+
+    # Fill loops_set, loops_all and deps from the loop nesting forest.
+    # A loop key is (parent loop start or entry, loop start).
+    def __build_loops(self, entry, forest):
+        def key(start):
+            par = forest[start][0]
+            return (entry if par == -1 else par, start)
+
+        for start, (par, body) in forest.items():
+            k = key(start)
+            self.loops_set[k] = body | {start}
+            self.deps[k] = set()
+
+        # Sub-loops are before their parent in the forest
+        for start, (par, body) in forest.items():
+            k = key(start)
+            l = set(self.loops_set[k])
+            for sub in self.deps[k]:
+                l.update(self.loops_all[sub])
+            self.loops_all[k] = l
+
+            if par != -1:
+                k_par = key(par)
+                self.deps[k_par].add(k)
+                self.rev_deps[k] = {k_par}
+
+
     def all_false(self, loops_key):
         for k in loops_key:
             if k not in self.false_loops:
@@ -544,22 +697,30 @@ class Graph:
     # have been set to false
     def __rec_mark_parent_false(self, k):
         self.false_loops.add(k)
-        if k not in self.rev_deps:
-            return
+        stack = [k]
 
-        for par in self.rev_deps[k]:
-            if par in self.false_loops:
+        while stack:
+            k = stack.pop(-1)
+            if k not in self.rev_deps:
                 continue
 
-            if self.all_false(self.deps[par]):
-                self.__rec_mark_parent_false(par)
+            for par in self.rev_deps[k]:
+                if par in self.false_loops:
+                    continue
+
+                if self.all_false(self.deps[par]):
+                    self.false_loops.add(par)
+                    stack.append(par)
 
 
     def __rec_mark_children(self, k, myset):
-        myset.add(k)
-        for sub in self.deps[k]:
-            if sub not in self.false_loops:
-                self.__rec_mark_children(sub, myset)
+        stack = [k]
+        while stack:
+            k = stack.pop(-1)
+            myset.add(k)
+            for sub in self.deps[k]:
+                if sub not in self.false_loops and sub not in myset:
+                    stack.append(sub)
 
 
     def __yield_cmp_loops(self, keys1, not_in_false=True):
@@ -708,13 +869,16 @@ class Graph:
 
     def __update_loops(self):
         def rec_remove(k):
-            if k not in self.loops_all:
-                return
-            del self.loops_all[k]
-            del self.loops_set[k]
-            for sub in self.deps[k]:
-                if sub in self.false_loops:
-                    rec_remove(sub)
+            stack = [k]
+            while stack:
+                k = stack.pop(-1)
+                if k not in self.loops_all:
+                    continue
+                del self.loops_all[k]
+                del self.loops_set[k]
+                for sub in self.deps[k]:
+                    if sub in self.false_loops:
+                        stack.append(sub)
         for k in self.false_loops:
             if k not in self.rev_deps or k in self.all_deep_equiv:
                 rec_remove(k)
@@ -735,12 +899,18 @@ class Graph:
         # Loops marked as "False"
         self.false_loops = set()
 
-        if len(self.nodes) > MAX_NODES:
-            self.skipped_loops_analysis = True
-            return
+        forest, irreducible = self.__loop_nesting(entry)
 
-        # Detect loops and compute loop dependencies on the fly
-        self.__explore(entry, set(), set(), {}, None, set())
+        # The path search is kept for irreducible loops (a goto inside a
+        # loop) : its false loops heuristics choose the right loop start,
+        # the loop nesting forest takes the first seen by the DFS. For a
+        # reducible graph the result is the same.
+        if irreducible and len(self.nodes) <= MAX_NODES:
+            # Detect loops and compute loop dependencies on the fly
+            self.__explore(entry, set(), set(), {}, None, set())
+        else:
+            self.__build_loops(entry, forest)
+            bypass_false_search = True
 
         # Keep only loops at the first level
         self.roots = self.loops_set.keys() - self.rev_deps.keys()
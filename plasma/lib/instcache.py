@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+from collections import OrderedDict
+
+from plasma.lib.consts import CAPSTONE_CACHE_SIZE
+
+
+#
+# LRU cache of capstone instructions (address -> instruction).
+#
+# Instructions in a pinned range are not evicted, unless all instructions
+# of the cache are pinned. There is one pinned range per section, it's
+# used by the visual to keep the displayed instructions.
+#
+# The cache is shared by the analyzer and the visual. There is no lock
+# (the analyzer may fork while the visual is using the cache), an
+# instruction evicted by the other thread is just a miss.
+#
+
+class InstCache():
+    def __init__(self, capacity=CAPSTONE_CACHE_SIZE):
+        self.cache = OrderedDict()
+        self.capacity = capacity
+        self.pinned = {} # section start -> (start, end)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def __len__(self):
+        return len(self.cache)
+
+
+    # Doesn't update the statistics
+    def __contains__(self, ad):
+        return ad in self.cache
+
+
+    def get(self, ad):
+        inst = self.cache.get(ad, None)
+        if inst is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self.cache.move_to_end(ad)
+        except KeyError:
+            pass
+        return inst
+
+
+    def add(self, ad, inst):
+        self.cache[ad] = inst
+        if len(self.cache) > self.capacity:
+            self.__evict()
+
+
+    def __evict(self):
+        # Don't loop forever if all instructions are pinned
+        n = len(self.cache)
+        while len(self.cache) > self.capacity:
+            try:
+                ad, inst = self.cache.popitem(last=False)
+            except KeyError:
+                break
+            if n > 0 and self.is_pinned(ad):
+                self.cache[ad] = inst
+                n -= 1
+                continue
+            self.evictions += 1
+
+
+    def is_pinned(self, ad):
+        for start, end in self.pinned.values():
+            if start <= ad < end:
+                return True
+        return False
+
+
+    # Pin [start, end[ in the section starting at s_start
+    def pin(self, s_start, start, end):
+        self.pinned[s_start] = (start, end)
+
+
+    def unpin(self):
+        self.pinned.clear()
+
+
+    def set_capacity(self, capacity):
+        self.capacity = capacity
+        if len(self.cache) > self.capacity:
+            self.__evict()
+
+
+    def clear(self):
+        self.cache.clear()
+
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
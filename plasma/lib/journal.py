@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import struct
+import threading
+
+try:
+    import msgpack
+except:
+    print("error: you need to install msgpack")
+    print("pip3 install msgpack-python")
+    sys.exit(0)
+
+
+#
+# The journal is an append-only file saved next to the database. Each
+# record contains the new values of all keys modified since the previous
+# record. A record is either a commit (command save) or pending (written
+# in background by the analyzer). Pending records are replayed only after
+# a crash, they are removed if the user exits without saving.
+#
+# File format :
+#   JOURNAL_MAGIC, base_id (8 bytes)
+#   records : size (4 bytes, little endian) + msgpack
+#
+# base_id is saved in the database, the journal is ignored if it was
+# written for another database.
+#
+
+JOURNAL_MAGIC = b"PLASMAJL"
+JOURNAL_HDR_SIZE = len(JOURNAL_MAGIC) + 8
+
+
+# A dict which remembers the keys modified since the last save. Values
+# modified in place must be marked with touch.
+#
+# TrackedDict.version is incremented by each modification of any
+# TrackedDict, caches built on the database compare it to know if they
+# are still valid (see lib.search). The stamp of a TrackedDict is the
+# version of its last modification (or of its creation), a cache which
+# depends only on a few tables compares their stamps and reads the keys
+# modified in these tables with a KeyLog (see lib.labels), the dirty keys
+# are kept for the journal.
+class TrackedDict(dict):
+    version = 0
+
+    def __init__(self, *args):
+        dict.__init__(self, *args)
+        self.dirty = set()
+        self.cleared = False
+        self.watchers = []
+        self.__modified()
+
+
+    # The stamp is set before the version : when a new version is seen,
+    # the stamp of the table is already up to date.
+    def __modified(self):
+        v = TrackedDict.version + 1
+        self.stamp = v
+        TrackedDict.version = v
+
+
+    def __changed(self, k):
+        self.dirty.add(k)
+        for log in self.watchers:
+            log.add(k)
+        self.__modified()
+
+
+    def __setitem__(self, k, v):
+        dict.__setitem__(self, k, v)
+        self.__changed(k)
+
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        self.__changed(k)
+
+
+    def pop(self, k, *default):
+        v = dict.pop(self, k, *default)
+        self.__changed(k)
+        return v
+
+
+    def popitem(self):
+        k, v = dict.popitem(self)
+        self.__changed(k)
+        return k, v
+
+
+    def setdefault(self, k, default=None):
+        if k not in self:
+            self[k] = default
+        return dict.__getitem__(self, k)
+
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+
+    def clear(self):
+        dict.clear(self)
+        self.dirty.clear()
+        self.cleared = True
+        for log in self.watchers:
+            log.set_full()
+        self.__modified()
+
+
+    def touch(self, k):
+        self.__changed(k)
+
+
+    def reset_dirty(self):
+        self.dirty.clear()
+        self.cleared = False
+
+
+    # Return the list of modified keys and forget them. The set is not
+    # iterated directly because another thread may modify the dict.
+    def take_dirty(self):
+        keys = list(self.dirty)
+        self.dirty.difference_update(keys)
+        cleared = self.cleared
+        self.cleared = False
+        return cleared, keys
+
+
+    def watch(self, log):
+        self.watchers.append(log)
+
+
+    def unwatch(self, log):
+        self.watchers.remove(log)
+
+
+# Keys modified in the TrackedDict watched. If more than limit keys are
+# modified or if a dict is cleared, the keys are forgotten and full is
+# incremented : the owner must consider that all keys have changed.
+class KeyLog():
+    def __init__(self, limit):
+        self.keys = set()
+        self.limit = limit
+        self.full = 0
+
+
+    def add(self, k):
+        if len(self.keys) >= self.limit:
+            self.set_full()
+        else:
+            self.keys.add(k)
+
+
+    def set_full(self):
+        self.keys.clear()
+        self.full += 1
+
+
+    # Same thing as TrackedDict.take_dirty, full must be read after.
+    def take(self):
+        keys = list(self.keys)
+        self.keys.difference_update(keys)
+        return keys
+
+
+class Journal():
+    def __init__(self, path, base_id):
+        self.path = path
+        self.base_id = base_id
+        self.lock = threading.Lock()
+        # Offset after the last commit, the file is truncated here if
+        # the user exits without saving.
+        self.commit_off = JOURNAL_HDR_SIZE
+        self.has_pending = False
+
+
+    def size(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path)
+
+
+    def remove(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.commit_off = JOURNAL_HDR_SIZE
+            self.has_pending = False
+
+
+    # Return the list of records and the number of pending records.
+    # A truncated record (crash during a write) is ignored.
+    def read(self):
+        if not os.path.exists(self.path):
+            return [], 0
+
+        fd = open(self.path, "rb")
+        data = fd.read()
+        fd.close()
+
+        if data[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC or \
+                len(data) < JOURNAL_HDR_SIZE or \
+                struct.unpack_from("<Q", data, len(JOURNAL_MAGIC))[0] != self.base_id:
+            return None, 0
+
+        records = []
+        nb_pending = 0
+        off = JOURNAL_HDR_SIZE
+
+        while off + 4 <= len(data):
+            size = struct.unpack_from("<I", data, off)[0]
+            if off + 4 + size > len(data):
+                break
+            try:
+                rec = msgpack.unpackb(data[off + 4:off + 4 + size],
+                                      encoding="utf-8")
+            except:
+                break
+            off += 4 + size
+            records.append(rec)
+            if rec["commit"]:
+                self.commit_off = off
+                nb_pending = 0
+            else:
+                nb_pending += 1
+
+        self.has_pending = nb_pending != 0
+        return records, nb_pending
+
+
+    def write(self, rec):
+        buf = msgpack.packb(rec, use_bin_type=True)
+
+        with self.lock:
+            if not os.path.exists(self.path):
+                fd = open(self.path, "wb")
+                fd.write(JOURNAL_MAGIC)
+                fd.write(struct.pack("<Q", self.base_id))
+            else:
+                fd = open(self.path, "ab")
+
+            fd.write(struct.pack("<I", len(buf)))
+            fd.write(buf)
+            fd.flush()
+            off = fd.tell()
+            fd.close()
+
+            if rec["commit"]:
+                self.commit_off = off
+                self.has_pending = False
+            else:
+                self.has_pending = True
+
+
+    # Remove pending records
+    def discard_pending(self):
+        with self.lock:
+            if not self.has_pending or not os.path.exists(self.path):
+                return
+            fd = open(self.path, "rb+")
+            fd.truncate(self.commit_off)
+            fd.close()
+            self.has_pending = False
+
+
+# Build a record with the modified keys of each table. tables is a dict
+# name -> TrackedDict, encoders is a dict name -> function to convert
+# a value before packing.
+def make_record(tables, encoders, meta, history, commit):
+    rec = {
+        "commit": commit,
+        "meta": meta,
+        "clear": [],
+        "set": {},
+        "del": {},
+    }
+
+    if commit:
+        rec["history"] = history
+
+    for name, t in tables.items():
+        cleared, keys = t.take_dirty()
+        if cleared:
+            rec["clear"].append(name)
+
+        enc = encoders.get(name, None)
+        set_vals = {}
+        del_keys = []
+
+        for k in keys:
+            try:
+                v = t[k]
+            except KeyError:
+                del_keys.append(k)
+                continue
+            set_vals[k] = v if enc is None else enc(v)
+
+        if set_vals:
+            rec["set"][name] = set_vals
+        if del_keys:
+            rec["del"][name] = del_keys
+
+    return rec
+
+
+def is_empty_record(rec):
+    return not rec["clear"] and not rec["set"] and not rec["del"]
+
+
+# Apply a record on tables (dict name -> dict).
+def apply_record(tables, rec):
+    for name in rec["clear"]:
+        tables[name].clear()
+
+    for name, keys in rec["del"].items():
+        t = tables[name]
+        for k in keys:
+            t.pop(k, None)
+
+    for name, values in rec["set"].items():
+        tables[name].update(values)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+from plasma.lib.consts import *
+from plasma.lib.custom_colors import *
+from plasma.lib.journal import TrackedDict, KeyLog
+
+
+#
+# Table of labels used by Api.get_symbol and Output._label. For an
+# address it keeps the name and everything needed to print it : the head
+# of the item which contains the address, its type, the base color and
+# the index inside an array or a string.
+#
+# The names depend on the symbols, the memory types, the xrefs (loc_*)
+# and the imports. All these tables are TrackedDict, the table watches
+# them with a KeyLog : when they are modified (Api.add_symbol, rm_symbol,
+# set_*, the analyzer...), only the entries of the modified addresses
+# are removed. A label depends also on the head of its item, so the
+# labels inside an item are removed with its head. Other modifications
+# (comments, functions...) don't change the labels.
+#
+# The table is emptied if a log is full, if a table is loaded again or
+# if the option show_mangling is toggled. It's also emptied when it
+# contains LABELS_TABLE_SIZE entries, so a big dump doesn't keep all
+# addresses in memory.
+#
+# TrackedDict.version is checked first, the stamps of the tables are
+# compared only when something has changed in the database.
+#
+
+class LabelsTable():
+    def __init__(self, gctx, capacity=LABELS_TABLE_SIZE):
+        self.gctx = gctx
+        self.db = gctx.db
+        self.mem = gctx.db.mem
+        self.capacity = capacity
+        self.names = {} # ad -> name or None
+        self.labels = {} # ad -> tuple, see label
+        self.heads = {} # head -> set of addresses inside the item in labels
+        self.version = -1 # TrackedDict.version at the last check
+        self.stamp = -1 # greatest stamp of the tables
+        self.show_mangling = gctx.show_mangling
+        self.log = KeyLog(capacity) # symbols, demangled, xrefs, imports
+        self.mem_log = KeyLog(capacity)
+        self.full = (0, 0)
+        self.tables = [] # list of (TrackedDict, KeyLog) watched
+
+
+    def __tables(self):
+        db = self.db
+        return [(db.reverse_symbols, self.log),
+                (db.reverse_demangled, self.log),
+                (db.xrefs, self.log),
+                (db.imports, self.log),
+                (self.mem.mm, self.mem_log)]
+
+
+    # Called when something has changed in the database : only the
+    # entries of the modified addresses are removed.
+    def __check(self):
+        # Read the version before the stamps and the logs, see TrackedDict
+        self.version = TrackedDict.version
+
+        tables = self.__tables()
+        if len(tables) != len(self.tables) or \
+                any(t is not old for (t, _), (old, _) in zip(tables, self.tables)):
+            for t, log in self.tables:
+                t.unwatch(log)
+            for t, log in tables:
+                t.watch(log)
+            self.tables = tables
+            self.log.take()
+            self.mem_log.take()
+            self.full = (self.log.full, self.mem_log.full)
+            self.clear()
+
+        if self.show_mangling != self.gctx.show_mangling:
+            self.show_mangling = self.gctx.show_mangling
+            self.clear()
+
+        stamp = max(t.stamp for t, _ in tables)
+        if stamp == self.stamp:
+            return
+        self.stamp = stamp
+
+        keys = self.log.take()
+        mem_keys = self.mem_log.take()
+        full = (self.log.full, self.mem_log.full)
+
+        if full != self.full:
+            self.full = full
+            self.clear()
+            return
+
+        for ad in keys:
+            self.__invalidate(ad)
+        for ad in mem_keys:
+            self.__invalidate_item(ad)
+
+
+    def __invalidate(self, ad):
+        self.names.pop(ad, None)
+        self.labels.pop(ad, None)
+        for i in self.heads.pop(ad, ()):
+            self.labels.pop(i, None)
+
+
+    # The item at ad was added, modified or removed. The addresses inside
+    # an old item are removed with its head, but the addresses inside a
+    # new item which were not in an item have to be removed too.
+    def __invalidate_item(self, ad):
+        self.__invalidate(ad)
+        end = ad + self.mem.get_size(ad)
+        if end - ad - 1 <= len(self.labels):
+            for i in range(ad + 1, end):
+                self.labels.pop(i, None)
+        else:
+            for i in [i for i in self.labels if ad < i < end]:
+                del self.labels[i]
+
+
+    def clear(self):
+        self.names.clear()
+        self.labels.clear()
+        self.heads.clear()
+
+
+    # Returns the name or None, see Api.get_symbol
+    def symbol(self, ad):
+        if self.version != TrackedDict.version or \
+                self.show_mangling != self.gctx.show_mangling:
+            self.__check()
+        try:
+            return self.names[ad]
+        except KeyError:
+            pass
+        if len(self.names) >= self.capacity:
+            self.names.clear()
+        name = self.__compute_symbol(ad)
+        self.names[ad] = name
+        return name
+
+
+    def __compute_symbol(self, ad):
+        db = self.db
+        if ad in db.reverse_symbols:
+            if self.gctx.show_mangling:
+                s = db.reverse_demangled.get(ad, None)
+                if s is not None:
+                    return s
+            return db.reverse_symbols[ad]
+
+        ty = self.mem.get_type(ad)
+
+        if ty == MEM_ARRAY:
+            ty = self.mem.get_array_entry_type(ad)
+
+        if ty == MEM_FUNC:
+            return "sub_%x" % ad
+        if ty == MEM_CODE:
+            if ad in db.xrefs:
+                return "loc_%x" % ad
+            return None
+        if ty == MEM_DWORD:
+            return "dword_%x" % ad
+        if ty == MEM_BYTE:
+            return "byte_%x" % ad
+        if ty == MEM_QWORD:
+            return "qword_%x" % ad
+        if ty == MEM_UNK:
+            return "unk_%x" % ad
+        if ty == MEM_WORD:
+            return "word_%x" % ad
+        if ty == MEM_ASCII:
+            return "asc_%x" % ad
+        if MEM_WOFFSET <= ty <= MEM_QOFFSET:
+            return "off_%x" % ad
+
+        return None
+
+
+    # Returns None if there is no name, otherwise a tuple
+    # (head, name, type of head, color, array_idx, array_offset, nb_entries)
+    # array_idx is -1 if ad is not inside an array or a string and
+    # nb_entries is the size of the array at head (0 if it's not an array).
+    def label(self, ad):
+        if self.version != TrackedDict.version or \
+                self.show_mangling != self.gctx.show_mangling:
+            self.__check()
+        try:
+            return self.labels[ad]
+        except KeyError:
+            pass
+
+        # Most instructions don't have a label, don't keep them
+        obj = self.mem.mm.get(ad, None)
+        if obj is not None and obj[1] == MEM_CODE and \
+                ad not in self.db.xrefs and ad not in self.db.reverse_symbols:
+            return None
+
+        if len(self.labels) >= self.capacity:
+            self.labels.clear()
+            self.heads.clear()
+
+        head = self.mem.get_head_addr(ad)
+        lbl = self.__compute_label(ad, head)
+        self.labels[ad] = lbl
+
+        if head != ad:
+            if head in self.heads:
+                self.heads[head].add(ad)
+            else:
+                self.heads[head] = {ad}
+
+        return lbl
+
+
+    def __compute_label(self, ad, head):
+        mem = self.mem
+
+        # Check if ad is inside an array, in this case we should print
+        # something like "((byte*) &label[idx]) + offset)".
+        ty = mem.get_type(head)
+        array_offset = 0
+        nb_entries = 0
+
+        if ty == MEM_ASCII:
+            if head != ad:
+                array_idx = ad - head
+            else:
+                array_idx = -1
+        elif ty == MEM_ARRAY:
+            entry_size = mem.get_size_from_type(mem.get_array_entry_type(head))
+            n = ad - head
+            array_idx = int(n / entry_size)
+            array_offset = n % entry_size
+            nb_entries = int(mem.get_size(head) / entry_size)
+        else:
+            array_idx = -1
+
+        name = self.__compute_symbol(head)
+        if name is None:
+            return None
+
+        col = 0
+
+        if head in self.gctx.dis.binary.imports:
+            col = COLOR_SECTION.val
+        elif ty == MEM_FUNC:
+            col = COLOR_SYMBOL.val
+        elif ty == MEM_CODE:
+            col = COLOR_CODE_ADDR.val
+        elif ty == MEM_UNK:
+            col = COLOR_UNK.val
+        elif MEM_BYTE <= ty <= MEM_ARRAY:
+            col = COLOR_DATA.val
+
+        return (head, name, ty, col, array_idx, array_offset, nb_entries)
@@ -101,7 +101,7 @@ class MemoryMap(QtGui.QWidget):
                     col = COLOR_FUNC
             elif MEM_BYTE <= cont[1] <= MEM_ARRAY:
                 col = COLOR_DATA
-            elif cont[1] == MEM_UNK or cont[1] == MEM_HEAD:
+            elif cont[1] == MEM_UNK:
                 continue
 
             (x, sz) = self.conv_ad_to_x(ad, cont[0])
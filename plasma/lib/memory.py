@@ -17,7 +17,11 @@
 # along with this program.    If not, see <http://www.gnu.org/licenses/>.
 #
 
+from array import array
+from bisect import bisect_left, bisect_right
+
 from plasma.lib.consts import *
+from plasma.lib.journal import TrackedDict
 
 #
 # Values stored in self.mm for each type :
@@ -47,12 +51,130 @@ from plasma.lib.consts import *
 # MEM_ASCII: (null terminated)
 #     [size, MEM_ASCII]
 #
-# MEM_HEAD: (refernce to the head of the data, used for big strings/data)
-#     [size_until_end, MEM_HEAD, head_address]
-#
 # MEM_ARRAY:
 #     [size_in_bytes, MEM_ARRAY, entry_type]
 #
+# Only the head of each item is stored. Addresses inside an item are
+# found with a binary search on the sorted list of heads (see AddrIndex).
+# Old databases contained MEM_HEAD entries, they are dropped in load.
+#
+
+
+# Sorted set of addresses. Addresses are stored in blocks of array('Q'),
+# an insertion or a deletion moves at most 2*LOAD items.
+class AddrIndex():
+    LOAD = 1024
+
+    def __init__(self, addresses=()):
+        self.clear()
+        lst = sorted(addresses)
+        for i in range(0, len(lst), self.LOAD):
+            blk = array("Q", lst[i:i + self.LOAD])
+            self.blocks.append(blk)
+            self.maxes.append(blk[-1])
+        self.length = len(lst)
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __iter__(self):
+        for blk in self.blocks:
+            yield from blk
+
+
+    def clear(self):
+        self.blocks = []
+        self.maxes = [] # last address of each block
+        self.length = 0
+
+
+    def add(self, ad):
+        if not self.maxes:
+            self.blocks.append(array("Q", [ad]))
+            self.maxes.append(ad)
+            self.length = 1
+            return
+
+        i = bisect_left(self.maxes, ad)
+        if i == len(self.maxes):
+            i -= 1
+            blk = self.blocks[i]
+            blk.append(ad)
+            self.maxes[i] = ad
+        else:
+            blk = self.blocks[i]
+            j = bisect_left(blk, ad)
+            if blk[j] == ad:
+                return
+            blk.insert(j, ad)
+
+        self.length += 1
+
+        if len(blk) > 2 * self.LOAD:
+            self.blocks.insert(i + 1, blk[self.LOAD:])
+            self.maxes.insert(i, blk[self.LOAD - 1])
+            del blk[self.LOAD:]
+
+
+    def remove(self, ad):
+        i = bisect_left(self.maxes, ad)
+        if i == len(self.maxes):
+            return
+        blk = self.blocks[i]
+        j = bisect_left(blk, ad)
+        if blk[j] != ad:
+            return
+
+        del blk[j]
+        self.length -= 1
+
+        if not blk:
+            del self.blocks[i]
+            del self.maxes[i]
+        elif j == len(blk):
+            self.maxes[i] = blk[-1]
+
+
+    # Returns the greatest address <= ad or -1
+    def floor(self, ad):
+        i = bisect_left(self.maxes, ad)
+        if i == len(self.maxes):
+            if i == 0:
+                return -1
+            return self.maxes[-1]
+        blk = self.blocks[i]
+        j = bisect_right(blk, ad)
+        if j:
+            return blk[j - 1]
+        if i:
+            return self.maxes[i - 1]
+        return -1
+
+
+    # Returns the smallest address >= ad or -1
+    def ceil(self, ad):
+        i = bisect_left(self.maxes, ad)
+        if i == len(self.maxes):
+            return -1
+        blk = self.blocks[i]
+        return blk[bisect_left(blk, ad)]
+
+
+    # Returns a list of all addresses in [start, end[
+    def range(self, start, end):
+        res = []
+        i = bisect_left(self.maxes, start)
+        while i < len(self.blocks):
+            blk = self.blocks[i]
+            j = bisect_left(blk, start) if not res else 0
+            k = bisect_left(blk, end)
+            res += blk[j:k]
+            if k < len(blk):
+                break
+            i += 1
+        return res
 
 
 class Memory():
@@ -65,7 +187,8 @@ class Memory():
         # the value is the function id where the instruction is.
         #
 
-        self.mm = {}
+        self.mm = TrackedDict()
+        self.index = AddrIndex() # sorted keys of self.mm
         self.size_lookup = {
             MEM_BYTE: 1,
             MEM_WORD: 2,
@@ -91,86 +214,106 @@ class Memory():
         return len(self.mm)
 
 
+    # Called by lib.database
+    def load(self, mm):
+        self.mm = TrackedDict()
+        for ad, obj in mm.items():
+            if obj[1] != MEM_HEAD:
+                self.mm[ad] = obj
+        self.mm.reset_dirty()
+        self.index = AddrIndex(self.mm)
+
+
+    def clear(self):
+        self.mm.clear()
+        self.index.clear()
+
+
+    def __set(self, ad, obj):
+        if ad not in self.mm:
+            self.index.add(ad)
+        self.mm[ad] = obj
+
+
+    def __del(self, ad):
+        del self.mm[ad]
+        self.index.remove(ad)
+
+
     # If you are not sure about what you do, don't use this function.
     # Maybe you should see in lib.api.
     def add(self, ad, size, ty, val=None):
         self.rm_range(ad, max(self.get_size(ad), size))
 
         if val is None:
-            self.mm[ad] = [size, ty]
+            self.__set(ad, [size, ty])
         else:
-            self.mm[ad] = [size, ty, val]
+            self.__set(ad, [size, ty, val])
 
         if ty == MEM_UNK:
             return
 
         if size > 1 and (ty == MEM_ARRAY or ty == MEM_ASCII):
-            # Set the MEM_HEAD if it's a big data
-            # Save inside xrefs
+            # Save inside xrefs, they are not stored in self.mm
 
             end = ad + size
-            self.data_sub_xrefs[ad] = {}
-            i = ad
-
-            if i in self.xrefs:
-                self.data_sub_xrefs[ad][i] = True
+            sub = {}
+            self.data_sub_xrefs[ad] = sub
 
-            i += 1
-            while i < end:
+            for i in range(ad, end):
                 if i in self.xrefs:
-                    self.data_sub_xrefs[ad][i] = True
-                if i in self.mm:
-                    self.mm[i] = [end - i, MEM_HEAD, ad]
-                elif i % BLOCK_SIZE == 0:
-                    self.mm[i] = [end - i, MEM_HEAD, ad]
-                i += 1
+                    sub[i] = True
 
-            self.mm[end - 1] = [1, MEM_HEAD, ad]
+            # rm_range keeps unknown bytes with an xref
+            for i in self.index.range(ad + 1, end):
+                self.__del(i)
 
 
-    def __rm_block_heads(self, ad, sz):
-        end = ad + sz
-        while ad < end:
-            if ad in self.mm:
-                if ad in self.xrefs:
-                    self.mm[ad][0] = 1
-                    self.mm[ad][1] = MEM_UNK
-                else:
-                    del self.mm[ad]
-            ad += 1
+    def __rm_data(self, ad, obj):
+        if ad in self.data_sub_xrefs:
+            sub = self.data_sub_xrefs.pop(ad)
+        else:
+            sub = ()
+
+        if ad in self.xrefs:
+            obj[0] = 1
+            obj[1] = MEM_UNK
+            self.mm.touch(ad)
+        else:
+            self.__del(ad)
+
+        # Keep a reference on each address with an xref
+        for i in sub:
+            if i != ad and i in self.xrefs:
+                self.__set(i, [1, MEM_UNK])
 
 
     def rm_range(self, ad, sz):
         end = ad + sz
-        while ad < end:
-            if ad in self.mm:
-                obj = self.mm[ad]
-                ty = obj[1]
-                if ty == MEM_ARRAY or ty == MEM_ASCII:
-                    if ad in self.data_sub_xrefs:
-                        del self.data_sub_xrefs[ad]
-                    self.__rm_block_heads(ad, obj[0])
-                    ad += obj[0]
-                    continue
-                if ty == MEM_HEAD:
-                    ad = obj[2]
-                    obj = self.mm[ad]
-                    if ad in self.data_sub_xrefs:
-                        del self.data_sub_xrefs[ad]
-                    self.__rm_block_heads(ad, obj[0])
-                    ad += obj[0]
-                    continue
-
-                if ad in self.xrefs:
-                    obj[0] = 1
-                    obj[1] = MEM_UNK
-                else:
-                    del self.mm[ad]
-            ad += 1
+
+        # If ad is inside an array or a string, the whole data is removed
+        head = self.get_head_addr(ad)
+        if head != ad:
+            ty = self.mm[head][1]
+            if ty == MEM_ARRAY or ty == MEM_ASCII:
+                ad = head
+
+        for i in self.index.range(ad, end):
+            obj = self.mm[i]
+            ty = obj[1]
+            if ty == MEM_ARRAY or ty == MEM_ASCII:
+                self.__rm_data(i, obj)
+            elif i in self.xrefs:
+                obj[0] = 1
+                obj[1] = MEM_UNK
+                self.mm.touch(i)
+            else:
+                self.__del(i)
 
 
     def type(self, ad, ty):
         self.mm[ad][1] = ty
+        self.mm.touch(ad)
 
 
     def is_code(self, ad):
@@ -256,23 +399,14 @@ class Memory():
 
 
     def get_head_addr(self, ad):
-        # Now check if need to go backward (maybe we are inside an instruction
+        # Check if need to go backward (maybe we are inside an instruction
         # or a string/data) : we should return the head of the data.
+        if ad in self.mm:
+            return ad
 
-        end = ad - BLOCK_SIZE
-        i = ad
-
-        while i >= end:
-            if i in self.mm:
-                m = self.mm[i]
-                # Check if the address is in the range
-                if ad < i + m[0]:
-                    if m[1] == MEM_HEAD:
-                        # The head address is stored at the offset 2
-                        return m[2]
-                    return i
-                return ad
-            i -= 1
+        i = self.index.floor(ad)
+        if i != -1 and ad < i + self.mm[i][0]:
+            return i
 
         # Nothing found: it's an unknown data or byte
         return ad
@@ -27,10 +27,26 @@ from plasma.lib.fileformat.binary import T_BIN_RAW
 from plasma.lib.consts import *
 
 
+#
+# Streaming mode : if ctx.sink is a file, completed lines are written to
+# it while they are generated and only the last lines are kept in
+# token_lines and lines (first_line is the number of the first one). The
+# indexes line_addr and addr_line are still complete. print() writes the
+# remaining lines.
+#
+# The last two lines are never flushed before print() : they are used
+# by last_2_lines_are_empty and the dump removes the last empty line.
+#
+
+OUTPUT_STREAM_BATCH = 256
+
+
 class OutputAbs():
     def __init__(self, ctx=None):
         self.token_lines = [] # each line is separated in tokens (string, color, is_bold)
         self.lines = [] # each line contains the entire string
+        self.first_line = 0 # line number of token_lines[0]
+        self.sink = None
         self.line_addr = {} # line -> address
         self.addr_line = {} # address -> line
         self.idx_tok_inline_comm = {} # line -> (char_index, token_index)
@@ -47,6 +63,7 @@ class OutputAbs():
             self.ctx = ctx
             self.OP_IMM = self.gctx.libarch.utils.OP_IMM
             self.ARCH_UTILS = self.gctx.libarch.utils
+            self.sink = ctx.sink
 
         # Only at the decompilation, it's used to add a newline after
         # a call exit / ret (or equivalent).
@@ -63,7 +80,7 @@ class OutputAbs():
 
 
     def inline_comm_starts_here(self):
-        line = len(self.token_lines)-1
+        line = self.first_line + len(self.token_lines) - 1
         self.idx_tok_inline_comm[line] = self.curr_index
 
     def last_2_lines_are_empty(self):
@@ -72,6 +89,8 @@ class OutputAbs():
         return len(self.lines[-1]) == 0 and len(self.lines[-2]) == 0
 
     def _new_line(self):
+        if self.sink is not None and len(self.token_lines) >= OUTPUT_STREAM_BATCH:
+            self.__flush_lines(len(self.token_lines) - 2)
         self.curr_index = 0
         self.token_lines.append([])
         self.lines.append([])
@@ -225,31 +244,12 @@ class OutputAbs():
 
 
     def _label(self, ad, tab=-1, print_colon=True, nocolor=False):
-        # Check if ad is inside an array, in this case we should print
-        # something like "((byte*) &label[idx]) + offset)".
-        tmp_ad = self._dis.mem.get_head_addr(ad)
-        ty = self._dis.mem.get_type(tmp_ad)
-        if ty == MEM_ASCII:
-            if tmp_ad != ad:
-                array_idx = ad - tmp_ad
-                array_offset = 0
-            else:
-                array_idx = -1
-        elif ty == MEM_ARRAY:
-            entry_type = self._dis.mem.get_array_entry_type(tmp_ad)
-            entry_size =  self._dis.mem.get_size_from_type(entry_type)
-            n = ad - tmp_ad
-            array_idx = int(n / entry_size)
-            array_offset = n % entry_size
-        else:
-            array_idx = -1
-
-        ad = tmp_ad
-
-        l = self.gctx.api.get_symbol(ad)
-        if l is None:
+        lbl = self.gctx.api.labels.label(ad)
+        if lbl is None:
             return False
 
+        ad, l, ty, col, array_idx, array_offset, nb_entries = lbl
+
         # If it's not the label but only from a xref
         if not print_colon and array_idx != -1:
             if array_offset != 0:
@@ -257,29 +257,15 @@ class OutputAbs():
             else:
                 l = "&%s[%d]" % (l, array_idx)
 
-        ty = self._dis.mem.get_type(ad)
-        col = 0
-
-        if ad in self._dis.binary.imports:
-            col = COLOR_SECTION.val
-
-        elif ty == MEM_FUNC:
-            col = COLOR_SYMBOL.val
-
-        elif ty == MEM_CODE:
-            if not self.ctx.is_dump:
-                # It means that in decompilation mode we don't want to print
-                # labels with "loc_ADDR:", but we want to print them if they are
-                # referenced in an instruction, example : mov eax, loc_ADDR
-                if l.startswith("loc_"):
-                    if print_colon:
-                        return False
-                    l = hex(ad)
-            col = COLOR_CODE_ADDR.val
-        elif ty == MEM_UNK:
-            col = COLOR_UNK.val
-        elif MEM_BYTE <= ty <= MEM_ARRAY:
-            col = COLOR_DATA.val
+        if ty == MEM_CODE and not self.ctx.is_dump and \
+                ad not in self._binary.imports:
+            # It means that in decompilation mode we don't want to print
+            # labels with "loc_ADDR:", but we want to print them if they are
+            # referenced in an instruction, example : mov eax, loc_ADDR
+            if l.startswith("loc_"):
+                if print_colon:
+                    return False
+                l = hex(ad)
 
         if print_colon:
             l += ":"
@@ -302,10 +288,7 @@ class OutputAbs():
 
         # If it's a label
         if print_colon and ty == MEM_ARRAY:
-            entry_type = self._dis.mem.get_array_entry_type(ad)
-            sz_entry = self._dis.mem.get_size_from_type(entry_type)
-            n = int(self._dis.mem.get_size(ad) / sz_entry)
-            self._internal_comment(" ; [%d]" % n)
+            self._internal_comment(" ; [%d]" % nb_entries)
 
         return True
 
@@ -521,7 +504,7 @@ class OutputAbs():
             ty = self._dis.mem.get_type(imm)
             # ty == -1 : from the terminal (with -x) there are no xrefs if
             # the file was loaded without a database.
-            if ty == MEM_HEAD and self._dis.mem.get_type(
+            if ty == -1 and self._dis.mem.get_type(
                     self._dis.mem.get_head_addr(imm)) == MEM_ASCII:
                 ty = MEM_ASCII
 
@@ -591,7 +574,7 @@ class OutputAbs():
 
 
     def set_line(self, addr):
-        l = len(self.token_lines) - 1
+        l = self.first_line + len(self.token_lines) - 1
         self.line_addr[l] = addr
         if addr not in self.addr_line or l < self.addr_line[addr]:
             self.addr_line[addr] = l
@@ -684,10 +667,11 @@ class OutputAbs():
 
 
     def join_lines(self):
-        # Join all lines
+        # Join all lines (only the remaining lines in streaming mode)
         for i, l in enumerate(self.lines):
             self.lines[i] = "".join(self.lines[i])
             sz = len(self.lines[i])
+            i += self.first_line
             if i not in self.idx_tok_inline_comm:
                 self.idx_tok_inline_comm[i] = (sz + 1, len(l))
 
@@ -773,16 +757,35 @@ class OutputAbs():
             not self.ctx.is_dump and i.address in self.ctx.gph.exit_or_ret
 
 
+    def __line_str(self, tokens):
+        if not self.gctx.color:
+            return "".join(string for (string, col, is_bold) in tokens)
+        buf = []
+        for (string, col, is_bold) in tokens:
+            if col != 0:
+                string = color(string, col)
+            if is_bold:
+                string = bold(string)
+            buf.append(string)
+        return "".join(buf)
+
+
+    # Write the n first remaining lines to the sink
+    def __flush_lines(self, n):
+        self.sink.write("".join(self.__line_str(l) + "\n"
+                                for l in self.token_lines[:n]))
+        del self.token_lines[:n]
+        del self.lines[:n]
+        self.first_line += n
+
+
     def print(self):
+        if self.sink is not None:
+            self.__flush_lines(len(self.token_lines))
+            self.sink.flush()
+            return
         for l in self.token_lines:
-            for (string, col, is_bold) in l:
-                if self.gctx.color:
-                    if col != 0:
-                        string = color(string, col)
-                    if is_bold:
-                        string = bold(string)
-                print_no_end(string)
-            print()
+            print(self.__line_str(l))
 
 
     def _pre_asm_inst(self, i, tab):
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+import pickle
+import multiprocessing
+
+from plasma.lib.consts import *
+from plasma.lib.memory import AddrIndex
+from plasma.lib.journal import TrackedDict
+from plasma.lib.utils import warning, debug__
+
+
+#
+# Parallel analysis
+#
+# The entries of a pass are split in shards, each shard is analyzed by a
+# forked process. A process runs the serial analyzer on its own copy of the
+# database, and for each call to analyze_flow it records the keys read and
+# the new values of the modified keys.
+#
+# Then the main process runs the serial pass again. When analyze_flow
+# should be called, the recorded result is used only if none of the keys
+# it has read or modified were changed differently in the main process
+# (by another shard or by a serial analysis). Otherwise the entry is
+# analyzed serially. So the database is the same as with the serial
+# analyzer, whatever the number of processes.
+#
+# Function ids are allocated locally by each process, they are renumbered
+# when the result is merged.
+#
+
+
+# Tables of Database used by the analyzer. The table mem is db.mem.mm.
+TABLES = [
+    "symbols", "demangled", "user_inline_comments",
+    "internal_inline_comments", "user_previous_comments",
+    "internal_previous_comments", "jmptables", "functions", "func_id",
+    "xrefs", "xrefs_from", "data_sub_xrefs", "imports", "immediates",
+    "inverted_cond", "end_functions", "reverse_symbols", "reverse_demangled",
+    "mem",
+]
+
+
+# Used in the main process, it remembers all modified keys.
+class WriteLogDict(TrackedDict):
+    def __setitem__(self, k, v):
+        TrackedDict.__setitem__(self, k, v)
+        self.written.add(k)
+
+
+    def __delitem__(self, k):
+        TrackedDict.__delitem__(self, k)
+        self.written.add(k)
+
+
+    def pop(self, k, *default):
+        self.written.add(k)
+        return TrackedDict.pop(self, k, *default)
+
+
+    def popitem(self):
+        k, v = TrackedDict.popitem(self)
+        self.written.add(k)
+        return k, v
+
+
+    def clear(self):
+        TrackedDict.clear(self)
+        self.wrote_all = True
+
+
+    def touch(self, k):
+        TrackedDict.touch(self, k)
+        self.written.add(k)
+
+
+# Used in the forked processes, it remembers also all keys read. A value
+# which can be modified in place (list or dict) is considered modified if
+# it was read.
+class RecordingDict(WriteLogDict):
+    def __getitem__(self, k):
+        self.reads.add(k)
+        return dict.__getitem__(self, k)
+
+
+    def __contains__(self, k):
+        self.reads.add(k)
+        return dict.__contains__(self, k)
+
+
+    def get(self, k, default=None):
+        self.reads.add(k)
+        return dict.get(self, k, default)
+
+
+    def pop(self, k, *default):
+        self.reads.add(k)
+        return WriteLogDict.pop(self, k, *default)
+
+
+    def setdefault(self, k, default=None):
+        self.reads.add(k)
+        return WriteLogDict.setdefault(self, k, default)
+
+
+    def __iter__(self):
+        self.read_all = True
+        return dict.__iter__(self)
+
+
+    def __len__(self):
+        self.read_all = True
+        return dict.__len__(self)
+
+
+    def keys(self):
+        self.read_all = True
+        return dict.keys(self)
+
+
+    def values(self):
+        self.read_all = True
+        return dict.values(self)
+
+
+    def items(self):
+        self.read_all = True
+        return dict.items(self)
+
+
+# Remembers the intervals of addresses read in Memory.index
+class RecordingIndex(AddrIndex):
+    def __iter__(self):
+        self.read_all = True
+        return AddrIndex.__iter__(self)
+
+
+    def __len__(self):
+        self.read_all = True
+        return AddrIndex.__len__(self)
+
+
+    def floor(self, ad):
+        i = AddrIndex.floor(self, ad)
+        self.intervals.append((max(i, 0), ad))
+        return i
+
+
+    def ceil(self, ad):
+        i = AddrIndex.ceil(self, ad)
+        self.intervals.append((ad, i if i != -1 else 0xffffffffffffffff))
+        return i
+
+
+    def range(self, start, end):
+        self.intervals.append((start, end - 1))
+        return AddrIndex.range(self, start, end)
+
+
+class Recorder():
+    def __init__(self, db, cls):
+        self.db = db
+        self.tables = {name: getattr(db, name) for name in TABLES[:-1]}
+        self.tables["mem"] = db.mem.mm
+        self.index = db.mem.index
+        self.cls = cls
+
+        for t in self.tables.values():
+            t.__class__ = cls
+        if cls is RecordingDict:
+            self.index.__class__ = RecordingIndex
+
+        self.begin()
+
+
+    def detach(self):
+        for t in self.tables.values():
+            t.__class__ = TrackedDict
+        self.index.__class__ = AddrIndex
+
+
+    def begin(self):
+        for t in self.tables.values():
+            t.written = set()
+            t.wrote_all = False
+            t.reads = set()
+            t.read_all = False
+        self.index.intervals = []
+        self.index.read_all = False
+
+
+    # Returns the keys modified since begin
+    def written(self):
+        res = {}
+        for name, t in self.tables.items():
+            if t.wrote_all:
+                res[name] = None
+            elif t.written:
+                res[name] = t.written
+        return res
+
+
+    # Returns the result of an analysis (only with RecordingDict). Values
+    # are pickled now because next analysis may modify them in place.
+    def result(self):
+        res = Result()
+        values = {}
+        deleted = {}
+
+        for name, t in self.tables.items():
+            if t.wrote_all:
+                res.valid = False
+                return res
+
+            if t.read_all and name != "func_id":
+                res.read_all.add(name)
+
+            keys = set(t.written)
+            for k in t.reads:
+                if isinstance(dict.get(t, k, None), (list, dict)):
+                    keys.add(k)
+
+            if name != "func_id":
+                reads = t.reads | keys
+                if reads:
+                    res.reads[name] = reads
+
+            if not keys:
+                continue
+
+            res.written[name] = keys
+            v = {}
+            d = []
+            for k in keys:
+                if dict.__contains__(t, k):
+                    v[k] = dict.__getitem__(t, k)
+                else:
+                    d.append(k)
+            if v:
+                values[name] = v
+            if d:
+                deleted[name] = d
+
+        res.data = pickle.dumps((values, deleted), pickle.HIGHEST_PROTOCOL)
+        res.intervals = self.index.intervals
+        if self.index.read_all:
+            res.read_all.add("mem")
+        return res
+
+
+class Result():
+    def __init__(self):
+        self.valid = True
+        self.reads = {} # table -> set of keys
+        self.read_all = set() # tables
+        self.intervals = [] # [(start, end)] addresses read in mem.index
+        self.written = {} # table -> set of keys modified
+        self.data = None # pickled ({table: {key: value}}, {table: [keys deleted]})
+        self.first_id = 0 # func ids allocated : [first_id, end_id[
+        self.end_id = 0
+
+
+# Keys of the database which have not the same value in the main
+# process and in the process of a shard.
+class Diverged():
+    def __init__(self):
+        self.keys = {} # table -> set
+        self.all = set() # tables
+        self.mem_index = AddrIndex()
+
+
+    def add(self, name, keys):
+        if keys is None:
+            self.all.add(name)
+            return
+        if name not in self.keys:
+            self.keys[name] = set()
+        self.keys[name].update(keys)
+        if name == "mem":
+            for k in keys:
+                self.mem_index.add(k)
+
+
+    def conflict(self, res):
+        for name in res.read_all:
+            if name in self.all or self.keys.get(name, None):
+                return True
+
+        for name, keys in res.reads.items():
+            if name in self.all:
+                return True
+            div = self.keys.get(name, None)
+            if div and not div.isdisjoint(keys):
+                return True
+
+        if "mem" in self.all:
+            return bool(res.intervals)
+
+        for start, end in res.intervals:
+            if self.mem_index.floor(end) >= start:
+                return True
+
+        return False
+
+
+# Set in the main process before the fork, used by the workers.
+_analyzer = None
+
+
+def run_shard(shard):
+    an = _analyzer
+    an.parallel = ShardWorker(an)
+    kind, items = shard
+
+    if kind == "entries":
+        for (ad, entry_is_func, force, add_if_code) in items:
+            an.analyze_entry(ad, entry_is_func, force, add_if_code)
+    elif kind == "ranges":
+        an.pass_detect_functions(items)
+
+    return an.parallel.results
+
+
+# Runs in a forked process
+class ShardWorker():
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.db = analyzer.db
+        self.rec = Recorder(self.db, RecordingDict)
+        self.results = []
+
+
+    def analyze(self, ad, entry_is_func, force, add_if_code):
+        self.rec.begin()
+        first_id = self.db.func_id_counter
+        self.analyzer.analyze_flow(ad, entry_is_func, force, add_if_code)
+        res = self.rec.result()
+        res.first_id = first_id
+        res.end_id = self.db.func_id_counter
+        self.results.append(((ad, entry_is_func, force, add_if_code), res))
+
+
+class ParallelAnalysis():
+    def __init__(self, analyzer, jobs):
+        self.analyzer = analyzer
+        self.db = analyzer.db
+        self.jobs = jobs
+
+
+    # Split the list of tuples (ad, entry_is_func, force, add_if_code)
+    def split_entries(self, entries):
+        n = max(1, (len(entries) + self.jobs - 1) // self.jobs)
+        return [("entries", entries[i:i + n])
+                for i in range(0, len(entries), n)]
+
+
+    # Split the list of ranges [start, end[ in shards of the same size
+    def split_ranges(self, ranges):
+        total = sum(end - start for start, end in ranges)
+        n = max(1, (total + self.jobs - 1) // self.jobs)
+        shards = []
+        cur = []
+        size = 0
+        for start, end in ranges:
+            while start < end:
+                sz = min(end - start, n - size)
+                cur.append((start, start + sz))
+                start += sz
+                size += sz
+                if size == n:
+                    shards.append(("ranges", cur))
+                    cur = []
+                    size = 0
+        if cur:
+            shards.append(("ranges", cur))
+        return shards
+
+
+    # Analyze shards in parallel, then call serial_pass which must do
+    # the same work than the shards and call analyzer.analyze_entry.
+    def run(self, shards, serial_pass):
+        global _analyzer
+
+        if len(shards) <= 1:
+            serial_pass()
+            return
+
+        self.rec = Recorder(self.db, WriteLogDict)
+        self.analyzer.parallel = None
+        _analyzer = self.analyzer
+
+        try:
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(len(shards), maxtasksperchild=1) as pool:
+                out = pool.map(run_shard, shards, chunksize=1)
+        except Exception as e:
+            warning("parallel analysis failed (%s), run the serial analysis" % e)
+            self.rec.detach()
+            _analyzer = None
+            serial_pass()
+            return
+
+        _analyzer = None
+
+        self.spec = {}
+        for i, results in enumerate(out):
+            for key, res in results:
+                if key not in self.spec:
+                    self.spec[key] = (i, res)
+
+        self.diverged = [Diverged() for i in range(len(shards))]
+        self.func_ids = [{} for i in range(len(shards))] # local -> id
+        self.nb_merged = 0
+        self.nb_serial = 0
+
+        self.analyzer.parallel = self
+        try:
+            serial_pass()
+        finally:
+            self.analyzer.parallel = None
+            self.rec.detach()
+
+        debug__("parallel analysis: %d merged, %d serial" %
+                (self.nb_merged, self.nb_serial))
+
+
+    def __add_diverged(self, written, skip=-1):
+        for i, d in enumerate(self.diverged):
+            if i != skip:
+                for name, keys in written.items():
+                    d.add(name, keys)
+
+
+    def analyze(self, ad, entry_is_func, force, add_if_code):
+        # Modifications done outside of analyze (by the user for example)
+        self.__add_diverged(self.rec.written())
+
+        key = (ad, entry_is_func, force, add_if_code)
+        if key in self.spec:
+            i, res = self.spec.pop(key)
+            if res.valid and not self.diverged[i].conflict(res):
+                self.__merge(i, res)
+                self.nb_merged += 1
+                self.rec.begin()
+                return
+
+            # The process of this shard has now a different database
+            for name, keys in res.written.items():
+                self.diverged[i].add(name, keys)
+
+        self.rec.begin()
+        self.analyzer.analyze_flow(ad, entry_is_func, force, add_if_code)
+        self.__add_diverged(self.rec.written())
+        self.rec.begin()
+        self.nb_serial += 1
+
+
+    def __merge(self, i, res):
+        func_ids = self.func_ids[i]
+        for local in range(res.first_id, res.end_id):
+            func_ids[local] = self.db.func_id_counter
+            self.db.func_id_counter += 1
+
+        mem = self.db.mem
+        written = {}
+        values, deleted = pickle.loads(res.data)
+
+        # Sorted keys of some tables
+        indexes = {
+            "mem": mem.index,
+            "xrefs": self.db.xref_store.to_index,
+            "xrefs_from": self.db.xref_store.from_index,
+        }
+
+        for name, values in values.items():
+            t = self.rec.tables[name]
+            changed = []
+
+            for k, v in values.items():
+                if name == "mem":
+                    if len(v) > 2 and (v[1] == MEM_CODE or v[1] == MEM_FUNC):
+                        v[2] = func_ids.get(v[2], v[2])
+                elif name == "functions":
+                    if v is not None:
+                        v[FUNC_ID] = func_ids.get(v[FUNC_ID], v[FUNC_ID])
+                elif name == "func_id":
+                    k = func_ids.get(k, k)
+
+                if dict.__contains__(t, k):
+                    if dict.__getitem__(t, k) == v:
+                        continue
+                elif name in indexes:
+                    indexes[name].add(k)
+
+                TrackedDict.__setitem__(t, k, v)
+                changed.append(k)
+
+            written[name] = changed
+
+        for name, keys in deleted.items():
+            t = self.rec.tables[name]
+            changed = written.setdefault(name, [])
+            for k in keys:
+                if dict.__contains__(t, k):
+                    TrackedDict.__delitem__(t, k)
+                    if name in indexes:
+                        indexes[name].remove(k)
+                    changed.append(k)
+
+        self.__add_diverged(written, skip=i)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+from array import array
+from bisect import bisect_left
+
+
+#
+# Instruction table built by a linear sweep of the executable sections.
+# Only the address, the size, the kind and the branch target of each
+# instruction are kept (no capstone objects). The sweep uses disasm_lite,
+# so the kind is computed once per mnemonic with a detailed instruction.
+#
+# An address which is not the start of an instruction of the sweep (data
+# inside the code, overlapping instructions) is not in the table : the
+# caller must use Disassembler.lazy_disasm.
+#
+# The table is used by the memory scan of the analyzer (has_prolog and
+# first_inst_are_code), which only needs the size of instructions and if
+# they are null bytes. The flow analysis, get_graph and dump_asm need the
+# operands, they always build capstone instructions.
+#
+# Only x86 is supported : on ARM and MIPS the kind of an instruction
+# depends on its operands.
+#
+
+INST_RET         = 1
+INST_UNCOND_JUMP = 2
+INST_COND_JUMP   = 4
+INST_CALL        = 8
+INST_NULL        = 16 # all bytes are null
+
+SWEEP_BLOCK_SIZE = 4096
+
+
+class InstTable():
+    def __init__(self, dis):
+        self.dis = dis
+        self.utils = dis.load_arch_module().utils
+        self.addr = array("Q")
+        self.size = array("B")
+        self.kind = array("H")
+        self.target = array("q") # -1 if it's not an immediate
+        self.kinds = [] # kind -> flags
+        self.kind_ids = {} # mnemonic or (INST_NULL, kind) -> kind
+
+
+    def __len__(self):
+        return len(self.addr)
+
+
+    def __get_kind(self, mnemonic, ad, buf):
+        k = self.kind_ids.get(mnemonic, -1)
+        if k != -1:
+            return k
+
+        flags = 0
+        i = next(self.dis.md.disasm(buf, ad))
+        if self.utils.is_ret(i):
+            flags |= INST_RET
+        elif self.utils.is_uncond_jump(i):
+            flags |= INST_UNCOND_JUMP
+        elif self.utils.is_cond_jump(i):
+            flags |= INST_COND_JUMP
+        elif self.utils.is_call(i):
+            flags |= INST_CALL
+
+        k = len(self.kinds)
+        self.kinds.append(flags)
+        self.kind_ids[mnemonic] = k
+        return k
+
+
+    def sweep(self, s):
+        # Don't copy the section, capstone wants bytes for each block
+        data = s.data[:min(s.real_size, s.virt_size)]
+        md = self.dis.md_lite
+        branch = INST_UNCOND_JUMP | INST_COND_JUMP | INST_CALL
+        off = 0
+
+        while off < len(data):
+            last = off
+
+            blk = bytes(data[off:off + SWEEP_BLOCK_SIZE])
+
+            for (ad, size, mnemonic, op_str) in \
+                    md.disasm_lite(blk, s.start + off):
+                buf = blk[off - last:off - last + size]
+                k = self.__get_kind(mnemonic, ad, buf)
+                flags = self.kinds[k]
+
+                target = -1
+                if flags & branch:
+                    try:
+                        target = int(op_str, 16)
+                        # Signed like capstone immediates
+                        if target >= 1 << 63:
+                            target -= 1 << 64
+                    except ValueError:
+                        pass
+
+                if buf.count(0) == size:
+                    k = self.__null_kind(k)
+
+                self.addr.append(ad)
+                self.size.append(size)
+                self.kind.append(k)
+                self.target.append(target)
+                off += size
+
+            # Invalid instruction, restart on the next byte. Otherwise
+            # the last instruction of the block was truncated.
+            if off == last:
+                off += 1
+
+
+    def __null_kind(self, k):
+        name = (INST_NULL, k)
+        n = self.kind_ids.get(name, -1)
+        if n == -1:
+            n = len(self.kinds)
+            self.kinds.append(self.kinds[k] | INST_NULL)
+            self.kind_ids[name] = n
+        return n
+
+
+    # Returns the index of the instruction at ad or -1
+    def find(self, ad):
+        i = bisect_left(self.addr, ad)
+        if i != len(self.addr) and self.addr[i] == ad:
+            return i
+        return -1
+
+
+    # Returns a tuple (size, flags, target) or None
+    def get(self, ad):
+        i = self.find(ad)
+        if i == -1:
+            return None
+        return (self.size[i], self.kinds[self.kind[i]], self.target[i])
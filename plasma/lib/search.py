@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re
+from bisect import bisect_left, bisect_right
+from threading import Thread
+
+from plasma.lib.consts import *
+from plasma.lib.journal import TrackedDict
+from plasma.lib.signatures import parse_signature
+
+
+#
+# Search engine of the visual (/, n, N and R). A query is :
+#
+#   text          ascii string
+#   !ab 13 ?? 42  bytes in hexa, ?? matches any byte
+#   u:text        utf-16 (little endian) string
+#   re:REGEX      regex on the bytes
+#   #VALUE        immediate in the code (operands and computed
+#                 immediates of the analyzer), ex: #0x1000 or #-8. The
+#                 sign must match : #-8 finds [rbp - 8] but not [rbp + 8]
+#                 or 0xfffffff8.
+#   @REGEX        regex on the instructions of the code ("mnemonic op_str")
+#
+# The search runs in a thread : the visual polls the keyboard to cancel it
+# (see Disasmbox.main_cmd_search). All hits are returned as a sorted list
+# of addresses (at most SEARCH_MAX_HITS), lists are cached, so n/N only do
+# a bisect. Hits in the bytes never change, hits in the code depend on
+# the database and are valid until TrackedDict.version is modified.
+#
+# There is no lock with the analyzer : if it runs during a search in the
+# code, the memory can change while it's read and some instructions may
+# be missed. These hits are still returned (SearchEngine.hits), but the
+# version has changed so the cached list is dropped and the next search
+# scans again.
+#
+# Sections are scanned by blocks of SEARCH_BLOCK_SIZE bytes (the thread
+# can be stopped between two blocks). A regex match which starts in a
+# block and is longer than SEARCH_OVERLAP bytes is not found.
+#
+
+SEARCH_BLOCK_SIZE = 1024 * 1024
+SEARCH_OVERLAP = 256
+
+QUERY_BYTES = 0
+QUERY_IMM = 1
+QUERY_INST = 2
+
+# The sign can be separated by a space : [rbp - 8]
+RE_OPERAND_INT = re.compile(r"(?<![\w.])(-\s*)?(0x[0-9a-fA-F]+|\d+)\b")
+
+
+# Returns a tuple (kind, pattern), it raises ValueError if the query is
+# not valid.
+def parse_query(text):
+    if text.startswith("!"):
+        pattern = parse_signature(text[1:].split())
+        if pattern is None:
+            raise ValueError("search not in hexa")
+        return (QUERY_BYTES, re.compile(pattern, re.DOTALL))
+
+    if text.startswith("u:"):
+        s = text[2:].encode("utf-16-le")
+        return (QUERY_BYTES, re.compile(re.escape(s)))
+
+    if text.startswith("re:"):
+        try:
+            return (QUERY_BYTES, re.compile(text[3:].encode(), re.DOTALL))
+        except re.error as e:
+            raise ValueError("bad regex (%s)" % e)
+
+    if text.startswith("#"):
+        try:
+            return (QUERY_IMM, int(text[1:], 0))
+        except ValueError:
+            raise ValueError("bad immediate")
+
+    if text.startswith("@"):
+        try:
+            return (QUERY_INST, re.compile(text[1:]))
+        except re.error as e:
+            raise ValueError("bad regex (%s)" % e)
+
+    return (QUERY_BYTES, re.compile(re.escape(text.encode())))
+
+
+class SearchEngine():
+    def __init__(self, gctx):
+        self.dis = gctx.dis
+        self.db = gctx.db
+        self.cache = {} # text -> (version or -1, sorted list of hits)
+        self.thread = None
+        self.text = None # query of the current thread
+        self.stop = False
+        self.size_done = 0
+        self.size_total = 0
+        self.truncated = False
+        self.hits = None # result of the last thread, None if cancelled
+
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+
+    # Returns the list of hits if it's cached, otherwise None
+    def get_cached(self, text):
+        if text not in self.cache:
+            return None
+        version, hits = self.cache[text]
+        if version != -1 and version != TrackedDict.version:
+            del self.cache[text]
+            return None
+        return hits
+
+
+    # Start a search in a thread. It raises ValueError if the query is
+    # not valid. When the thread is finished, the hits are in the cache.
+    def start(self, text):
+        query = parse_query(text)
+        self.cancel()
+        self.stop = False
+        self.text = text
+        self.size_done = 0
+        self.size_total = sum(len(s.data) for s in self.dis.binary.iter_sections())
+        self.truncated = False
+        self.hits = None
+        self.thread = Thread(target=self.__run, args=(text, query), daemon=True)
+        self.thread.start()
+
+
+    def cancel(self):
+        if self.is_running():
+            self.stop = True
+            self.thread.join()
+        self.thread = None
+
+
+    # In percent
+    def progress(self):
+        if self.size_total == 0:
+            return 100
+        return self.size_done * 100 // self.size_total
+
+
+    def __run(self, text, query):
+        kind, pattern = query
+        if kind == QUERY_BYTES:
+            version = -1
+            hits = self.__search_bytes(pattern)
+        else:
+            version = TrackedDict.version
+            hits = self.__search_code(kind, pattern)
+        if hits is not None:
+            self.cache[text] = (version, hits)
+        self.hits = hits
+
+
+    def __search_bytes(self, regex):
+        hits = []
+        for s in self.dis.binary.iter_sections():
+            data = s.data
+            size = len(data)
+            pos = 0
+
+            while pos < size:
+                end = min(pos + SEARCH_BLOCK_SIZE + SEARCH_OVERLAP, size)
+                limit = pos + SEARCH_BLOCK_SIZE
+
+                for m in regex.finditer(data, pos, end):
+                    # It will be found in the next block
+                    if m.start() >= limit:
+                        break
+                    hits.append(s.start + m.start())
+
+                if len(hits) >= SEARCH_MAX_HITS:
+                    self.truncated = True
+                    return hits[:SEARCH_MAX_HITS]
+
+                self.size_done += min(limit, size) - pos
+                pos = limit
+
+                if self.stop:
+                    return None
+
+        return hits
+
+
+    def __search_code(self, kind, pattern):
+        dis = self.dis
+        mem = self.db.mem
+        immediates = self.db.immediates
+
+        # Use another capstone object : the analyzer can run at the same
+        # time.
+        md = dis.capstone.Cs(dis.md.arch, dis.md.mode)
+        md.detail = False
+
+        hits = []
+        for s in self.dis.binary.iter_sections():
+            data = s.data
+            size = len(data)
+            # If the index is modified by the analyzer at the same time,
+            # some addresses can be missing or listed twice.
+            heads = mem.index.range(s.start, s.start + size)
+            done = 0
+            prev = -1
+
+            for n, ad in enumerate(heads):
+                if n % 4096 == 0:
+                    if self.stop:
+                        return None
+                    off = ad - s.start
+                    self.size_done += off - done
+                    done = off
+
+                if ad == prev or not mem.is_code(ad):
+                    continue
+                prev = ad
+
+                off = ad - s.start
+                buf = bytes(data[off:off + 16])
+
+                for (_, _, mnemonic, op_str) in md.disasm_lite(buf, ad, 1):
+                    if kind == QUERY_IMM:
+                        found = immediates.get(ad, None) == pattern
+                        if not found:
+                            for sign, tok in RE_OPERAND_INT.findall(op_str):
+                                if tok.startswith("0x"):
+                                    v = int(tok, 16)
+                                else:
+                                    v = int(tok)
+                                if sign:
+                                    v = -v
+                                if v == pattern:
+                                    found = True
+                                    break
+                    else:
+                        found = pattern.search(
+                                "%s %s" % (mnemonic, op_str)) is not None
+
+                    if found:
+                        hits.append(ad)
+                        if len(hits) >= SEARCH_MAX_HITS:
+                            self.truncated = True
+                            return hits
+
+            self.size_done += size - done
+
+        return hits
+
+
+# Returns the first hit after ad (or before if not forward), None if
+# there is no hit.
+def next_hit(hits, ad, forward=True):
+    if forward:
+        i = bisect_right(hits, ad)
+        return hits[i] if i < len(hits) else None
+    i = bisect_left(hits, ad)
+    return hits[i - 1] if i > 0 else None
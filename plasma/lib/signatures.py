@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re
+
+from plasma.lib.utils import warning
+
+
+#
+# Search of function starts used by Analyzer.pass_detect_functions.
+#
+# All prologs (ARCH_UTILS.PROLOGS) and user signatures are compiled in
+# one regex, each section is scanned once. For the prologs, it returns
+# only candidates : Analyzer.has_prolog must be called to check the
+# second instruction.
+#
+# On MIPS and ARM, prologs are written as big endian words, so in little
+# endian they are matched on the reversed word.
+#
+# A signature file contains one pattern per line, bytes are in hex and
+# ?? matches any byte. Everything after # is a comment :
+#
+#   55 48 89 e5          # push rbp; mov rbp, rsp
+#   f3 0f 1e fa 55 ?? 89 # endbr64; push rbp; mov ?bp, ?sp
+#
+# Signatures are matched in the memory order and an address matched by
+# a signature is always a function.
+#
+
+
+def load_signatures(filename):
+    res = []
+    with open(filename) as f:
+        for n, line in enumerate(f):
+            line = line.split("#", 1)[0].split()
+            if not line:
+                continue
+            pattern = parse_signature(line)
+            if pattern is None:
+                warning("%s:%d: bad signature" % (filename, n + 1))
+                continue
+            res.append(pattern)
+    return res
+
+
+# Returns a regex (bytes) or None
+def parse_signature(tokens):
+    pattern = []
+    for t in tokens:
+        if t == "??":
+            pattern.append(b".")
+            continue
+        try:
+            by = int(t, 16)
+        except ValueError:
+            return None
+        if len(t) != 2:
+            return None
+        pattern.append(re.escape(bytes([by])))
+    return b"".join(pattern)
+
+
+class FunctionMatcher():
+    def __init__(self, prologs, signatures, reverse_words):
+        alt = []
+        for lst in prologs:
+            for p in lst:
+                if len(p) > 4:
+                    continue
+                if reverse_words:
+                    alt.append(b".{%d}" % (4 - len(p)) + re.escape(p[::-1]))
+                else:
+                    alt.append(re.escape(p))
+
+        self.prolog_re = None
+        if alt:
+            self.prolog_re = re.compile(
+                    b"(?=" + b"|".join(alt) + b")", re.DOTALL)
+
+        self.signature_re = None
+        if signatures:
+            self.signature_re = re.compile(
+                    b"(?=" + b"|".join(signatures) + b")", re.DOTALL)
+
+        self.cache = {} # section start -> (candidates, signature hits)
+
+
+    # Returns a tuple (sorted list of candidates, set of addresses
+    # matched by a signature).
+    def find(self, s):
+        if s.start in self.cache:
+            return self.cache[s.start]
+
+        data = s.data
+        found = set()
+        hits = set()
+
+        if self.prolog_re is not None:
+            for m in self.prolog_re.finditer(data):
+                found.add(s.start + m.start())
+
+        if self.signature_re is not None:
+            for m in self.signature_re.finditer(data):
+                hits.add(s.start + m.start())
+
+        res = (sorted(found | hits), hits)
+        self.cache[s.start] = res
+        return res
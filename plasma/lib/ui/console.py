@@ -54,6 +54,14 @@ EXPORTED_SYMBOLS = {
     "MEM_ASCII": MEM_ASCII,
     "MEM_ARRAY": MEM_ARRAY,
     "MEM_HEAD": MEM_HEAD,
+    "XREF_UNK": XREF_UNK,
+    "XREF_CALL": XREF_CALL,
+    "XREF_JUMP": XREF_JUMP,
+    "XREF_JMPTABLE": XREF_JMPTABLE,
+    "XREF_READ": XREF_READ,
+    "XREF_WRITE": XREF_WRITE,
+    "XREF_OFFSET": XREF_OFFSET,
+    "XREF_NAMES": XREF_NAMES,
 }
 
 COMMANDS_ALPHA = [
@@ -66,6 +74,7 @@ COMMANDS_ALPHA = [
     "hexdump",
     "history",
     "info",
+    "inst_cache",
     "jmptable",
     "memmap",
     "mips_set_gp",
@@ -338,10 +347,15 @@ class Console():
                 "Navigation:",
                 "|       split the window",
                 "j       jump to an address or a symbol",
-                "/       binary search: if the first char is ! you can put an",
-                "        hexa string example: /!ab 13 42",
-                "        the search is case sensitive.",
+                "/       search (case sensitive), escape to cancel:",
+                "        /text         ascii string",
+                "        /!ab 13 ?? 42 hexa string, ?? is any byte",
+                "        /u:text       utf-16 string",
+                "        /re:REGEX     regex on the bytes",
+                "        /#0x1000      immediate in the code",
+                "        /@REGEX       regex on instructions, ex: /@^call.*rax",
                 "n/N     next/previous search occurence",
+                "R       list of all occurences of the last search",
                 "g       top",
                 "G       bottom",
                 "z       set current line on the middle",
@@ -428,6 +442,17 @@ class Console():
                 ]
             ),
 
+            "inst_cache": Command(
+                1, 0,
+                self.__exec_inst_cache,
+                None,
+                [
+                "[CAPACITY]",
+                "Statistics of the instruction cache. If CAPACITY is given,",
+                "set the maximum number of instructions in the cache.",
+                ]
+            ),
+
             "jmptable": Command(
                 4, 4,
                 self.__exec_jmptable,
@@ -516,6 +541,7 @@ class Console():
         self.api = Api(gctx, self.analyzer)
         gctx.api = self.api
         self.analyzer.set(gctx, arch_analyzer)
+        self.db.journal_autosave = True
 
         self.gctx.dis.binary.api = self.api
 
@@ -541,6 +567,9 @@ class Console():
                 break
 
         self.analyzer.msg.put("exit")
+        self.analyzer.join()
+        # The user doesn't want to save
+        self.db.discard_autosave()
 
 
     def check_db_modified(self):
@@ -688,27 +717,24 @@ class Console():
 
 
     def push_analyze_symbols(self, args):
-        # Analyze all imports (it checks if functions return or not)
-        for ad in self.db.imports:
-            if ad in self.db.functions and self.db.functions[ad] is None:
-                self.analyzer.msg.put((ad, True, True, False, None))
-
-        # Analyze entry point
-        ep = self.gctx.dis.binary.get_entry_point()
-        if ep is not None:
-            self.analyzer.msg.put((ep, True, True, False, None))
+        entries, static = self.analyzer.symbol_entries()
 
+        self.__push_entries(entries)
         self.analyzer.msg.put("rename_entry_point")
 
-        # Analyze static functions
-        for ad in self.db.reverse_symbols:
-            if ad not in self.db.imports and \
-                    ad in self.db.functions and self.db.functions[ad] is None:
-                self.analyzer.msg.put((ad, True, False, False, None))
-
+        self.__push_entries(static)
         self.analyzer.msg.put("pass_scan_mem")
 
 
+    def __push_entries(self, entries):
+        # With several processes, all entries are analyzed in parallel
+        if self.gctx.jobs > 1:
+            self.analyzer.msg.put(entries)
+        else:
+            for e in entries:
+                self.analyzer.msg.put(e + (None,))
+
+
     def __exec_rename(self, args):
         if args[1] == args[2]:
             return
@@ -800,6 +826,7 @@ class Console():
                 wdgt = self.visual_last_widgets[i]
 
         v = Visual(self.gctx, ad, self.analyzer, self.api, wdgt)
+        self.gctx.dis.capstone_inst.unpin()
 
         if v.error_occurs:
             return
@@ -872,6 +899,28 @@ class Console():
             print("Endianess: little endian")
 
 
+    def __exec_inst_cache(self, args):
+        cache = self.gctx.dis.capstone_inst
+
+        if len(args) == 2:
+            try:
+                capacity = int(args[1])
+            except ValueError:
+                error("bad capacity")
+                return
+            if capacity <= 0:
+                error("the capacity must be positive")
+                return
+            cache.set_capacity(capacity)
+
+        total = cache.hits + cache.misses
+        ratio = cache.hits * 100 / total if total else 0
+        print("instructions: %d / %d" % (len(cache), cache.capacity))
+        print("hits: %d (%.1f%%)" % (cache.hits, ratio))
+        print("misses:", cache.misses)
+        print("evictions:", cache.evictions)
+
+
     def __exec_save(self, args):
         self.db.save(self.comp.get_history())
         print("database saved to", self.db.path)
@@ -912,9 +961,8 @@ class Console():
     def __exec_mips_set_gp(self, args):
         self.gctx.dis.mips_gp = int(args[1], 16)
         self.db.mips_gp = self.gctx.dis.mips_gp
-        self.db.mem.mm.clear()
-        self.db.xrefs.clear()
-        self.db.data_sub_xrefs.clear()
+        self.db.mem.clear()
+        self.db.xref_store.clear()
         self.db.immediates.clear()
         self.db.modified = True
 
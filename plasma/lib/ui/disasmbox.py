@@ -19,7 +19,7 @@
 
 import curses
 import traceback
-import binascii
+from bisect import bisect_left
 
 from plasma.lib.utils import error, die
 from plasma.lib.custom_colors import *
@@ -28,6 +28,7 @@ from plasma.lib.ui.utils import *
 from plasma.lib.ui.listbox import Listbox
 from plasma.lib.ui.inlineed import InlineEd
 from plasma.lib.output import OutputAbs
+from plasma.lib.search import next_hit
 
 
 X86_REG_HIGHLIGHT_64 = ["rax", "rbx", "rcx", "rdx", "rdi", "rsi", "rsp", "rbp"]
@@ -53,6 +54,7 @@ class Disasmbox(Listbox):
         self.analyzer = analyzer
         self.api = api
         self.last_curr_line_ad = None
+        self.last_addr = -1
 
         # Disassemble
 
@@ -83,9 +85,9 @@ class Disasmbox(Listbox):
         Listbox.__init__(self, x, y, w, h, self.ctx.output)
         self.height = h - 1
 
-        # Last/first address printed (only in MODE_DUMP)
-        self.set_last_addr()
+        # First/last address printed (only in MODE_DUMP)
         self.set_first_addr()
+        self.set_last_addr()
 
         self.stack = []
         self.saved_stack = []
@@ -111,6 +113,7 @@ class Disasmbox(Listbox):
             b"/": self.main_cmd_search,
             b"n": self.main_cmd_search_forward,
             b"N": self.main_cmd_search_backward,
+            b"R": self.main_cmd_search_results,
             b"j": self.main_cmd_jump_to,
             b"F": self.main_cmd_functions,
             b"i": self.main_cmd_invert_cond,
@@ -221,23 +224,7 @@ class Disasmbox(Listbox):
         if self.first_addr == self.dis.binary.get_first_addr():
             return wy
 
-        # Get an address 256 bytes before, we can't guess the number of lines
-        # we wan't to disassemble.
-        ad = self.first_addr
-        s = self.dis.binary.get_section(ad)
-        rest = 256
-        while rest:
-            ad -= rest
-            if ad >= s.start:
-                break
-            rest = s.start - ad
-            start = s.start
-            s = self.dis.binary.get_prev_section(start)
-            if s is None:
-                ad = start
-                break
-            ad = s.end + 1
-
+        ad = self.__addr_before(self.first_addr)
         self.ctx = self.gctx.get_addr_context(ad)
         o = self.ctx.dump_asm(until=self.first_addr)
 
@@ -257,26 +244,20 @@ class Disasmbox(Listbox):
                 wy += nb_new_lines
                 self.win_y += nb_new_lines
 
-            # Update line counter on each line
-
-            self.output.lines = o.lines + self.output.lines
-            self.output.token_lines = o.token_lines + self.output.token_lines
-
-            for ad, l in self.output.addr_line.items():
-                o.line_addr[nb_new_lines + l] = ad
-                o.addr_line[ad] = nb_new_lines + l
-                if l in self.output.idx_tok_inline_comm:
-                    o.idx_tok_inline_comm[nb_new_lines + l] = \
-                            self.output.idx_tok_inline_comm[l]
-
-            self.output.line_addr.clear()
-            self.output.addr_line.clear()
-            self.output.idx_tok_inline_comm.clear()
-            self.output.line_addr = o.line_addr
-            self.output.addr_line = o.addr_line
-            self.output.idx_tok_inline_comm = o.idx_tok_inline_comm
-            self.token_lines = self.output.token_lines
+            # Drop the lines at the bottom if the window is too big
+            nb_lines = len(self.output.lines)
+            end = nb_lines
+            if nb_new_lines + nb_lines > NB_LINES_VISUAL:
+                end = self.__item_first_line(max(
+                    NB_LINES_VISUAL - nb_new_lines,
+                    self.win_y + self.height + 10 - nb_new_lines))
+                if end <= 0:
+                    end = nb_lines
+
+            self.__set_lines([(o, 0, nb_new_lines), (self.output, 0, end)])
             self.set_first_addr()
+            if end != nb_lines:
+                self.set_last_addr()
 
         return wy
 
@@ -284,10 +265,10 @@ class Disasmbox(Listbox):
     def dump_update_bottom(self, wy):
         if wy < len(self.token_lines) - self.height - 10 or \
                 self.mode != MODE_DUMP:
-            return
+            return wy
 
         if self.last_addr - 1 == self.dis.binary.get_last_addr():
-            return
+            return wy
 
         ad = self.last_addr
 
@@ -295,19 +276,96 @@ class Disasmbox(Listbox):
         o = self.ctx.dump_asm()
 
         if o is not None:
-            nb_new_lines = len(self.output.lines)
+            nb_lines = len(self.output.lines)
+
+            # Drop the lines at the top if the window is too big
+            start = 0
+            if nb_lines + len(o.lines) > NB_LINES_VISUAL:
+                start = self.__item_first_line(
+                        nb_lines + len(o.lines) - NB_LINES_VISUAL)
+                if start == -1 or start > min(wy, self.win_y):
+                    start = 0
+
+            self.__set_lines([(self.output, start, nb_lines),
+                              (o, 0, len(o.lines))])
+            wy -= start
+            self.win_y -= start
+            self.set_last_addr()
+            if start != 0:
+                self.set_first_addr()
 
-            self.output.lines += o.lines
-            self.output.token_lines += o.token_lines
+        return wy
 
-            for l in o.line_addr:
-                self.output.line_addr[nb_new_lines + l] = o.line_addr[l]
-                self.output.addr_line[o.line_addr[l]] = nb_new_lines + l
-                if l in self.output.idx_tok_inline_comm:
-                    self.output.idx_tok_inline_comm[nb_new_lines + l] = \
-                            o.idx_tok_inline_comm[l]
 
-            self.set_last_addr()
+    # Returns the address of the item NB_LINES_TO_DISASM items before ad,
+    # each item is printed at least on one line. The heads are searched
+    # in the index of the memory (an unknown byte is an item), so it
+    # doesn't depend on the size of the section.
+    def __addr_before(self, ad):
+        mem = self.db.mem
+        binary = self.dis.binary
+        s = binary.get_section(ad)
+
+        for i in range(NB_LINES_TO_DISASM):
+            if ad == s.start:
+                prev = binary.get_prev_section(ad)
+                if prev is None:
+                    break
+                s = prev
+                ad = s.end + 1
+            ad = max(mem.get_head_addr(ad - 1), s.start)
+
+        return ad
+
+
+    # Returns the first line (>= line) of an item : the line where the
+    # address of an item is printed for the first time, with the lines
+    # before which have no address (labels, comments, empty lines). It
+    # returns -1 if there is no item after line.
+    def __item_first_line(self, line):
+        o = self.output
+        n = len(o.lines)
+        while line < n:
+            ad = o.line_addr.get(line, None)
+            if ad is not None and o.addr_line[ad] == line:
+                break
+            line += 1
+        else:
+            return -1
+        while line > 0 and line - 1 not in o.line_addr:
+            line -= 1
+        return line
+
+
+    # Replace the lines of the output by the concatenation of parts, a
+    # list of (output, start, end) where [start, end[ are line numbers.
+    # The cost depends only on the size of the window.
+    def __set_lines(self, parts):
+        lines = []
+        token_lines = []
+        line_addr = {}
+        addr_line = {}
+        idx_tok_inline_comm = {}
+
+        for o, start, end in parts:
+            n = len(lines) - start
+            lines += o.lines[start:end]
+            token_lines += o.token_lines[start:end]
+            for l in range(start, end):
+                ad = o.line_addr.get(l, None)
+                if ad is not None:
+                    line_addr[n + l] = ad
+                    if ad not in addr_line:
+                        addr_line[ad] = n + l
+                if l in o.idx_tok_inline_comm:
+                    idx_tok_inline_comm[n + l] = o.idx_tok_inline_comm[l]
+
+        self.output.lines = lines
+        self.output.token_lines = token_lines
+        self.output.line_addr = line_addr
+        self.output.addr_line = addr_line
+        self.output.idx_tok_inline_comm = idx_tok_inline_comm
+        self.token_lines = token_lines
 
 
     def get_y_scroll(self):
@@ -402,6 +460,7 @@ class Disasmbox(Listbox):
         ad = self.db.mem.get_head_addr(max(self.output.addr_line))
         ad += self.db.mem.get_size(ad)
         self.last_addr = ad
+        self.dis.pin_region(self.first_addr, self.last_addr)
 
 
     def set_first_addr(self):
@@ -409,6 +468,7 @@ class Disasmbox(Listbox):
             self.first_addr = min(self.output.addr_line)
         else:
             self.first_addr = self.ctx.entry
+        self.dis.pin_region(self.first_addr, self.last_addr)
 
 
     def exec_disasm(self, addr, dump_until=-1):
@@ -541,7 +601,46 @@ class Disasmbox(Listbox):
         return True
 
 
+    # Returns the list of hits or None if the search is cancelled or if
+    # the query is not valid. The keyboard is polled while the thread
+    # of the search is running.
+    def __run_search(self, text):
+        engine = self.gctx.search
+        hits = engine.get_cached(text)
+        if hits is not None:
+            self.search_text = text
+            return hits
+
+        try:
+            engine.start(text)
+        except ValueError as e:
+            self.status_bar_message("error: %s" % e, True)
+            return None
+
+        self.screen.timeout(100)
+        while engine.is_running():
+            self.status_bar_message("searching... %d%% (escape to cancel)" %
+                                    engine.progress(), True)
+            k = self.screen.getch()
+            if k == 0x1b:
+                engine.cancel()
+        self.screen.timeout(-1)
+
+        # Not from the cache : the analyzer may have modified the
+        # database during the search.
+        hits = engine.hits
+        if hits is None:
+            self.status_bar_message("search cancelled", True)
+        else:
+            self.search_text = text
+        return hits
+
+
     def __search(self, text, forward=True):
+        hits = self.__run_search(text)
+        if hits is None:
+            return False
+
         # Search the next line with an address
         line = self.win_y + self.cursor_y
         moved = False
@@ -549,50 +648,36 @@ class Disasmbox(Listbox):
             line += 1
             moved = True
 
+        ad = self.output.line_addr[line]
 
-        # Goto next line
-        if forward and not moved:
-            line += 1
-            while line not in self.output.line_addr:
-                line += 1
-            ad = self.db.mem.get_head_addr(self.output.line_addr[line])
-            ad += self.db.mem.get_size(ad)
+        if forward:
+            # Skip the current item
+            if not moved:
+                ad = self.db.mem.get_head_addr(ad)
+                ad += self.db.mem.get_size(ad)
+            hit = next_hit(hits, ad - 1, True)
         else:
-            ad = self.output.line_addr[line]
+            hit = next_hit(hits, ad, False)
 
-
-        s = self.dis.binary.get_section(ad)
-
-        if s is None:
+        if hit is None:
             self.status_bar_message("not found", True)
             return False
 
-        while 1:
-            off = ad - s.start
-
-            new_off = s.data.find(text, off) if forward \
-                      else s.data.rfind(text, 0, off)
-
-            if new_off != -1:
-                topush = self.__compute_curr_position()
-                self.saved_stack.clear()
-                self.stack.append(topush)
-                ad = self.db.mem.get_head_addr(s.start + new_off)
-                if not self.goto_address(ad):
-                    if self.exec_disasm(ad):
-                        self.cursor_y = 0
-                        self.win_y = 0
-                        self.goto_address(self.ctx.entry)
-                return True
-
-            s = self.dis.binary.get_next_section(ad) if forward \
-                else self.dis.binary.get_prev_section(ad)
-
-            if s is None:
-                self.status_bar_message("not found", True)
-                return False
+        topush = self.__compute_curr_position()
+        self.saved_stack.clear()
+        self.stack.append(topush)
+        ad = self.db.mem.get_head_addr(hit)
+        if not self.goto_address(ad):
+            if self.exec_disasm(ad):
+                self.cursor_y = 0
+                self.win_y = 0
+                self.goto_address(self.ctx.entry)
 
-            ad = ad = s.start if forward else s.end
+        self.draw()
+        self.status_bar_message("hit %d/%d%s" % (
+                bisect_left(hits, hit) + 1, len(hits),
+                " (truncated)" if len(hits) == SEARCH_MAX_HITS else ""))
+        return False
 
 
     def main_cmd_search(self):
@@ -602,31 +687,85 @@ class Disasmbox(Listbox):
         if not text:
             return True
 
-        if text[0] == "!":
-            try:
-                textenc = binascii.unhexlify(text[1:].replace(" ", ""))
-            except:
-                self.status_bar_message("error: search not in hexa", True)
-                return False
-        else:
-            textenc = text.encode()
-
-        if self.__search(textenc, forward=True):
-            self.search_bin = textenc
-            return True
-        return False
+        return self.__search(text, forward=True)
 
 
     def main_cmd_search_forward(self):
-        if self.search_bin is None:
+        if self.search_text is None:
             return False
-        return self.__search(self.search_bin, forward=True)
+        return self.__search(self.search_text, forward=True)
 
 
     def main_cmd_search_backward(self):
-        if self.search_bin is None:
+        if self.search_text is None:
+            return False
+        return self.__search(self.search_text, forward=False)
+
+
+    def main_cmd_search_results(self):
+        if self.search_text is None:
+            return False
+
+        hits = self.__run_search(self.search_text)
+        if hits is None:
+            return False
+        if not hits:
+            self.status_bar_message("not found", True)
             return False
-        return self.__search(self.search_bin, forward=False)
+
+        md = self.dis.md_lite
+        o = OutputAbs()
+        o._new_line()
+
+        for ad in hits:
+            o.set_line(ad)
+            o._add("0x%x " % ad)
+            s = self.dis.binary.get_section(ad)
+            o._comment(s.name.ljust(14))
+
+            if self.db.mem.is_code(ad):
+                fid = self.db.mem.get_func_id(ad)
+                if fid != -1:
+                    o._add(" %s" % self.api.get_symbol(self.db.func_id[fid]))
+                for (_, _, mnemonic, op_str) in \
+                        md.disasm_lite(bytes(s.read(ad, 16)), ad, 1):
+                    o._add(" %s %s" % (mnemonic, op_str))
+            else:
+                buf = s.read(ad, 16)
+                o._add(" " + " ".join("%.2x" % by for by in buf))
+                o._add("  ")
+                o._string("".join(chr(by) if 32 <= by < 127 else "."
+                                  for by in buf))
+            o._new_line()
+
+        (ret, line) = popup_listbox("%d hits for %s" % (len(hits), self.search_text),
+                                    o, self)
+
+        if not ret or line not in o.line_addr:
+            return True
+
+        # Goto the hit
+
+        ad = self.db.mem.get_head_addr(o.line_addr[line])
+        topush = self.__compute_curr_position()
+        self.cursor_x = 0
+
+        if self.goto_address(ad):
+            self.saved_stack.clear()
+            self.stack.append(topush)
+            return True
+
+        self.mode = MODE_DUMP
+        ret = self.exec_disasm(ad)
+        if ret:
+            self.cursor_y = 0
+            self.win_y = 0
+            self.saved_stack.clear()
+            self.stack.append(topush)
+            self.win_y = self.dump_update_up(self.win_y)
+            self.goto_address(ad)
+            self.main_cmd_line_middle()
+        return ret
 
 
     def view_inline_comment_editor(self):
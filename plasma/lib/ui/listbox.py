@@ -50,7 +50,7 @@ class Listbox(Widget):
             self.token_lines = output.token_lines
 
         self.search_hi = []
-        self.search_bin = None
+        self.search_text = None
         self.word_accepted_chars = ["_", "@", ".", "$", ":", "?"]
 
         # Note: all these functions should return a boolean. The value is true
@@ -305,7 +305,7 @@ class Listbox(Widget):
             wy = self.win_y + n
             y = self.cursor_y - n
 
-            self.dump_update_bottom(wy)
+            wy = self.dump_update_bottom(wy)
 
             if wy > len(self.token_lines) - self.height:
                 if wy < len(self.token_lines) - 3:
@@ -343,7 +343,7 @@ class Listbox(Widget):
 
 
     def dump_update_bottom(self, wy):
-        return
+        return wy
 
 
     def check_cursor_x(self):
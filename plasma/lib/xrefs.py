@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+#
+# PLASMA : Generate an indented asm code (pseudo-C) with colored syntax.
+# Copyright (C) 2015    Joel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.    See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.    If not, see <http://www.gnu.org/licenses/>.
+#
+
+from plasma.lib.consts import *
+from plasma.lib.memory import AddrIndex
+
+
+#
+# Cross references. The two directions are tables of the database, so
+# they are saved in the journal and merged by the parallel analysis :
+#
+#   db.xrefs       to -> [from, ...]
+#   db.xrefs_from  from -> [to_1, kind_1, to_2, kind_2, ...]
+#
+# kind is one of XREF_* (lib.consts). Values are flat lists of integers
+# to stay small. An instruction has rarely more than two xrefs, so
+# xrefs_from is checked to know if an xref already exists : the list of a
+# target can be very long (a function called from everywhere) and it's
+# scanned only when an xref is removed.
+#
+# For big data (arrays/strings) db.data_sub_xrefs keeps all addresses
+# with an xref inside the data (see lib.memory).
+#
+# The keys of the two tables are also kept sorted in an AddrIndex, so
+# all xrefs from a function or into a section are found without
+# iterating on the whole tables. Only this class modifies the tables,
+# except the parallel analysis which updates the indexes when it merges
+# a result.
+#
+
+class XrefStore():
+    def __init__(self, db):
+        self.db = db
+        self.to_index = AddrIndex()
+        self.from_index = AddrIndex()
+
+
+    # Called when the database is loaded
+    def rebuild(self):
+        self.to_index = AddrIndex(self.db.xrefs.keys())
+        self.from_index = AddrIndex(self.db.xrefs_from.keys())
+
+
+    def clear(self):
+        self.db.xrefs.clear()
+        self.db.xrefs_from.clear()
+        self.db.data_sub_xrefs.clear()
+        self.to_index.clear()
+        self.from_index.clear()
+
+
+    def add(self, from_ad, to_ad, kind=XREF_UNK):
+        xrefs = self.db.xrefs
+        xrefs_from = self.db.xrefs_from
+
+        targets = xrefs_from.get(from_ad, None)
+        if targets is None:
+            xrefs_from[from_ad] = [to_ad, kind]
+            self.from_index.add(from_ad)
+        else:
+            for i in range(0, len(targets), 2):
+                if targets[i] == to_ad:
+                    # The kind may be unknown if it was added by a script
+                    if kind != XREF_UNK and targets[i + 1] != kind:
+                        targets[i + 1] = kind
+                        xrefs_from.touch(from_ad)
+                    return
+            targets.append(to_ad)
+            targets.append(kind)
+            xrefs_from.touch(from_ad)
+
+        if to_ad in xrefs:
+            xrefs[to_ad].append(from_ad)
+            xrefs.touch(to_ad)
+        else:
+            xrefs[to_ad] = [from_ad]
+            self.to_index.add(to_ad)
+
+        head = self.db.mem.get_head_addr(to_ad)
+        if head in self.db.data_sub_xrefs:
+            self.db.data_sub_xrefs[head][to_ad] = True
+            self.db.data_sub_xrefs.touch(head)
+
+
+    def remove(self, from_ad, to_ad):
+        xrefs = self.db.xrefs
+        xrefs_from = self.db.xrefs_from
+
+        targets = xrefs_from.get(from_ad, None)
+        if targets is not None:
+            for i in range(0, len(targets), 2):
+                if targets[i] == to_ad:
+                    del targets[i:i + 2]
+                    if targets:
+                        xrefs_from.touch(from_ad)
+                    else:
+                        del xrefs_from[from_ad]
+                        self.from_index.remove(from_ad)
+                    break
+
+        lst = xrefs.get(to_ad, None)
+        if lst is None:
+            return
+
+        if from_ad in lst:
+            lst.remove(from_ad)
+            if lst:
+                xrefs.touch(to_ad)
+                return
+
+        if lst:
+            return
+
+        del xrefs[to_ad]
+        self.to_index.remove(to_ad)
+
+        head = self.db.mem.get_head_addr(to_ad)
+        if head in self.db.data_sub_xrefs:
+            self.db.data_sub_xrefs[head].pop(to_ad, None)
+            self.db.data_sub_xrefs.touch(head)
+
+
+    # Returns the kind of the xref or -1 if it doesn't exist
+    def kind(self, from_ad, to_ad):
+        targets = self.db.xrefs_from.get(from_ad, None)
+        if targets is not None:
+            for i in range(0, len(targets), 2):
+                if targets[i] == to_ad:
+                    return targets[i + 1]
+        return -1
+
+
+    # Returns a list of (to, kind)
+    def targets(self, from_ad):
+        targets = self.db.xrefs_from.get(from_ad, None)
+        if targets is None:
+            return []
+        return list(zip(targets[0::2], targets[1::2]))
+
+
+    # Returns a list of (from, to, kind) of all xrefs to ad. If ad is
+    # the start of an array or a string, xrefs inside the data are
+    # included.
+    def sources(self, ad):
+        db = self.db
+        if ad in db.data_sub_xrefs:
+            dests = list(db.data_sub_xrefs[ad])
+        elif ad in db.xrefs:
+            dests = [ad]
+        else:
+            return []
+
+        res = []
+        for to_ad in dests:
+            for x in db.xrefs.get(to_ad, ()):
+                res.append((x, to_ad, self.kind(x, to_ad)))
+        return res
+
+
+    # Returns a list of (from, to, kind) of all xrefs from an address
+    # in [start, end[, sorted by from.
+    def range_from(self, start, end):
+        xrefs_from = self.db.xrefs_from
+        res = []
+        for x in self.from_index.range(start, end):
+            targets = xrefs_from[x]
+            for i in range(0, len(targets), 2):
+                res.append((x, targets[i], targets[i + 1]))
+        return res
+
+
+    # Returns a list of (from, to, kind) of all xrefs to an address in
+    # [start, end[, sorted by to.
+    def range_to(self, start, end):
+        xrefs = self.db.xrefs
+        res = []
+        for to_ad in self.to_index.range(start, end):
+            for x in xrefs[to_ad]:
+                res.append((x, to_ad, self.kind(x, to_ad)))
+        return res
+
+
+    # Remove all xrefs to an address in [start, end[
+    def remove_range_to(self, start, end):
+        for x, to_ad, kind in self.range_to(start, end):
+            self.remove(x, to_ad)
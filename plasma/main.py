@@ -18,7 +18,13 @@
 #
 
 import os
+import re
 import sys
+import json
+import multiprocessing
+from io import StringIO
+from time import time
+from contextlib import redirect_stdout, redirect_stderr
 from plasma.lib import GlobalContext
 from plasma.lib.utils import info, die
 from plasma.lib.ui.vim import generate_vim_syntax
@@ -32,8 +38,19 @@ def console_entry():
     if gctx.filename is None:
         die()
 
+    start = time()
     if not gctx.load_file():
         die()
+    elapsed_load = time() - start
+
+    if gctx.batch_analyze:
+        batch_analyze(gctx, elapsed_load)
+        if not gctx.decompile_all:
+            sys.exit(0)
+
+    if gctx.decompile_all:
+        decompile_all(gctx)
+        sys.exit(0)
 
     if gctx.interactive_mode:
         from plasma.lib.ui.console import Console
@@ -57,6 +74,9 @@ def console_entry():
         if ctx is None:
             sys.exit(0)
 
+        if not gctx.vim:
+            ctx.sink = sys.stdout
+
         if gctx.do_dump:
             ctx.dump_asm(gctx.nb_lines).print()
             sys.exit(0)
@@ -79,3 +99,192 @@ def console_entry():
 
             if gctx.vim:
                 print("run :  vim {0}.rev -S {0}.vim".format(base), file=sys.stderr)
+
+
+#
+# Headless analysis : same passes as the console with the autoanalyzer, but
+# everything is run in this thread. The database is saved at the end and
+# the time of each phase is printed on stderr as one json object (stdout
+# is kept for the output of --decompile-all).
+#
+def batch_analyze(gctx, elapsed_load):
+    from plasma.lib.analyzer import Analyzer
+
+    dis = gctx.dis
+    db = gctx.db
+
+    if dis.is_x86:
+        import plasma.lib.arch.x86.analyzer as arch_analyzer
+    elif dis.is_mips:
+        import plasma.lib.arch.mips.analyzer as arch_analyzer
+    elif dis.is_arm:
+        import plasma.lib.arch.arm.analyzer as arch_analyzer
+
+    if dis.is_mips and not dis.mips_gp:
+        die("the register $gp is not set, run first in the interactive mode: "
+            "mips_set_gp 0xADDRESS")
+
+    # The thread is not started, the Api must not send messages to the
+    # analyzer (only the analyzer calls it here).
+    analyzer = Analyzer()
+    analyzer.init()
+    gctx.api = Api(gctx, analyzer)
+    analyzer.set(gctx, arch_analyzer)
+    dis.binary.api = gctx.api
+
+    times = {
+        "load": elapsed_load,
+        "symbols": dis.time_load_symbols,
+        "flow": 0,
+        "unk_data": 0,
+        "functions": 0,
+    }
+
+    # If false it means that the first analysis was already done
+    analyzed = len(db.mem) == 0
+
+    if analyzed:
+        entries, static = analyzer.symbol_entries()
+
+        start = time()
+        analyzer.analyze_batch(entries)
+        analyzer.rename_entry_point()
+        analyzer.analyze_batch(static)
+        times["flow"] = time() - start
+
+        analyzer.second_pass_done = True
+
+        start = time()
+        analyzer.pass_detect_unk_data()
+        times["unk_data"] = time() - start
+
+        start = time()
+        analyzer.scan_functions()
+        times["functions"] = time() - start
+
+    start = time()
+    db.save(db.history)
+    times["save"] = time() - start
+
+    times["total"] = sum(times.values())
+
+    print(json.dumps({
+        "filename": gctx.filename,
+        "analyzed": analyzed,
+        "jobs": gctx.jobs,
+        "functions": len(db.functions),
+        "items": len(db.mem),
+        "xrefs": len(db.xrefs),
+        "times": {k: round(v, 6) for k, v in times.items()},
+    }, sort_keys=True), file=sys.stderr)
+
+
+# Set in the main process before the fork, used by the workers of
+# decompile_all.
+_gctx = None
+
+
+# Returns (ad, output, elapsed, error message or None). Messages and
+# errors of the decompilation are kept for the report : an error (even
+# a call to die) must not stop the other functions.
+def decompile_function(ad):
+    gctx = _gctx
+    out = StringIO()
+    err = StringIO()
+    msg = None
+    start = time()
+
+    try:
+        with redirect_stdout(out), redirect_stderr(err):
+            ctx = gctx.get_addr_context(ad)
+            ctx.sink = out
+            o = ctx.decompile()
+            if o is not None:
+                o.print()
+            else:
+                msg = "decompilation failed"
+    except SystemExit:
+        msg = "decompilation aborted"
+    except Exception as e:
+        msg = "%s: %s" % (type(e).__name__, e)
+
+    elapsed = time() - start
+
+    if msg is not None:
+        # Some errors are printed on stdout before an exit
+        details = err.getvalue().strip() or \
+                  out.getvalue().strip().split("\n")[-1]
+        if details:
+            msg = "%s (%s)" % (msg, details.replace("\n", " "))
+        return (ad, None, elapsed, msg)
+
+    return (ad, out.getvalue(), elapsed, None)
+
+
+#
+# Decompile all functions (imports excepted) in the address order. With
+# --outdir each function is written in its own file, otherwise all
+# outputs are printed on stdout. With -j the functions are decompiled by
+# processes forked after the loading, so the binary and the database are
+# shared.
+#
+# For each function a json object (address, name, time, error) is printed
+# on stderr, then a summary.
+#
+def decompile_all(gctx):
+    global _gctx
+
+    if gctx.api is None:
+        gctx.api = Api(gctx, None)
+
+    db = gctx.db
+    entries = sorted(ad for ad in db.functions if ad not in db.imports)
+
+    if gctx.outdir is not None:
+        os.makedirs(gctx.outdir, exist_ok=True)
+
+    _gctx = gctx
+    pool = None
+    start = time()
+
+    if gctx.jobs > 1 and len(entries) > 1:
+        ctx = multiprocessing.get_context("fork")
+        pool = ctx.Pool(gctx.jobs)
+        results = pool.imap(decompile_function, entries, chunksize=8)
+    else:
+        results = map(decompile_function, entries)
+
+    nb_failed = 0
+
+    for ad, output, elapsed, msg in results:
+        name = db.reverse_symbols.get(ad, "sub_%x" % ad)
+
+        if msg is not None:
+            nb_failed += 1
+        elif gctx.outdir is None:
+            sys.stdout.write(output)
+            print()
+        else:
+            filename = "0x%x_%s.rev" % (ad, re.sub(r"[^\w.@$-]", "_", name)[:100])
+            with open(os.path.join(gctx.outdir, filename), "w") as f:
+                f.write(output)
+
+        print(json.dumps({
+            "address": hex(ad),
+            "name": name,
+            "time": round(elapsed, 6),
+            "error": msg,
+        }), file=sys.stderr)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    _gctx = None
+
+    print(json.dumps({
+        "functions": len(entries),
+        "failed": nb_failed,
+        "jobs": gctx.jobs,
+        "time": round(time() - start, 6),
+    }), file=sys.stderr)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import re
+
 HEXA_CONSTS = {
 "empty_md5": 
     b"\xd4\x1d\x8c\xd9\x8f\x00\xb2\x04\xe9\x80\x09\x98\xec\xf8\x42\x7e",
@@ -445,10 +447,9 @@ HEXA_CONSTS = {
 
 for s in api.iter_sections():
     for dataname, buf in HEXA_CONSTS.items():
-        idx = s.data.find(buf)
-        while idx != -1:
-            ad = s.start + idx
+        # s.data is a memoryview, there is no find
+        for m in re.finditer(b"(?=" + re.escape(buf) + b")", s.data):
+            ad = s.start + m.start()
             print(hex(ad), dataname)
             api.add_symbol(ad, dataname)
             api.set_array(ad, len(buf), MEM_BYTE)
-            idx = s.data.find(buf, idx+1)
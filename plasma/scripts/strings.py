@@ -5,14 +5,9 @@ import pydoc
 buf = []
 
 for s in api.iter_sections():
-    ad = s.start
-    while ad < s.end:
-        if api.is_string(ad, s):
-            string = api.get_string(ad, s)
-            if len(string) >= 3:
-                buf.append("0x%x  \"%s\"\n" % (ad, string.replace("\n", "\\n")))
-            ad += len(string) + 1
-        else:
-            ad += 1
+    # At least 3 chars and the null byte
+    for ad, n in api.find_strings(s, 4):
+        string = api.get_string(ad, s)
+        buf.append("0x%x  \"%s\"\n" % (ad, string.replace("\n", "\\n")))
 
 pydoc.pager("".join(buf))
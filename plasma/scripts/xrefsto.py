@@ -41,7 +41,8 @@ def rec_xref(output, first_ad, ad, depth):
             return
         depth -= 1
 
-    for x in api.xrefsto(ad):
+    for x, to_ad, kind in api.xrefsto_kind(ad):
+        x = api.mem.get_head_addr(x)
         if api.mem.is_code(x):
             f = api.get_func_addr(x)
             if f is not None:
@@ -49,7 +50,10 @@ def rec_xref(output, first_ad, ad, depth):
 
         if (x, ad) not in links:
             links.add((x, ad))
-            output.write('node_%x -> node_%x;\n' % (x, ad))
+            # Data references are dashed
+            style = "dashed" if kind >= XREF_READ else "solid"
+            output.write('node_%x -> node_%x [label="%s" style=%s];\n' %
+                         (x, ad, XREF_NAMES[kind], style))
             rec_xref(output, first_ad, x, depth)
 
 
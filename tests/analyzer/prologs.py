@@ -0,0 +1,5 @@
+#!/usr/bin/env python3
+analyzer.pass_detect_functions()
+ad = api.get_addr_from_symbol(".text")
+s = api.get_section(ad)
+api.dump_asm(ad, until=s.end+1).print()
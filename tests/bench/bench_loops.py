@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+#
+# Time Graph.simplify and Graph.loop_detection on generated control flow
+# graphs (nested loops, if-else, switch and some gotos inside loops). Like
+# Disassembler.get_graph, each node is one instruction before simplify.
+#
+# In the console : py tests/bench/bench_loops.py [NB_NODES ...]
+# or             : PYTHONPATH=. python3 tests/bench/bench_loops.py [NB_NODES ...]
+#
+
+import sys
+import random
+from time import time
+
+from plasma.lib import GlobalContext
+from plasma.lib.graph import Graph
+
+
+class CFGGenerator():
+    def __init__(self, seed, goto_ratio):
+        self.rnd = random.Random(seed)
+        self.goto_ratio = goto_ratio
+        self.gph = Graph(None, 0)
+        self.loop_bodies = []
+
+
+    def node(self):
+        ad = len(self.gph.nodes)
+        self.gph.nodes[ad] = [ad]
+        return ad
+
+
+    def link(self, a, b):
+        nxt = self.gph.link_out.setdefault(a, [])
+        nxt.append(b)
+        if len(nxt) > 1:
+            self.gph.cond_jumps_set.add(a)
+        self.gph.link_in.setdefault(b, []).append(a)
+
+
+    # Returns the last node of the block
+    def block(self, curr, budget, depth):
+        while budget > 0:
+            r = self.rnd.random()
+            sub = self.rnd.randint(1, max(1, budget // 3))
+
+            if depth < 12 and r < 0.25:
+                # while loop
+                head = self.node()
+                self.link(curr, head)
+                body = self.node()
+                self.link(head, body)
+                self.loop_bodies.append(body)
+                end = self.block(body, sub, depth + 1)
+                self.link(end, head)
+                curr = self.node()
+                self.link(head, curr)
+
+            elif depth < 12 and r < 0.55:
+                # if-else
+                a = self.node()
+                b = self.node()
+                self.link(curr, a)
+                self.link(curr, b)
+                a = self.block(a, sub // 2, depth + 1)
+                b = self.block(b, sub // 2, depth + 1)
+                curr = self.node()
+                self.link(a, curr)
+                self.link(b, curr)
+
+            elif depth < 12 and r < 0.65:
+                # switch
+                sw = curr
+                curr = self.node()
+                for i in range(self.rnd.randint(3, 16)):
+                    case = self.node()
+                    self.link(sw, case)
+                    self.link(case, curr)
+
+            elif self.loop_bodies and r < 0.65 + self.goto_ratio:
+                # goto inside a loop
+                a = self.node()
+                self.link(curr, a)
+                self.link(curr, self.rnd.choice(self.loop_bodies))
+                curr = a
+
+            else:
+                nxt = self.node()
+                self.link(curr, nxt)
+                curr = nxt
+
+            budget -= sub
+        return curr
+
+
+def generate(nb_nodes, goto_ratio, seed=0):
+    gen = CFGGenerator(seed, goto_ratio)
+    entry = gen.node()
+    end = entry
+    while len(gen.gph.nodes) < nb_nodes:
+        end = gen.block(end, nb_nodes - len(gen.gph.nodes), 0)
+    return gen.gph
+
+
+try:
+    sizes = [int(n) for n in args]
+except NameError:
+    # Outside the console, debug__ needs a context
+    GlobalContext()
+    sizes = [int(n) for n in sys.argv[1:]]
+
+if not sizes:
+    sizes = [1000, 10000, 100000]
+
+for goto_ratio in (0, 0.02):
+    for n in sizes:
+        gph = generate(n, goto_ratio)
+        nb_inst = len(gph.nodes)
+
+        start = time()
+        gph.simplify()
+        elapsed_simplify = time() - start
+
+        start = time()
+        gph.loop_detection(0)
+        elapsed_loops = time() - start
+
+        print("%-11s %7d insts  simplify %.4fs  %6d blocks %6d loops  %.4fs" %
+              ("reducible" if goto_ratio == 0 else "irreducible",
+               nb_inst, elapsed_simplify, len(gph.nodes), len(gph.loops_all),
+               elapsed_loops))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+#
+# Compare Binary.get_section with a bisect on the sorted list of sections
+# (the previous implementation) on generated binaries. Sections have
+# random sizes, gaps and alignments, so some pages are shared by two
+# sections. Lookups are random addresses (in sections or not) and runs
+# of consecutive addresses like the analyzer or the visual.
+#
+# In the console : py tests/bench/bench_sections.py [NB_SECTIONS ...]
+# or             : PYTHONPATH=. python3 tests/bench/bench_sections.py [NB_SECTIONS ...]
+#
+
+import sys
+import bisect
+import random
+from time import time
+
+from plasma.lib.fileformat.binary import Binary
+
+
+NB_LOOKUPS = 500000
+
+
+def generate(nb_sections, seed=0):
+    rnd = random.Random(seed)
+    b = Binary()
+    ad = 0x400000
+    for i in range(nb_sections):
+        size = rnd.choice([0x10, 0x80, 0x400, 0x1000, 0x8000, 0x40000])
+        size += rnd.randint(0, 0x100)
+        b.add_section(ad, ".s%d" % i, size, size, rnd.random() < 0.3,
+                      True, False, memoryview(b""))
+        r = rnd.random()
+        if r < 0.05:
+            # overlapping sections (like .tbss)
+            ad += size // 2
+        else:
+            ad += size
+            if r < 0.5:
+                ad += rnd.randint(0, 0x2000)
+            elif r < 0.7:
+                ad = (ad + 0xfff) & ~0xfff
+    return b
+
+
+def get_section_bisect(b, ad):
+    i = bisect.bisect_right(b._sorted_sections, ad)
+    if not i:
+        return None
+    start = b._sorted_sections[i - 1]
+    s = b._abs_sections[start]
+    if ad <= s.end:
+        return s
+    return None
+
+
+def addresses(b, seed=0):
+    rnd = random.Random(seed)
+    first = b.get_first_addr() - 0x1000
+    last = b.get_last_addr() + 0x1000
+    lst = []
+
+    while len(lst) < NB_LOOKUPS:
+        ad = rnd.randint(first, last)
+        if rnd.random() < 0.5:
+            lst.append(ad)
+        else:
+            lst.extend(range(ad, ad + 64, 4))
+    return lst
+
+
+try:
+    sizes = [int(n) for n in args]
+except NameError:
+    sizes = [int(n) for n in sys.argv[1:]]
+
+if not sizes:
+    sizes = [16, 256, 1024]
+
+for n in sizes:
+    b = generate(n)
+    lst = addresses(b)
+
+    start = time()
+    res1 = [get_section_bisect(b, ad) for ad in lst]
+    elapsed_bisect = time() - start
+
+    start = time()
+    res2 = [b.get_section(ad) for ad in lst]
+    elapsed_pages = time() - start
+
+    if res1 != res2:
+        print("error: different results with %d sections" % n)
+
+    print("%5d sections %7d lookups  bisect %.4fs  get_section %.4fs  %5.2fx" %
+          (n, len(lst), elapsed_bisect, elapsed_pages,
+           elapsed_bisect / elapsed_pages))
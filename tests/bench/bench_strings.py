@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+#
+# Compare api.find_strings with a loop on api.is_string (the previous
+# implementation of the script strings.py).
+#
+# The counts can be a bit different : the loop skips len(get_string(ad))
+# bytes after a string, but escaped chars like \n take two chars.
+#
+# In the console : py tests/bench/bench_strings.py
+#
+
+from time import time
+
+def loop_is_string(s):
+    res = []
+    ad = s.start
+    while ad < s.end:
+        if api.is_string(ad, s):
+            string = api.get_string(ad, s)
+            if len(string) >= 3:
+                res.append(ad)
+            ad += len(string) + 1
+        else:
+            ad += 1
+    return res
+
+
+total_loop = 0
+total_find = 0
+
+for s in api.iter_sections():
+    start = time()
+    lst1 = loop_is_string(s)
+    elapsed_loop = time() - start
+
+    start = time()
+    lst2 = api.find_strings(s, 4)
+    elapsed_find = time() - start
+
+    total_loop += elapsed_loop
+    total_find += elapsed_find
+
+    print("%-20s loop %6d strings %.4fs   find_strings %6d strings %.4fs" %
+          (s.name, len(lst1), elapsed_loop, len(lst2), elapsed_find))
+
+print("total: loop %.4fs  find_strings %.4fs" % (total_loop, total_find))
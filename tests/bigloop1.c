@@ -0,0 +1,32 @@
+#include <stdio.h>
+#include <stdlib.h>
+
+// More than MAX_NODES nodes (lib/graph.py) : the loops are built with the
+// loop nesting forest.
+
+#define TEST(n) if (i == n) { printf("%d\n", n); }
+#define TEST10(n) TEST(n##0) TEST(n##1) TEST(n##2) TEST(n##3) TEST(n##4) \
+                  TEST(n##5) TEST(n##6) TEST(n##7) TEST(n##8) TEST(n##9)
+#define TEST100(n) TEST10(n##0) TEST10(n##1) TEST10(n##2) TEST10(n##3) \
+                   TEST10(n##4) TEST10(n##5) TEST10(n##6) TEST10(n##7) \
+                   TEST10(n##8) TEST10(n##9)
+
+int main(int argc, char **argv) {
+    int i, j;
+
+    for (j = 0 ; j < argc ; j++) {
+        i = 0;
+        while (i < 1000) {
+            TEST100(1)
+            TEST100(2)
+            TEST100(3)
+            TEST100(4)
+            TEST100(5)
+            i++;
+        }
+        if (j == 5)
+            break;
+    }
+
+    return 0;
+}
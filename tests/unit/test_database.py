@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+# to run this script :
+# $ python3 -m nose tests/unit
+
+import os
+import zlib
+import struct
+import shutil
+import tempfile
+import msgpack
+from nose.tools import assert_equal
+
+from plasma.lib import GlobalContext
+from plasma.lib.api import Jmptable
+from plasma.lib.consts import *
+from plasma.lib.database import Database, SectionTable, JOURNAL_TABLES
+from plasma.lib.memory import Memory
+
+
+TABLES = JOURNAL_TABLES[:-1] + ["end_functions", "reverse_symbols",
+                                "reverse_demangled"]
+
+
+class TmpDir():
+    def __enter__(self):
+        GlobalContext().quiet = True
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "a.bin")
+        return self
+
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.path)
+
+
+def new_db(filename):
+    db = Database()
+    db.path = os.path.join(os.path.dirname(filename),
+                           "." + os.path.basename(filename) + ".db")
+    db.mem = Memory()
+    db.mem.xrefs = db.xrefs
+    db.mem.data_sub_xrefs = db.data_sub_xrefs
+    return db
+
+
+def load_db(filename):
+    db = Database()
+    db.load(filename)
+    assert db.loaded
+    return db
+
+
+def fill(db):
+    db.mips_gp = 0x1234
+    db.func_id_counter = 2
+
+    db.symbols["main"] = 0x1000
+    db.reverse_symbols[0x1000] = "main"
+    db.symbols["str"] = 0x2000
+    db.reverse_symbols[0x2000] = "str"
+    db.demangled["foo()"] = 0x1100
+    db.reverse_demangled[0x1100] = "foo()"
+
+    db.user_inline_comments[0x1004] = "user"
+    db.internal_inline_comments[0x1008] = "internal"
+    db.user_previous_comments[0x1000] = ["a", "b"]
+    db.internal_previous_comments[0x1010] = ["c"]
+
+    db.jmptables[0x1010] = Jmptable(0x1010, 0x3000, [0x1020, 0x1030], "switch")
+
+    db.functions[0x1000] = [0x1040, FUNC_FLAG_NORETURN,
+                            {-8: [MEM_DWORD, "var_8"]}, 0,
+                            {0x1004: -8}, 16, 0]
+    db.functions[0x1100] = [0x1110, 0, {}, 1, {}, 0, 8]
+    db.functions[0x1200] = None
+    db.end_functions[0x1040] = [0x1000]
+    db.end_functions[0x1110] = [0x1100]
+    db.func_id[0] = 0x1000
+    db.func_id[1] = 0x1100
+
+    db.mem.add(0x1000, 1, MEM_FUNC, 0)
+    db.mem.add(0x1004, 4, MEM_CODE, 0)
+    db.mem.add(0x1100, 1, MEM_FUNC, 1)
+    db.xref_store.add(0x1004, 0x2004, XREF_READ)
+    db.xref_store.add(0x1008, 0x1100, XREF_CALL)
+    db.xref_store.add(0x1010, 0x1020, XREF_JMPTABLE)
+
+    # a string with an xref inside, and one without any xref
+    db.mem.add(0x2000, 16, MEM_ASCII)
+    db.mem.add(0x2100, 32, MEM_ASCII)
+    db.mem.add(0x3000, 16, MEM_ARRAY, MEM_QOFFSET)
+    assert_equal(db.data_sub_xrefs[0x2000], {0x2004: True})
+    assert_equal(db.data_sub_xrefs[0x2100], {})
+
+    db.imports[0x4000] = FUNC_FLAG_NORETURN
+    db.immediates[0x1004] = 0x2004
+    db.inverted_cond[0x1008] = 1
+
+
+def dump(db):
+    res = {}
+    for name in TABLES:
+        t = getattr(db, name)
+        if name == "jmptables":
+            res[name] = {k: vars(v) for k, v in t.items()}
+        else:
+            res[name] = dict(t)
+    res["mem"] = dict(db.mem.mm)
+    res["index"] = list(db.mem.index)
+    res["mips_gp"] = db.mips_gp
+    res["func_id_counter"] = db.func_id_counter
+    res["history"] = db.history
+    return res
+
+
+def check_tables(d1, d2):
+    for name in d1:
+        assert_equal(d1[name], d2[name], name)
+
+
+def test_save_load():
+    with TmpDir() as tmp:
+        db = new_db(tmp.filename)
+        fill(db)
+        db.save([0x1000, 0x2000])
+        db.history = [0x1000, 0x2000]
+
+        db2 = load_db(tmp.filename)
+        check_tables(dump(db), dump(db2))
+
+        # Saved again without the journal
+        db2.journal = None
+        db2.save(db2.history)
+        check_tables(dump(db), dump(load_db(tmp.filename)))
+
+
+def test_section_table():
+    calls = []
+    def rows():
+        calls.append(1)
+        return iter([(1, "a"), (2, "b"), (3, "c")])
+
+    t = SectionTable(rows)
+    assert_equal(calls, [])
+    assert_equal(dict(t.items()), {1: "a", 2: "b", 3: "c"})
+
+    t.pop(2)
+    t.update({3: "C", 4: "d"})
+    t.pop(4)
+    assert_equal(dict(t.items()), {1: "a", 3: "C"})
+
+    t.clear()
+    t.update({5: "e"})
+    assert_equal(dict(t.items()), {5: "e"})
+    assert_equal(len(calls), 2)
+
+
+# 3.0 and 3.1 didn't save the heads of data_sub_xrefs without xrefs
+def test_load_without_sub_heads():
+    with TmpDir() as tmp:
+        db = new_db(tmp.filename)
+        fill(db)
+        db.save([])
+
+        # Rewrite the table of contents without data_sub_xrefs_heads
+        fd = open(db.path, "rb+")
+        data = fd.read()
+        off = struct.unpack_from("<Q", data, len(data) - 8)[0]
+        hdr = msgpack.unpackb(data[off:-8], encoding="utf-8")
+        del hdr["toc"]["data_sub_xrefs_heads"]
+        hdr["version"] = 3.1
+        fd.seek(off)
+        fd.truncate()
+        fd.write(msgpack.packb(hdr, use_bin_type=True))
+        fd.write(struct.pack("<Q", off))
+        fd.close()
+
+        db2 = load_db(tmp.filename)
+        assert_equal(dict(db2.data_sub_xrefs), dict(db.data_sub_xrefs))
+
+
+# Old format (< 3.0) : zlib + msgpack
+def test_load_old_format():
+    with TmpDir() as tmp:
+        db = new_db(tmp.filename)
+        fill(db)
+
+        data = {
+            "version": 2.9,
+            "symbols": db.symbols,
+            "demangled": db.demangled,
+            "history": [0x1000],
+            "user_inline_comments": db.user_inline_comments,
+            "internal_inline_comments": db.internal_inline_comments,
+            "user_previous_comments": db.user_previous_comments,
+            "internal_previous_comments": db.internal_previous_comments,
+            "jmptables": [vars(j) for j in db.jmptables.values()],
+            "mips_gp": db.mips_gp,
+            "mem": db.mem.mm,
+            "functions": db.functions,
+            "func_id_counter": db.func_id_counter,
+            "func_id": db.func_id,
+            "xrefs": db.xrefs,
+            "data_sub_xrefs": db.data_sub_xrefs,
+            "raw_base": 0,
+            "raw_type": None,
+            "raw_is_big_endian": None,
+            "imports": db.imports,
+            "immediates": db.immediates,
+            "inverted_cond": db.inverted_cond,
+        }
+
+        fd = open(db.path, "wb")
+        fd.write(b"ZLIB")
+        fd.write(zlib.compress(msgpack.packb(data, use_bin_type=True)))
+        fd.close()
+
+        db.history = [0x1000]
+        db2 = load_db(tmp.filename)
+        assert_equal(db2.version, 2.9)
+
+        # The kinds of xrefs are unknown
+        d1 = dump(db)
+        for ad, lst in d1["xrefs_from"].items():
+            d1["xrefs_from"][ad] = [x if i % 2 == 0 else XREF_UNK
+                                    for i, x in enumerate(lst)]
+        check_tables(d1, dump(db2))
+
+        # Then saved in the new format
+        db2.save(db2.history)
+        db3 = load_db(tmp.filename)
+        check_tables(d1, dump(db3))
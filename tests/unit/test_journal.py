@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+# to run this script :
+# $ python3 -m nose tests/unit
+
+import os
+from nose.tools import assert_equal
+
+from plasma.lib.consts import *
+from plasma.lib.journal import (Journal, TrackedDict, make_record,
+        apply_record, JOURNAL_HDR_SIZE)
+
+from test_database import TmpDir, new_db, load_db, fill, dump, check_tables
+
+
+def record(commit, **tables):
+    return make_record(tables, {}, {}, [], commit)
+
+
+# A table where all keys are modified
+def changed(d):
+    t = TrackedDict()
+    t.update(d)
+    return t
+
+
+def journal_path(tmp):
+    return os.path.join(tmp.path, "journal")
+
+
+def test_record():
+    t = TrackedDict({1: "a", 2: "b"})
+    t.reset_dirty()
+    t[3] = "c"
+    del t[1]
+    rec = record(True, t=t)
+    assert_equal(rec["set"], {"t": {3: "c"}})
+    assert_equal(rec["del"], {"t": [1]})
+
+    # the dirty keys are forgotten
+    rec = record(True, t=t)
+    assert_equal((rec["clear"], rec["set"], rec["del"]), ([], {}, {}))
+
+    d = {1: "a", 2: "b"}
+    apply_record({"t": d}, record(True, t=changed({4: "d"})))
+    assert_equal(d, {1: "a", 2: "b", 4: "d"})
+
+
+def test_clear_then_set():
+    t = TrackedDict({1: "a", 2: "b"})
+    t.reset_dirty()
+    t.clear()
+    t[2] = "x"
+    t[3] = "y"
+
+    rec = record(True, t=t)
+    assert_equal(rec["clear"], ["t"])
+
+    d = {1: "a", 2: "b", 5: "z"}
+    apply_record({"t": d}, rec)
+    assert_equal(d, {2: "x", 3: "y"})
+
+
+def test_read_write():
+    with TmpDir() as tmp:
+        j = Journal(journal_path(tmp), 42)
+        assert_equal(j.read(), ([], 0))
+
+        j.write(record(True, t=changed({1: 1})))
+        j.write(record(False, t=changed({2: 2})))
+        j.write(record(False, t=changed({3: 3})))
+
+        records, nb_pending = Journal(journal_path(tmp), 42).read()
+        assert_equal([r["set"]["t"] for r in records], [{1: 1}, {2: 2}, {3: 3}])
+        assert_equal(nb_pending, 2)
+
+
+def test_truncated_record():
+    with TmpDir() as tmp:
+        j = Journal(journal_path(tmp), 42)
+        j.write(record(True, t=changed({1: 1})))
+        j.write(record(True, t=changed({2: 2})))
+
+        size = j.size()
+        fd = open(j.path, "rb+")
+        fd.truncate(size - 3)
+        fd.close()
+
+        records, nb_pending = Journal(j.path, 42).read()
+        assert_equal([r["set"]["t"] for r in records], [{1: 1}])
+        assert_equal(nb_pending, 0)
+
+        # only the size of the record
+        fd = open(j.path, "rb+")
+        fd.truncate(JOURNAL_HDR_SIZE + 2)
+        fd.close()
+        assert_equal(Journal(j.path, 42).read(), ([], 0))
+
+
+def test_discard_pending():
+    with TmpDir() as tmp:
+        j = Journal(journal_path(tmp), 42)
+        j.write(record(True, t=changed({1: 1})))
+        commit_off = j.size()
+        assert_equal(j.commit_off, commit_off)
+
+        j.write(record(False, t=changed({2: 2})))
+        j.write(record(False, t=changed({3: 3})))
+        j.discard_pending()
+        assert_equal(j.size(), commit_off)
+
+        records, nb_pending = Journal(j.path, 42).read()
+        assert_equal(len(records), 1)
+        assert_equal(nb_pending, 0)
+
+        # commit_off is also found by read
+        j = Journal(j.path, 42)
+        j.read()
+        j.write(record(False, t=changed({4: 4})))
+        j.discard_pending()
+        assert_equal(j.size(), commit_off)
+
+
+def test_other_base_id():
+    with TmpDir() as tmp:
+        Journal(journal_path(tmp), 42).write(record(True, t=changed({1: 1})))
+        assert_equal(Journal(journal_path(tmp), 43).read(), (None, 0))
+
+
+def test_database_replay():
+    with TmpDir() as tmp:
+        db = new_db(tmp.filename)
+        fill(db)
+        db.save([])
+
+        # committed
+        db.symbols["new"] = 0x1200
+        db.reverse_symbols[0x1200] = "new"
+        db.mem.add(0x1200, 1, MEM_FUNC, 2)
+        db.xref_store.add(0x1004, 0x2108, XREF_READ)
+        db.mem.rm_range(0x2000, 1)
+        db.save([0x1200])
+        db.history = [0x1200]
+        assert os.path.exists(db.journal.path)
+
+        # pending (autosave of the analyzer)
+        db.journal_autosave = True
+        db.user_inline_comments[0x1200] = "pending"
+        db.func_id_counter = 3
+        db.autosave()
+
+        db2 = load_db(tmp.filename)
+        check_tables(dump(db), dump(db2))
+        assert db2.modified
+
+        # exit without saving
+        db2.discard_autosave()
+        db3 = load_db(tmp.filename)
+        assert 0x1200 not in db3.user_inline_comments
+        assert_equal(db3.func_id_counter, 2)
+        assert_equal(db3.symbols["new"], 0x1200)
+        assert not db3.modified
+
+
+def test_database_clear():
+    with TmpDir() as tmp:
+        db = new_db(tmp.filename)
+        fill(db)
+        db.save([])
+
+        db.xref_store.clear()
+        db.xref_store.add(0x1008, 0x1100, XREF_CALL)
+        db.save([])
+
+        db2 = load_db(tmp.filename)
+        assert_equal(dict(db2.xrefs), {0x1100: [0x1008]})
+        assert_equal(dict(db2.xrefs_from), {0x1008: [0x1100, XREF_CALL]})
+        assert_equal(dict(db2.data_sub_xrefs), {})
+        check_tables(dump(db), dump(db2))
+
+
+def test_database_other_base_id():
+    with TmpDir() as tmp:
+        db = new_db(tmp.filename)
+        fill(db)
+        db.save([])
+
+        path = db.path + ".journal"
+        j = Journal(path, db.base_id + 1)
+        j.write(record(True, symbols=changed({"other": 0x1300})))
+
+        db2 = load_db(tmp.filename)
+        assert "other" not in db2.symbols
+        assert not os.path.exists(path)
+        check_tables(dump(db), dump(db2))
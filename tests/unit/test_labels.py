@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# to run this script :
+# $ python3 -m nose tests/unit
+
+from nose.tools import assert_equal
+
+from plasma.lib import GlobalContext
+from plasma.lib.consts import *
+from plasma.lib.journal import TrackedDict
+from plasma.lib.labels import LabelsTable
+
+from test_database import new_db, fill
+
+
+class Binary():
+    def __init__(self, db):
+        self.imports = db.imports
+
+
+class Disassembler():
+    def __init__(self, db):
+        self.binary = Binary(db)
+
+
+def new_table():
+    gctx = GlobalContext()
+    gctx.quiet = True
+    gctx.show_mangling = False
+    gctx.db = new_db("a.bin")
+    gctx.dis = Disassembler(gctx.db)
+    fill(gctx.db)
+    return gctx, LabelsTable(gctx)
+
+
+def test_stamp():
+    a = TrackedDict()
+    b = TrackedDict()
+    assert b.stamp > a.stamp
+    for modify in (lambda: a.__setitem__(1, 1), lambda: a.touch(1),
+                   lambda: a.pop(1), lambda: a.update({2: 2}),
+                   lambda: a.popitem(), lambda: a.clear()):
+        stamp, version = a.stamp, TrackedDict.version
+        modify()
+        assert a.stamp > stamp
+        assert_equal(a.stamp, TrackedDict.version)
+        assert TrackedDict.version > version
+    assert b.stamp < a.stamp
+
+
+def test_names():
+    gctx, t = new_table()
+    db = gctx.db
+
+    assert_equal(t.symbol(0x1000), "main")
+    assert_equal(t.symbol(0x1100), "sub_1100")
+    assert_equal(t.symbol(0x2100), "asc_2100")
+    assert_equal(t.symbol(0x1004), None)
+    assert_equal(t.label(0x2004)[:2], (0x2000, "str"))
+
+    db.symbols["foo"] = 0x1100
+    db.reverse_symbols[0x1100] = "foo"
+    assert_equal(t.symbol(0x1100), "foo")
+
+    db.xref_store.add(0x1008, 0x1004, XREF_JUMP)
+    assert_equal(t.symbol(0x1004), "loc_1004")
+
+    db.mem.add(0x2100, 4, MEM_DWORD)
+    assert_equal(t.symbol(0x2100), "dword_2100")
+    assert_equal(t.label(0x2102)[:2], (0x2100, "dword_2100"))
+
+    gctx.show_mangling = True
+    assert_equal(t.symbol(0x1100), "foo()")
+
+
+# Tables which don't change the labels don't empty the table
+def test_other_tables():
+    gctx, t = new_table()
+    db = gctx.db
+
+    t.symbol(0x1000)
+    t.label(0x2004)
+    db.user_inline_comments[0x1000] = "comment"
+    db.functions[0x1000][FUNC_FLAGS] = 0
+    db.functions.touch(0x1000)
+    db.immediates[0x1008] = 0x2000
+    assert_equal(t.symbol(0x1000), "main")
+    assert_equal(set(t.names), {0x1000})
+    assert_equal(set(t.labels), {0x2004})
+
+    db.mem.add(0x3100, 1, MEM_BYTE)
+    t.symbol(0x1000)
+    assert_equal(set(t.names), {0x1000})
+    assert_equal(set(t.labels), {0x2004})
+
+
+# Only the modified addresses and the addresses inside their item are
+# removed
+def test_invalidate():
+    gctx, t = new_table()
+    db = gctx.db
+
+    for ad in (0x1000, 0x1100, 0x2000, 0x2004, 0x2104, 0x3008, 0x5004):
+        t.label(ad)
+    t.symbol(0x1000)
+    t.symbol(0x1100)
+
+    db.symbols["s"] = 0x2000
+    db.reverse_symbols[0x2000] = "s"
+    t.symbol(0x1000)
+    assert_equal(set(t.labels), {0x1000, 0x1100, 0x2104, 0x3008, 0x5004})
+    assert_equal(set(t.names), {0x1000, 0x1100})
+    assert_equal(t.label(0x2004)[:2], (0x2000, "s"))
+
+    # A new item removes the addresses inside it
+    db.mem.add(0x5000, 8, MEM_QWORD)
+    t.symbol(0x1000)
+    assert 0x5004 not in t.labels
+    assert_equal(t.label(0x5004)[:2], (0x5000, "qword_5000"))
+
+    # The string is removed
+    db.mem.rm_range(0x2100, 1)
+    t.symbol(0x1000)
+    assert 0x2104 not in t.labels
+    assert_equal(set(t.names), {0x1000, 0x1100})
+
+    db.xref_store.add(0x1008, 0x1104, XREF_JUMP)
+    t.symbol(0x1000)
+    assert 0x1100 in t.labels
+
+    # A cleared table empties the labels
+    db.imports.clear()
+    t.symbol(0x1000)
+    assert_equal(t.labels, {})
+
+
+# A full log empties the table
+def test_full_log():
+    gctx, t = new_table()
+    db = gctx.db
+    t.capacity = 2
+    t.log.limit = 2
+
+    t.label(0x2004)
+    t.symbol(0x1000)
+    db.reverse_symbols[0x1200] = "a"
+    db.reverse_symbols[0x1300] = "b"
+    assert_equal(set(t.labels), {0x2004})
+    db.reverse_symbols[0x1400] = "c"
+    assert_equal(t.symbol(0x1400), "c")
+    assert_equal(t.labels, {})
+
+
+# A table loaded again is a new TrackedDict
+def test_new_table():
+    gctx, t = new_table()
+    db = gctx.db
+
+    assert_equal(t.symbol(0x1000), "main")
+    db.reverse_symbols = TrackedDict({0x1000: "start"})
+    assert_equal(t.symbol(0x1000), "start")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# to run this script :
+# $ python3 -m nose tests/unit
+
+import random
+from bisect import bisect_left, bisect_right
+from nose.tools import assert_equal
+
+from plasma.lib.memory import AddrIndex
+
+
+# Small blocks to split and remove blocks often
+def new_index(addresses=()):
+    idx = AddrIndex(addresses)
+    idx.LOAD = 4
+    return idx
+
+
+def check(idx, model):
+    assert_equal(list(idx), model)
+    assert_equal(len(idx), len(model))
+    assert_equal(idx.maxes, [blk[-1] for blk in idx.blocks])
+    for blk in idx.blocks:
+        assert len(blk) > 0
+        assert len(blk) <= 2 * idx.LOAD
+
+
+def model_floor(model, ad):
+    i = bisect_right(model, ad)
+    return model[i - 1] if i else -1
+
+
+def model_ceil(model, ad):
+    i = bisect_left(model, ad)
+    return model[i] if i < len(model) else -1
+
+
+def test_empty():
+    idx = new_index()
+    assert_equal(len(idx), 0)
+    assert_equal(idx.floor(10), -1)
+    assert_equal(idx.ceil(10), -1)
+    assert_equal(idx.range(0, 100), [])
+    idx.remove(10)
+    assert_equal(len(idx), 0)
+
+
+def test_add_remove_split():
+    idx = new_index()
+    model = []
+
+    # in order, at the end and at the beginning
+    for ad in list(range(100, 200, 2)) + list(range(99, 0, -3)):
+        idx.add(ad)
+        model.append(ad)
+    model.sort()
+    check(idx, model)
+    assert len(idx.blocks) > 1
+
+    # duplicates are ignored
+    idx.add(100)
+    idx.add(99)
+    check(idx, model)
+
+    # inside a full block
+    for ad in range(101, 140, 2):
+        idx.add(ad)
+        model.append(ad)
+    model.sort()
+    check(idx, model)
+
+    # remove the last address of a block, then the whole block
+    blk = list(idx.blocks[1])
+    idx.remove(blk[-1])
+    model.remove(blk[-1])
+    check(idx, model)
+    for ad in blk[:-1]:
+        idx.remove(ad)
+        model.remove(ad)
+    check(idx, model)
+
+    # not in the index
+    idx.remove(1000)
+    idx.remove(blk[0])
+    check(idx, model)
+
+
+def test_floor_ceil():
+    model = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 120]
+    idx = new_index()
+    for ad in model:
+        idx.add(ad)
+    assert len(idx.blocks) > 1
+
+    for ad in range(0, 130):
+        assert_equal(idx.floor(ad), model_floor(model, ad))
+        assert_equal(idx.ceil(ad), model_ceil(model, ad))
+
+    # edges of each block
+    for blk in idx.blocks:
+        for ad in (blk[0] - 1, blk[0], blk[-1], blk[-1] + 1):
+            assert_equal(idx.floor(ad), model_floor(model, ad))
+            assert_equal(idx.ceil(ad), model_ceil(model, ad))
+
+
+def test_range():
+    model = list(range(0, 400, 5))
+    idx = new_index()
+    for ad in model:
+        idx.add(ad)
+    for ad in range(1, 400, 25):
+        idx.add(ad)
+        model.append(ad)
+    model.sort()
+    assert len(idx.blocks) > 4
+
+    for start in range(0, 410, 7):
+        for end in (start, start + 1, start + 13, start + 100, 1000):
+            assert_equal(idx.range(start, end),
+                         [ad for ad in model if start <= ad < end])
+
+
+def test_init():
+    model = list(range(0, 5000, 3))
+    idx = AddrIndex(reversed(model))
+    assert_equal(list(idx), model)
+    assert_equal(idx.maxes, [blk[-1] for blk in idx.blocks])
+    assert len(idx.blocks) > 1
+    assert_equal(idx.range(1000, 4000), [ad for ad in model if 1000 <= ad < 4000])
+
+
+def test_random():
+    rnd = random.Random(0)
+    idx = new_index()
+    model = set()
+
+    for i in range(5000):
+        ad = rnd.randint(0, 300)
+        if rnd.random() < 0.6:
+            idx.add(ad)
+            model.add(ad)
+        else:
+            idx.remove(ad)
+            model.discard(ad)
+
+        if i % 100 == 0:
+            lst = sorted(model)
+            check(idx, lst)
+            ad = rnd.randint(0, 300)
+            assert_equal(idx.floor(ad), model_floor(lst, ad))
+            assert_equal(idx.ceil(ad), model_ceil(lst, ad))
+            end = ad + rnd.randint(0, 100)
+            assert_equal(idx.range(ad, end),
+                         [x for x in lst if ad <= x < end])
+
+    check(idx, sorted(model))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# to run this script :
+# $ python3 -m nose tests/unit
+#
+# The parallel analysis (lib.parallel) must give the same database as the
+# serial analysis.
+
+import os
+import shutil
+import tempfile
+from io import StringIO
+from contextlib import redirect_stderr
+from nose.tools import assert_equal
+
+from plasma.lib import GlobalContext
+from plasma.lib import parallel
+from plasma.main import batch_analyze
+
+
+BINARIES = [
+    "tests/analyzer/arrays.bin",
+    "tests/analyzer/ifexit.bin",
+    "tests/analyzer/invert_cond.bin",
+    "tests/analyzer/overlap.bin",
+    "tests/analyzer/pusha.bin",
+    "tests/analyzer/regsim.bin",
+    "tests/analyzer/stack.bin",
+    "tests/analyzer/switch.bin",
+    "tests/server.bin",
+    "tests/pendu.bin",
+]
+
+TABLES = [
+    "functions", "func_id", "xrefs", "xrefs_from", "data_sub_xrefs",
+    "immediates", "end_functions", "symbols", "reverse_symbols", "imports",
+    "inverted_cond",
+]
+
+
+# Statistics of each ParallelAnalysis.run
+class Stats():
+    def __init__(self):
+        self.merged = 0
+        self.serial = 0
+
+
+def analyze(filename, jobs, stats=None, signatures=None):
+    tmp = tempfile.mkdtemp()
+    try:
+        # The database is saved next to the binary
+        path = os.path.join(tmp, os.path.basename(filename))
+        shutil.copy(filename, path)
+
+        gctx = GlobalContext()
+        gctx.quiet = True
+        gctx.filename = path
+        gctx.jobs = jobs
+        gctx.signatures = signatures
+        assert gctx.load_file()
+
+        run = parallel.ParallelAnalysis.run
+        def run_stats(self, shards, serial_pass):
+            self.nb_merged = self.nb_serial = 0
+            run(self, shards, serial_pass)
+            if stats is not None:
+                stats.merged += self.nb_merged
+                stats.serial += self.nb_serial
+
+        parallel.ParallelAnalysis.run = run_stats
+        try:
+            with redirect_stderr(StringIO()):
+                batch_analyze(gctx, 0)
+        finally:
+            parallel.ParallelAnalysis.run = run
+    finally:
+        shutil.rmtree(tmp)
+
+    db = gctx.db
+    res = {name: dict(getattr(db, name)) for name in TABLES}
+    res["jmptables"] = {k: vars(v) for k, v in db.jmptables.items()}
+    res["mem"] = dict(db.mem.mm)
+    res["index"] = list(db.mem.index)
+    res["func_id_counter"] = db.func_id_counter
+    return res
+
+
+def check_same(filename, serial, par):
+    for name in serial:
+        assert_equal(serial[name], par[name], "%s: %s" % (filename, name))
+
+
+def check_binary(filename):
+    serial = analyze(filename, 1)
+    stats = Stats()
+    check_same(filename, serial, analyze(filename, 4, stats))
+
+
+def test_parallel():
+    for filename in BINARIES:
+        yield check_binary, filename
+
+
+def test_results_used():
+    stats = Stats()
+    serial = analyze("tests/server.bin", 1)
+    check_same("server.bin", serial, analyze("tests/server.bin", 4, stats))
+    assert stats.merged > 0
+
+
+# All results of the shards are rejected, everything is analyzed again in
+# the main process.
+def test_all_diverged():
+    conflict = parallel.Diverged.conflict
+    parallel.Diverged.conflict = lambda self, res: True
+    try:
+        for filename in ("tests/server.bin", "tests/pendu.bin"):
+            stats = Stats()
+            par = analyze(filename, 4, stats)
+            assert_equal(stats.merged, 0)
+            assert stats.serial > 0
+            check_same(filename, analyze(filename, 1), par)
+    finally:
+        parallel.Diverged.conflict = conflict
+
+
+# One result on two is rejected : merged results and serial analysis are
+# mixed, and each serial analysis makes the database of the shards
+# diverge.
+def test_some_diverged():
+    conflict = parallel.Diverged.conflict
+    count = [0]
+
+    def conflict_half(self, res):
+        count[0] += 1
+        return count[0] % 2 == 0 or conflict(self, res)
+
+    parallel.Diverged.conflict = conflict_half
+    try:
+        for filename in ("tests/server.bin", "tests/pendu.bin"):
+            stats = Stats()
+            par = analyze(filename, 4, stats)
+            assert stats.merged > 0
+            assert stats.serial > 0
+            check_same(filename, analyze(filename, 1), par)
+    finally:
+        parallel.Diverged.conflict = conflict
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# to run this script :
+# $ python3 -m nose tests/unit
+
+import os
+import shutil
+from io import StringIO
+from contextlib import redirect_stderr
+from nose.tools import assert_equal
+
+from plasma.lib import GlobalContext
+from plasma.lib.search import parse_query, QUERY_IMM
+from plasma.main import batch_analyze
+
+from test_database import TmpDir
+
+
+def load(tmp, filename):
+    path = os.path.join(tmp.path, os.path.basename(filename))
+    shutil.copy(filename, path)
+    gctx = GlobalContext()
+    gctx.quiet = True
+    gctx.filename = path
+    gctx.jobs = 1
+    assert gctx.load_file()
+    with redirect_stderr(StringIO()):
+        batch_analyze(gctx, 0)
+    return gctx
+
+
+def search(gctx, text):
+    gctx.search.start(text)
+    gctx.search.thread.join()
+    assert_equal(gctx.search.get_cached(text), gctx.search.hits)
+    return gctx.search.hits
+
+
+def op_str(gctx, ad):
+    inst = gctx.dis.lazy_disasm(ad)
+    return "%s %s" % (inst.mnemonic, inst.op_str)
+
+
+def test_parse_query():
+    assert_equal(parse_query("#-8"), (QUERY_IMM, -8))
+    assert_equal(parse_query("#0x10"), (QUERY_IMM, 16))
+    for bad in ("#", "#x", "!zz", "re:(", "@("):
+        try:
+            parse_query(bad)
+            assert False, bad
+        except ValueError:
+            pass
+
+
+# The sign of the immediate must match
+def test_imm_sign():
+    with TmpDir() as tmp:
+        gctx = load(tmp, "tests/analyzer/stack.bin")
+
+        minus = search(gctx, "#-4")
+        plus = search(gctx, "#4")
+        assert minus
+        assert plus
+
+        for ad in minus:
+            assert "- 4]" in op_str(gctx, ad)
+        for ad in plus:
+            assert "- 4]" not in op_str(gctx, ad)
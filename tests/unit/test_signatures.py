@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# to run this script :
+# $ python3 -m nose tests/unit
+
+import os
+import re
+from nose.tools import assert_equal
+
+from plasma.lib.signatures import (FunctionMatcher, parse_signature,
+        load_signatures)
+from plasma.lib.arch.x86.utils import PROLOGS as X86_PROLOGS
+
+from test_database import TmpDir
+from test_parallel import analyze
+
+
+PROLOGS_BIN = "tests/analyzer/prologs.bin"
+
+
+class Section():
+    def __init__(self, start, data):
+        self.start = start
+        self.data = data
+
+
+def matches(tokens, data):
+    return re.fullmatch(parse_signature(tokens), data, re.DOTALL) is not None
+
+
+def test_parse_signature():
+    assert matches(["55", "48", "89", "e5"], b"\x55\x48\x89\xe5")
+    assert not matches(["55", "48", "89", "e5"], b"\x55\x48\x89\xe0")
+
+    # regex characters are escaped
+    assert matches(["2e", "2a"], b".*")
+    assert not matches(["2e", "2a"], b"ab")
+
+    # ?? matches any byte, newline too
+    assert matches(["55", "??", "89"], b"\x55\x00\x89")
+    assert matches(["55", "??", "89"], b"\x55\n\x89")
+    assert not matches(["55", "??", "89"], b"\x55\x89")
+
+    for bad in (["5"], ["555"], ["zz"], ["?"], ["55", "0x1"]):
+        assert_equal(parse_signature(bad), None)
+
+
+def test_load_signatures():
+    with TmpDir() as tmp:
+        filename = os.path.join(tmp.path, "sigs")
+        with open(filename, "w") as f:
+            f.write("# comment\n"
+                    "\n"
+                    "55 48 89 e5  # push rbp; mov rbp, rsp\n"
+                    "55 zz 89\n"
+                    "f3 0f 1e fa ??\n")
+        assert_equal(load_signatures(filename),
+                     [parse_signature(["55", "48", "89", "e5"]),
+                      parse_signature(["f3", "0f", "1e", "fa", "??"])])
+
+
+def test_matcher_prologs():
+    data = (b"\x90\x55\x48\x89\xe5"     # 0x1001 : 64 bits
+            b"\x55\x89\xe5"             # 0x1005 : 32 bits
+            b"\x55\x48\x89\xe0"         # 0x1008 : not a prolog
+            b"\x55\x89")                # truncated at the end
+    m = FunctionMatcher(X86_PROLOGS, [], False)
+    s = Section(0x1000, data)
+    candidates, hits = m.find(s)
+    assert_equal(candidates, [0x1001, 0x1005])
+    assert_equal(hits, set())
+
+    # the result is kept for each section
+    assert m.find(s) is m.find(Section(0x1000, b""))
+
+
+def test_matcher_reversed():
+    # a prolog on 2 bytes, written as a big endian word
+    m = FunctionMatcher([[b"\xe9\x2d"]], [], True)
+    data = b"\x00\x40\x2d\xe9" + b"\xe9\x2d\x00\x40" + b"\x00\x40\x2d\xe9"
+    candidates, hits = m.find(Section(0x2000, data))
+    assert_equal(candidates, [0x2000, 0x2008])
+
+
+def test_matcher_signatures():
+    sig = parse_signature(["55", "??", "89", "e0"])
+    m = FunctionMatcher(X86_PROLOGS, [sig], False)
+    data = b"\x55\x48\x89\xe0\x55\x48\x89\xe5\x55\x0a\x89\xe0"
+    candidates, hits = m.find(Section(0, data))
+    assert_equal(hits, {0, 8})
+    assert_equal(candidates, [0, 4, 8])
+
+    # without prologs
+    m = FunctionMatcher([], [sig], False)
+    assert_equal(m.find(Section(0, data)), ([0, 8], {0, 8}))
+
+
+# --signatures : the push rbp; mov rax, rsp of prologs.bin is not a
+# prolog, it becomes a function with a signature.
+def test_analyzer_signatures():
+    with TmpDir() as tmp:
+        filename = os.path.join(tmp.path, "sigs")
+        with open(filename, "w") as f:
+            f.write("55 ?? 89 e0\n")
+
+        res = analyze(PROLOGS_BIN, 1)
+        assert 0x40102e not in res["functions"]
+
+        res2 = analyze(PROLOGS_BIN, 1, signatures=filename)
+        assert_equal(set(res2["functions"]),
+                     set(res["functions"]) | {0x40102e})
+
+
+# A bad file is ignored
+def test_analyzer_bad_signatures():
+    with TmpDir() as tmp:
+        filename = os.path.join(tmp.path, "sigs")
+        with open(filename, "w") as f:
+            f.write("55 ?\n")
+
+        res = analyze(PROLOGS_BIN, 1)
+        assert_equal(analyze(PROLOGS_BIN, 1, signatures=filename), res)
+        assert_equal(analyze(PROLOGS_BIN, 1, signatures=filename + "x"), res)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# to run this script :
+# $ python3 -m nose tests/unit
+
+from capstone import Cs, CS_ARCH_X86, CS_MODE_64
+from capstone.x86 import X86_OP_MEM
+from nose.tools import assert_equal
+
+import plasma.lib.arch.x86.utils as utils
+
+
+WRITES = [
+    ("48c70001000000", "mov qword ptr [rax], 1"),
+    ("830001", "add dword ptr [rax], 1"),
+    ("ff00", "inc dword ptr [rax]"),
+    ("0f9500", "setne byte ptr [rax]"),
+    ("8f00", "pop qword ptr [rax]"),
+    ("0fba2801", "bts dword ptr [rax], 1"),
+    ("dd18", "fstp qword ptr [rax]"),
+    ("f30f1100", "movss dword ptr [rax], xmm0"),
+    ("488718", "xchg qword ptr [rax], rbx"),
+]
+
+READS = [
+    ("833801", "cmp dword ptr [rax], 1"),
+    ("f70001000000", "test dword ptr [rax], 1"),
+    ("ff30", "push qword ptr [rax]"),
+    ("ff10", "call qword ptr [rax]"),
+    ("ff20", "jmp qword ptr [rax]"),
+    ("ff28", "ljmp [rax]"),
+    ("ff18", "lcall [rax]"),
+    ("48f730", "div qword ptr [rax]"),
+    ("f738", "idiv dword ptr [rax]"),
+    ("f720", "mul dword ptr [rax]"),
+    ("f728", "imul dword ptr [rax]"),
+    ("dd00", "fld qword ptr [rax]"),
+    ("db00", "fild dword ptr [rax]"),
+    ("dc10", "fcom qword ptr [rax]"),
+    ("d818", "fcomp dword ptr [rax]"),
+    ("dc00", "fadd qword ptr [rax]"),
+    ("d928", "fldcw word ptr [rax]"),
+    ("0fba2001", "bt dword ptr [rax], 1"),
+    ("0f1f00", "nop dword ptr [rax]"),
+    ("0f1808", "prefetcht0 byte ptr [rax]"),
+    ("0fae38", "clflush byte ptr [rax]"),
+    ("0fae10", "ldmxcsr dword ptr [rax]"),
+    ("0f2e00", "ucomiss xmm0, dword ptr [rax]"),
+    ("488b00", "mov rax, qword ptr [rax]"),
+]
+
+
+def is_mem_write(code):
+    md = Cs(CS_ARCH_X86, CS_MODE_64)
+    md.detail = True
+    i = next(md.disasm(bytes.fromhex(code), 0))
+    ops = [op for op in i.operands if op.type == X86_OP_MEM]
+    assert_equal(len(ops), 1)
+    return utils.is_mem_write(i, ops[0])
+
+
+def check(code, text, write):
+    assert_equal(is_mem_write(code), write, text)
+
+
+def test_mem_write():
+    for code, text in WRITES:
+        yield check, code, text, True
+    for code, text in READS:
+        yield check, code, text, False